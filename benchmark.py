@@ -0,0 +1,445 @@
+"""
+Замеры производительности шифрования, хранилищ и отправки сообщений
+
+Записи генерируются по образцу example_data.json с фиксированным seed, поэтому
+повторные запуски работают с одинаковыми данными. Для каждого размера набора
+(по умолчанию 1 000, 10 000 и 100 000 записей) замеряются:
+
+- encrypt_data / decrypt_data по одной записи;
+- для каждого хранилища (json, log, sqlite): пакетная загрузка набора, затем
+  add_record, get_record и get_statistics на базе этого размера.
+
+Отправка сообщений (MaxMessenger.send_message) замеряется на локальном
+HTTP-сервере-заглушке, без обращения к настоящему API.
+
+Результаты сохраняются в JSON; два файла результатов можно сравнить, команда
+сравнения завершается с кодом 1, если какой-либо замер стал медленнее порога.
+
+Запуск из командной строки:
+
+    python benchmark.py run --sizes 1000,10000 --output before.json
+    python benchmark.py run --output after.json --baseline before.json
+    python benchmark.py compare before.json after.json --threshold 0.1
+"""
+
+import gc
+import json
+import os
+import platform
+import random
+import statistics
+import tempfile
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+from database_manager import open_database
+from encryption_module import PersonalDataEncryption
+from max_messenger import MaxMessenger
+
+
+RESULTS_FORMAT = "benchmark-results"
+RESULTS_VERSION = 1
+DEFAULT_SIZES = (1000, 10000, 100000)
+BACKENDS = ("json", "log", "sqlite")
+DEFAULT_SEED = 2024
+DEFAULT_THRESHOLD = 0.10
+
+# Количество операций на замер; у JSON-хранилища каждое добавление
+# переписывает файл целиком, поэтому для него замер add_record короче
+GET_SAMPLES = 1000
+ADD_SAMPLES = 200
+ADD_SAMPLES_REWRITING = 20
+STATISTICS_SAMPLES = 50
+DEFAULT_MESSAGES = 500
+LOAD_BATCH_SIZE = 5000
+
+_EXAMPLE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "example_data.json")
+
+_SURNAMES = ("Иванов", "Петров", "Сидоров", "Смирнов", "Кузнецов", "Попов", "Васильев",
+             "Соколов", "Михайлов", "Новиков", "Федоров", "Морозов", "Волков", "Алексеев")
+_NAMES = ("Иван", "Петр", "Алексей", "Дмитрий", "Сергей", "Андрей", "Михаил", "Никита")
+_PATRONYMICS = ("Иванович", "Петрович", "Сергеевич", "Андреевич", "Михайлович", "Олегович")
+_STREETS = ("Примерная", "Школьная", "Садовая", "Центральная", "Лесная", "Парковая")
+_MEDICAL = ("", "", "", "Аллергия на пыльцу", "Астма", "Непереносимость лактозы")
+
+
+def generate_records(count: int, seed: int = DEFAULT_SEED,
+                     template_file: str = _EXAMPLE_FILE) -> Iterator[Dict[str, str]]:
+    """
+    Синтетические записи учеников по образцу example_data.json
+    
+    Args:
+        count: Количество записей
+        seed: Начальное значение генератора (одинаковый seed - одинаковые записи)
+        template_file: Файл-образец; поля, которых нет в генераторе, копируются
+        
+    Yields:
+        Словари с персональными данными
+    """
+    with open(template_file, "r", encoding="utf-8") as f:
+        template = json.load(f)
+    rng = random.Random(seed)
+    
+    for number in range(count):
+        record = dict(template)
+        record.update({
+            "фамилия": rng.choice(_SURNAMES),
+            "имя": rng.choice(_NAMES),
+            "отчество": rng.choice(_PATRONYMICS),
+            "дата_рождения": f"{rng.randint(1, 28):02d}.{rng.randint(1, 12):02d}.{rng.randint(2007, 2018)}",
+            "класс": f"{rng.randint(1, 11)}{rng.choice('АБВГ')}",
+            "адрес": f"г. Москва, ул. {rng.choice(_STREETS)}, д. {rng.randint(1, 150)}",
+            "телефон": f"+7 (9{rng.randint(0, 99):02d}) {rng.randint(0, 999):03d}-"
+                       f"{rng.randint(0, 99):02d}-{rng.randint(0, 99):02d}",
+            "email": f"student{number}@example.com",
+            "медицинская_информация": rng.choice(_MEDICAL)
+        })
+        yield record
+
+
+def _summary(durations: List[float]) -> Dict:
+    """Сводка по длительностям отдельных операций (в секундах)"""
+    ordered = sorted(durations)
+    total = sum(ordered)
+    return {
+        "ops": len(ordered),
+        "seconds": total,
+        "ops_per_second": len(ordered) / total if total > 0 else 0.0,
+        "mean_us": statistics.fmean(ordered) * 1e6,
+        "p50_us": ordered[len(ordered) // 2] * 1e6,
+        "p95_us": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1e6,
+        "max_us": ordered[-1] * 1e6
+    }
+
+
+def measure(operation: Callable, arguments: Iterable) -> Dict:
+    """
+    Замер операции по одному вызову на каждый аргумент
+    
+    Сборщик мусора на время замера отключается, чтобы его паузы
+    не попадали в случайные операции.
+    
+    Args:
+        operation: Функция одного аргумента
+        arguments: Аргументы вызовов
+        
+    Returns:
+        Словарь: ops, seconds, ops_per_second, mean_us, p50_us, p95_us, max_us
+    """
+    durations = []
+    gc.collect()
+    gc.disable()
+    try:
+        for argument in arguments:
+            started = time.perf_counter()
+            operation(argument)
+            durations.append(time.perf_counter() - started)
+    finally:
+        gc.enable()
+    return _summary(durations)
+
+
+def measure_total(operation: Callable, ops: int) -> Dict:
+    """
+    Замер пакетной операции: один вызов на ops элементов
+    
+    Returns:
+        Словарь в формате measure (средние значения на один элемент)
+    """
+    gc.collect()
+    started = time.perf_counter()
+    operation()
+    elapsed = time.perf_counter() - started
+    per_op = elapsed / ops if ops else 0.0
+    return {"ops": ops, "seconds": elapsed, "ops_per_second": ops / elapsed if elapsed > 0 else 0.0,
+            "mean_us": per_op * 1e6, "p50_us": per_op * 1e6, "p95_us": per_op * 1e6, "max_us": per_op * 1e6}
+
+
+def bench_crypto(encryption: PersonalDataEncryption, records: List[Dict]) -> Dict[str, Dict]:
+    """Шифрование и дешифрование по одной записи"""
+    encrypted = []
+    results = {"encrypt_data": measure(lambda data: encrypted.append(encryption.encrypt_data(data)), records)}
+    results["decrypt_data"] = measure(encryption.decrypt_data, encrypted)
+    return results
+
+
+def bench_storage(backend: str, directory: str, encryption: PersonalDataEncryption,
+                  records: List[Dict], seed: int = DEFAULT_SEED) -> Dict[str, Dict]:
+    """
+    Замеры хранилища на базе из len(records) записей
+    
+    Args:
+        backend: "json", "log" или "sqlite"
+        directory: Каталог для файлов базы
+        encryption: Шифратор
+        records: Записи набора
+        seed: Начальное значение для выбора случайных записей
+    """
+    extensions = {"json": ".json", "log": ".log", "sqlite": ".db"}
+    path = os.path.join(directory, f"benchmark_{backend}_{len(records)}{extensions[backend]}")
+    rng = random.Random(seed)
+    results = {}
+    
+    with open_database(path, backend) as db:
+        encrypted = list(encryption.encrypt_many(records, binary=db.supports_binary))
+        rows = [(blob, "ученик", f"{data['фамилия']} {data['имя']}", encryption.blind_indexes(data))
+                for blob, data in zip(encrypted, records)]
+        
+        def load():
+            if db.commit_rewrites_file:
+                db.add_records(iter(rows))
+                return
+            for start in range(0, len(rows), LOAD_BATCH_SIZE):
+                db.add_records(rows[start:start + LOAD_BATCH_SIZE])
+        
+        results["add_records"] = measure_total(load, len(rows))
+        del encrypted, rows
+        
+        ids = [meta["id"] for meta in db.get_records_metadata()]
+        results["get_record"] = measure(db.get_record, [rng.choice(ids) for _ in range(GET_SAMPLES)])
+        results["get_statistics"] = measure(lambda _: db.get_statistics(), range(STATISTICS_SAMPLES))
+        
+        samples = ADD_SAMPLES_REWRITING if db.commit_rewrites_file else ADD_SAMPLES
+        extra = [(encryption.encrypt_record(data) if db.supports_binary else encryption.encrypt_data(data),
+                  encryption.blind_indexes(data))
+                 for data in generate_records(samples, seed + 1)]
+        results["add_record"] = measure(lambda row: db.add_record(row[0], "ученик", "", row[1]), extra)
+    return results
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    """Заглушка API мессенджера: принимает любое сообщение"""
+    
+    # Соединение остается открытым, как у настоящего API: сессия его переиспользует
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    delay = 0.0
+    
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.delay:
+            time.sleep(self.delay)
+        body = b'{"ok": true}'
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def log_message(self, format, *args):
+        pass
+
+
+class StubServer:
+    """Локальный HTTP-сервер для замеров отправки сообщений"""
+    
+    def __init__(self, delay: float = 0.0):
+        """
+        Args:
+            delay: Задержка ответа в секундах (имитация сети)
+        """
+        handler = type("StubHandler", (_StubHandler,), {"delay": delay})
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+    
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+    
+    def __enter__(self):
+        self._thread.start()
+        return self
+    
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def bench_messenger(directory: str, messages: int = DEFAULT_MESSAGES, delay: float = 0.0) -> Dict[str, Dict]:
+    """Отправка сообщений через MaxMessenger на сервер-заглушку"""
+    with StubServer(delay) as server:
+        messenger = MaxMessenger(api_key="benchmark", chat_id="benchmark", api_base_url=server.url,
+                                 outbox_file=os.path.join(directory, "benchmark_outbox.jsonl"))
+        try:
+            texts = [f"Код подтверждения: {number:06d}" for number in range(messages)]
+            
+            def send(text):
+                success, error = messenger.send_message(text)
+                if not success:
+                    raise RuntimeError(error)
+            
+            return {"send_message": measure(send, texts)}
+        finally:
+            messenger.close()
+
+
+def _environment() -> Dict:
+    import cryptography
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "cryptography": cryptography.__version__
+    }
+
+
+def run_benchmarks(sizes: Iterable[int] = DEFAULT_SIZES, backends: Iterable[str] = BACKENDS,
+                   messages: int = DEFAULT_MESSAGES, stub_delay: float = 0.0, seed: int = DEFAULT_SEED,
+                   progress: Optional[Callable[[str], None]] = None) -> Dict:
+    """
+    Выполнение всех замеров
+    
+    Args:
+        sizes: Размеры наборов записей
+        backends: Хранилища
+        messages: Количество сообщений в замере мессенджера (0 - не замерять)
+        stub_delay: Задержка ответа сервера-заглушки в секундах
+        seed: Начальное значение генератора записей
+        progress: Функция progress(имя замера), вызывается перед замером
+        
+    Returns:
+        Результаты: format, version, created_at, environment, parameters и
+        results - словарь {"группа.замер[размер]": сводка measure}
+    """
+    sizes, backends = list(sizes), list(backends)
+    encryption = PersonalDataEncryption("benchmark-password")
+    results = {}
+    
+    def record(prefix: str, size: Optional[int], measured: Dict[str, Dict]):
+        for name, summary in measured.items():
+            results[f"{prefix}.{name}" + (f"[{size}]" if size else "")] = summary
+    
+    with tempfile.TemporaryDirectory(prefix="benchmark_") as directory:
+        for size in sizes:
+            records = list(generate_records(size, seed))
+            if progress:
+                progress(f"crypto [{size}]")
+            record("crypto", size, bench_crypto(encryption, records))
+            for backend in backends:
+                if progress:
+                    progress(f"storage.{backend} [{size}]")
+                record(f"storage.{backend}", size, bench_storage(backend, directory, encryption, records, seed))
+        if messages:
+            if progress:
+                progress("messenger")
+            record("messenger", None, bench_messenger(directory, messages, stub_delay))
+    
+    return {
+        "format": RESULTS_FORMAT,
+        "version": RESULTS_VERSION,
+        "created_at": datetime.now().isoformat(),
+        "environment": _environment(),
+        "parameters": {"sizes": list(sizes), "backends": list(backends), "messages": messages,
+                       "stub_delay": stub_delay, "seed": seed},
+        "results": results
+    }
+
+
+def load_results(path: str) -> Dict:
+    """
+    Чтение файла результатов
+    
+    Raises:
+        ValueError: Файл не является файлом результатов замеров
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    if data.get("format") != RESULTS_FORMAT:
+        raise ValueError(f"{path}: не файл результатов замеров")
+    return data
+
+
+def compare_results(baseline: Dict, current: Dict, threshold: float = DEFAULT_THRESHOLD) -> List[Dict]:
+    """
+    Сравнение двух запусков по среднему времени операции
+    
+    Args:
+        baseline: Результаты предыдущего запуска
+        current: Результаты нового запуска
+        threshold: Допустимое замедление (0.1 - на 10%)
+        
+    Returns:
+        Список словарей name, baseline_us, current_us, change, regression
+        для замеров, которые есть в обоих запусках
+    """
+    rows = []
+    for name, summary in current["results"].items():
+        previous = baseline["results"].get(name)
+        if previous is None:
+            continue
+        change = summary["mean_us"] / previous["mean_us"] - 1 if previous["mean_us"] else 0.0
+        rows.append({"name": name, "baseline_us": previous["mean_us"], "current_us": summary["mean_us"],
+                     "change": change, "regression": change > threshold})
+    return rows
+
+
+def _print_results(data: Dict):
+    print(f"{'замер':<40} {'операций':>9} {'среднее, мкс':>13} {'p95, мкс':>11} {'оп/с':>11}")
+    for name, summary in data["results"].items():
+        print(f"{name:<40} {summary['ops']:>9} {summary['mean_us']:>13.1f} "
+              f"{summary['p95_us']:>11.1f} {summary['ops_per_second']:>11.0f}")
+
+
+def _print_comparison(rows: List[Dict]) -> bool:
+    """Таблица сравнения; True, если есть замедления сверх порога"""
+    print(f"{'замер':<40} {'было, мкс':>11} {'стало, мкс':>11} {'изменение':>10}")
+    for row in rows:
+        mark = "  ЗАМЕДЛЕНИЕ" if row["regression"] else ""
+        print(f"{row['name']:<40} {row['baseline_us']:>11.1f} {row['current_us']:>11.1f} "
+              f"{row['change']:>+10.1%}{mark}")
+    return any(row["regression"] for row in rows)
+
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+    
+    parser = argparse.ArgumentParser(description="Замеры производительности")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    run_parser = subparsers.add_parser("run", help="Выполнение замеров")
+    run_parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)),
+                            help="Размеры наборов записей через запятую")
+    run_parser.add_argument("--backends", default=",".join(BACKENDS), help="Хранилища через запятую")
+    run_parser.add_argument("--messages", type=int, default=DEFAULT_MESSAGES,
+                            help="Сообщений в замере мессенджера (0 - не замерять)")
+    run_parser.add_argument("--stub-delay", type=float, default=0.0,
+                            help="Задержка ответа сервера-заглушки, мс")
+    run_parser.add_argument("--seed", type=int, default=DEFAULT_SEED, help="Начальное значение генератора")
+    run_parser.add_argument("--output", help="Файл результатов (по умолчанию benchmark_<время>.json)")
+    run_parser.add_argument("--baseline", help="Сравнить с результатами предыдущего запуска")
+    run_parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                            help="Допустимое замедление при сравнении (0.1 - 10%%)")
+    compare_parser = subparsers.add_parser("compare", help="Сравнение двух запусков")
+    compare_parser.add_argument("baseline", help="Результаты предыдущего запуска")
+    compare_parser.add_argument("current", help="Результаты нового запуска")
+    compare_parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                                help="Допустимое замедление (0.1 - 10%%)")
+    args = parser.parse_args()
+    
+    if args.command == "compare":
+        regressed = _print_comparison(compare_results(load_results(args.baseline),
+                                                      load_results(args.current), args.threshold))
+        sys.exit(1 if regressed else 0)
+    
+    backends = [name.strip() for name in args.backends.split(",") if name.strip()]
+    unknown = set(backends) - set(BACKENDS)
+    if unknown:
+        parser.error(f"Неизвестные хранилища: {', '.join(sorted(unknown))}")
+    baseline = load_results(args.baseline) if args.baseline else None
+    
+    data = run_benchmarks([int(size) for size in args.sizes.split(",") if size.strip()], backends,
+                          args.messages, args.stub_delay / 1000, args.seed,
+                          progress=lambda name: print(f"замер: {name}", file=sys.stderr))
+    output = args.output or f"benchmark_{datetime.now():%Y%m%d_%H%M%S}.json"
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    
+    _print_results(data)
+    print(f"Результаты сохранены: {output}")
+    if baseline is not None:
+        print()
+        sys.exit(1 if _print_comparison(compare_results(baseline, data, args.threshold)) else 0)
@@ -0,0 +1,274 @@
+"""
+Потоковый выборочный экспорт записей в зашифрованный архив
+
+Записи отбираются по типу, интервалу дат создания и точным значениям
+зашифрованных полей (через слепые индексы, без расшифровки базы) и читаются
+из базы по одной. При экспорте для получателя с другим паролем записи
+перешифровываются его ключом в пуле исполнителей (ParallelCipher).
+
+Архив - файл потокового формата PDSF (см. PersonalDataEncryption.encrypt_file),
+зашифрованный ключом получателя. Внутри - строки JSON: по одной на запись
+({"record": {...}}) и последней строкой опись ({"manifest": {...}}) с
+количеством записей, отбором и контрольной суммой SHA-256 строк записей.
+Ни архив, ни выборка целиком в памяти не держатся.
+
+Запуск из командной строки:
+
+    python bulk_export.py encrypted_database.json class7a.pdsf --where класс=7А --reencrypt
+"""
+
+import hashlib
+import json
+import os
+import time
+from datetime import datetime
+from typing import Callable, Dict, Iterator, List, Optional
+
+from encryption_module import record_to_text
+from parallel_cipher import ParallelCipher
+
+
+ARCHIVE_FORMAT = "personal-data-export"
+ARCHIVE_VERSION = 1
+
+
+def _as_text(encrypted_data) -> str:
+    return encrypted_data if isinstance(encrypted_data, str) else record_to_text(bytes(encrypted_data))
+
+
+class BulkExporter:
+    """Отбор записей и запись их в зашифрованный архив"""
+    
+    def __init__(self, db_manager, encryption, max_workers: Optional[int] = None):
+        """
+        Args:
+            db_manager: Хранилище (любая реализация BaseDatabaseManager)
+            encryption: Экземпляр PersonalDataEncryption с ключом базы
+            max_workers: Количество потоков перешифрования (по умолчанию - число ядер)
+        """
+        self.db_manager = db_manager
+        self.encryption = encryption
+        self.max_workers = max_workers
+    
+    def select(self, record_type: Optional[str] = None, created_from: Optional[str] = None,
+               created_to: Optional[str] = None, where: Optional[Dict[str, str]] = None) -> List[int]:
+        """
+        ID записей, подходящих под все условия отбора
+        
+        Args:
+            record_type: Тип записей
+            created_from: Начало интервала дат создания (ГГГГ-ММ-ДД)
+            created_to: Конец интервала, не включается
+            where: Точные значения зашифрованных полей {поле: значение}
+                (поиск по слепым индексам)
+                
+        Returns:
+            ID по возрастанию
+        """
+        selections = []
+        if record_type:
+            selections.append(self.db_manager.find_by_type(record_type))
+        if created_from or created_to:
+            selections.append(self.db_manager.range_by_created_at(created_from or None, created_to or None))
+        for field, value in (where or {}).items():
+            # Во время смены пароля часть записей проиндексирована прежним ключом
+            selections.append([record for token in self.encryption.blind_index_variants(field, value)
+                               for record in self.db_manager.find_by_blind_index(field, token)])
+        
+        if not selections:
+            return [record["id"] for record in self.db_manager.get_records_metadata()]
+        
+        ids = None
+        # Пересечение начинается с самой маленькой выборки
+        for records in sorted(selections, key=len):
+            found = {record["id"] for record in records}
+            ids = found if ids is None else ids & found
+            if not ids:
+                return []
+        return sorted(ids)
+    
+    def _records(self, ids: List[int], check_cancelled: Optional[Callable]) -> Iterator[Dict]:
+        """Записи по одной; удаленные после отбора пропускаются"""
+        for record_id in ids:
+            if check_cancelled:
+                check_cancelled()
+            record = self.db_manager.get_record(record_id)
+            if record is not None:
+                record["encrypted_data"] = _as_text(record["encrypted_data"])
+                yield record
+    
+    def run(self, path: str, record_type: Optional[str] = None, created_from: Optional[str] = None,
+            created_to: Optional[str] = None, where: Optional[Dict[str, str]] = None,
+            target=None, progress: Optional[Callable] = None,
+            check_cancelled: Optional[Callable] = None) -> Dict:
+        """
+        Экспорт отобранных записей в архив
+        
+        Архив пишется во временный файл и заменяет path только после записи
+        описи, поэтому прерванный экспорт не оставляет неполного архива.
+        
+        Args:
+            path: Путь к архиву
+            record_type, created_from, created_to, where: Условия отбора (см. select)
+            target: Шифратор получателя (PersonalDataEncryption с другим паролем);
+                если указан, записи перешифровываются его ключом. Иначе записи
+                остаются зашифрованными ключом базы
+            progress: Функция progress(fraction, stats)
+            check_cancelled: Функция, прерывающая экспорт исключением
+            
+        Returns:
+            Опись архива: records, by_type, filters, reencrypted, sha256,
+            created_at, а также seconds и records_per_second
+        """
+        started = time.perf_counter()
+        ids = self.select(record_type, created_from, created_to, where)
+        archive_encryption = target or self.encryption
+        digest = hashlib.sha256()
+        by_type: Dict[str, int] = {}
+        exported = 0
+        
+        records = self._records(ids, check_cancelled)
+        cipher = None
+        if target is not None:
+            cipher = ParallelCipher(self.encryption, self.max_workers)
+            records = cipher.map_reencrypt(records, target)
+        
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                with archive_encryption.open_file_writer(f) as writer:
+                    for record in records:
+                        line = json.dumps({"record": record}, ensure_ascii=False).encode("utf-8") + b"\n"
+                        digest.update(line)
+                        writer.write(line)
+                        exported += 1
+                        by_type[record["type"]] = by_type.get(record["type"], 0) + 1
+                        if progress and exported % 100 == 0:
+                            progress(exported / len(ids), {"exported": exported, "selected": len(ids)})
+                    
+                    manifest = {
+                        "format": ARCHIVE_FORMAT,
+                        "version": ARCHIVE_VERSION,
+                        "created_at": datetime.now().isoformat(),
+                        "records": exported,
+                        "by_type": by_type,
+                        "filters": {"type": record_type, "created_from": created_from,
+                                    "created_to": created_to, "where": dict(where or {})},
+                        "reencrypted": target is not None,
+                        "sha256": digest.hexdigest()
+                    }
+                    writer.write(json.dumps({"manifest": manifest}, ensure_ascii=False).encode("utf-8") + b"\n")
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        finally:
+            if cipher is not None:
+                cipher.close()
+        
+        elapsed = time.perf_counter() - started
+        if progress:
+            progress(1.0, {"exported": exported, "selected": len(ids)})
+        return dict(manifest, seconds=elapsed, records_per_second=exported / elapsed if elapsed > 0 else 0.0)
+
+
+def iter_archive(path: str, encryption) -> Iterator[Dict]:
+    """
+    Потоковое чтение архива экспорта с проверкой описи
+    
+    Args:
+        path: Путь к архиву
+        encryption: Шифратор с ключом, которым зашифрован архив
+        
+    Yields:
+        Записи архива; после последней записи проверяется опись
+        
+    Returns:
+        Опись архива (значение StopIteration)
+        
+    Raises:
+        ValueError: Архив поврежден, обрезан или не совпадает с описью
+    """
+    digest = hashlib.sha256()
+    count = 0
+    manifest = None
+    pending = b""
+    
+    for chunk in encryption.iter_decrypted_file(path):
+        lines = (pending + chunk).split(b"\n")
+        pending = lines.pop()
+        for line in lines:
+            if manifest is not None:
+                raise ValueError("Данные после описи архива")
+            item = json.loads(line)
+            if "manifest" in item:
+                manifest = item["manifest"]
+                continue
+            digest.update(line + b"\n")
+            count += 1
+            yield item["record"]
+    
+    if pending or manifest is None:
+        raise ValueError("В архиве нет описи")
+    if manifest.get("format") != ARCHIVE_FORMAT:
+        raise ValueError("Файл не является архивом экспорта")
+    if manifest["records"] != count or manifest["sha256"] != digest.hexdigest():
+        raise ValueError("Содержимое архива не совпадает с описью")
+    return manifest
+
+
+def verify_archive(path: str, encryption) -> Dict:
+    """
+    Проверка архива без сохранения записей
+    
+    Returns:
+        Опись архива
+    """
+    records = iter_archive(path, encryption)
+    while True:
+        try:
+            next(records)
+        except StopIteration as stop:
+            return stop.value
+
+
+if __name__ == "__main__":
+    import argparse
+    import getpass
+    from database_manager import open_database
+    from encryption_module import PersonalDataEncryption
+    from key_rotation import Keyring
+    
+    parser = argparse.ArgumentParser(description="Выборочный экспорт записей в зашифрованный архив")
+    parser.add_argument("database", help="Путь к базе данных")
+    parser.add_argument("archive", help="Путь к архиву")
+    parser.add_argument("--type", dest="record_type", help="Тип записей")
+    parser.add_argument("--from", dest="created_from", help="Созданные не раньше даты (ГГГГ-ММ-ДД)")
+    parser.add_argument("--to", dest="created_to", help="Созданные раньше даты (ГГГГ-ММ-ДД)")
+    parser.add_argument("--where", action="append", default=[], metavar="ПОЛЕ=ЗНАЧЕНИЕ",
+                        help="Точное значение зашифрованного поля (можно повторять)")
+    parser.add_argument("--reencrypt", action="store_true", help="Перешифровать паролем получателя")
+    parser.add_argument("--backend", choices=("json", "log", "sqlite"), help="Тип хранилища")
+    parser.add_argument("--workers", type=int, help="Потоков перешифрования")
+    args = parser.parse_args()
+    
+    where = {}
+    for condition in args.where:
+        field, separator, value = condition.partition("=")
+        if not separator:
+            parser.error(f"Условие должно иметь вид ПОЛЕ=ЗНАЧЕНИЕ: {condition}")
+        where[field.strip()] = value.strip()
+    
+    encryption = Keyring.for_database(args.database).unlock(getpass.getpass("Пароль базы: "))
+    target = PersonalDataEncryption(getpass.getpass("Пароль получателя: ")) if args.reencrypt else None
+    
+    with open_database(args.database, args.backend) as manager:
+        exporter = BulkExporter(manager, encryption, args.workers)
+        result = exporter.run(args.archive, args.record_type, args.created_from, args.created_to, where, target)
+    
+    print(f"Экспортировано записей: {result['records']} за {result['seconds']:.1f} с")
+    for record_type, count in result["by_type"].items():
+        print(f"  {record_type}: {count}")
@@ -0,0 +1,406 @@
+"""
+Потоковый импорт списков учеников, учителей и родителей
+
+Файлы CSV, JSONL и JSON читаются по одной строке (элементу), поэтому
+расход памяти не зависит от размера файла. Строки проверяются
+DataValidator, шифруются параллельно (ParallelCipher) и записываются
+в базу пакетами (add_records). Строки с ошибками записываются в файл
+отклоненных строк (JSONL: номер строки, ошибка и исходные данные).
+
+Запуск из командной строки:
+
+    python bulk_import.py roster.csv encrypted_database.json --type ученик
+"""
+
+import csv
+import json
+import os
+import time
+from collections import deque
+from itertools import islice
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from encryption_module import DataValidator
+from parallel_cipher import ParallelCipher
+
+
+# Столбец с типом записи; если его нет, используется тип по умолчанию
+TYPE_FIELD = "тип"
+DEFAULT_BATCH_SIZE = 500
+FORMATS = ("csv", "jsonl", "json")
+
+_JSON_CHUNK_SIZE = 64 * 1024
+# Наибольший размер элемента массива JSON; больший элемент отклоняется и пропускается
+_JSON_MAX_ELEMENT_SIZE = 1024 * 1024
+
+
+def detect_format(path: str) -> str:
+    """Формат файла по расширению: csv, jsonl или json"""
+    extension = os.path.splitext(path)[1].lower().lstrip(".")
+    if extension in ("jsonl", "ndjson"):
+        return "jsonl"
+    if extension in FORMATS:
+        return extension
+    raise ValueError(f"Неизвестный формат файла: {path}")
+
+
+def _counted_lines(f, consumed: List[int]) -> Iterator[str]:
+    for line in f:
+        consumed[0] += len(line.encode("utf-8"))
+        yield line
+
+
+def _iter_csv(f, consumed: List[int]) -> Iterator[Tuple[int, Dict]]:
+    sample = f.read(4096)
+    f.seek(0)
+    try:
+        dialect = csv.Sniffer().sniff(sample, delimiters=",;\t")
+    except csv.Error:
+        dialect = csv.excel
+    reader = csv.DictReader(_counted_lines(f, consumed), dialect=dialect)
+    for row in reader:
+        # Лишние значения строки DictReader собирает под ключом None
+        yield reader.line_num, {key: value for key, value in row.items() if key is not None}
+
+
+def _iter_jsonl(f, consumed: List[int]) -> Iterator[Tuple[int, object]]:
+    for line_number, line in enumerate(_counted_lines(f, consumed), 1):
+        if not line.strip():
+            continue
+        try:
+            yield line_number, json.loads(line)
+        except ValueError as e:
+            yield line_number, ValueError(f"Ошибка JSON: {e}")
+
+
+def _find_element_end(text: str, scan: List) -> int:
+    """
+    Конец элемента массива JSON: запятая или "]" вне строк и вложенных скобок
+    
+    Args:
+        text: Буфер
+        scan: [позиция, глубина, внутри строки, после "\\"]; поиск продолжается
+            с места, где остановился предыдущий вызов
+        
+    Returns:
+        Индекс разделителя или -1, если элемент не закончился в буфере
+    """
+    position, depth, in_string, escaped = scan
+    for index in range(position, len(text)):
+        char = text[index]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char in "[{":
+            depth += 1
+        elif char in "]}":
+            if depth == 0:
+                return index
+            depth -= 1
+        elif char == "," and depth == 0:
+            return index
+    scan[:] = [len(text), depth, in_string, escaped]
+    return -1
+
+
+def _iter_json(f, consumed: List[int]) -> Iterator[Tuple[int, object]]:
+    """
+    Элементы массива JSON без чтения всего файла; одиночный объект - одна строка
+    
+    Элемент с ошибкой возвращается как ValueError, и разбор продолжается со
+    следующего элемента. Элемент больше _JSON_MAX_ELEMENT_SIZE отклоняется и
+    пропускается без загрузки в память.
+    """
+    decoder = json.JSONDecoder()
+    buffer = f.read(_JSON_CHUNK_SIZE)
+    consumed[0] += len(buffer) - len(buffer.lstrip())
+    buffer = buffer.lstrip()
+    if buffer.startswith("{"):
+        buffer += f.read()
+        consumed[0] += len(buffer.encode("utf-8"))
+        yield 1, json.loads(buffer)
+        return
+    if not buffer.startswith("["):
+        raise ValueError("Файл JSON должен содержать массив объектов или объект")
+    
+    position = 1
+    # Позиция буфера, до которой байты учтены в consumed
+    counted = 1
+    consumed[0] += 1
+    number = 0
+    eof = False
+    # Поиск конца элемента, который не удалось разобрать сразу (см. _find_element_end)
+    scan = None
+    oversized = False
+    while True:
+        if scan is None:
+            while position < len(buffer) and buffer[position] in " \t\r\n,":
+                position += 1
+            if position < len(buffer) and buffer[position] == "]":
+                return
+            if position < len(buffer):
+                try:
+                    item, end = decoder.raw_decode(buffer, position)
+                except ValueError:
+                    # Элемент не дочитан или содержит ошибку
+                    scan = [position, 0, False, False]
+                else:
+                    consumed[0] += len(buffer[counted:end].encode("utf-8"))
+                    number += 1
+                    position = counted = end
+                    yield number, item
+                    continue
+        
+        if scan is not None:
+            end = _find_element_end(buffer, scan)
+            if end >= 0:
+                if not oversized:
+                    # Элемент дочитан: повторный разбор отличает ошибку от обрыва буфера
+                    try:
+                        item = decoder.raw_decode(buffer, position)[0]
+                    except ValueError as e:
+                        # Позиция ошибки отсчитывается от буфера, а не от начала файла
+                        item = ValueError(f"Ошибка JSON: {getattr(e, 'msg', e)}")
+                    number += 1
+                    consumed[0] += len(buffer[counted:end].encode("utf-8"))
+                    yield number, item
+                else:
+                    consumed[0] += len(buffer[counted:end].encode("utf-8"))
+                position = counted = end
+                scan = None
+                oversized = False
+                continue
+            if not oversized and len(buffer) - position > _JSON_MAX_ELEMENT_SIZE:
+                number += 1
+                yield number, ValueError(f"Элемент массива JSON больше {_JSON_MAX_ELEMENT_SIZE} символов")
+                oversized = True
+            if oversized:
+                # Просмотренная часть элемента отбрасывается
+                position = len(buffer)
+        
+        if eof:
+            raise ValueError("Незавершенный массив JSON")
+        chunk = f.read(_JSON_CHUNK_SIZE)
+        eof = not chunk
+        # Разобранная часть буфера отбрасывается
+        if scan is not None:
+            scan[0] -= position
+        consumed[0] += len(buffer[counted:position].encode("utf-8"))
+        buffer = buffer[position:] + chunk
+        position = counted = 0
+
+
+def read_rows(path: str, file_format: Optional[str] = None, progress: Optional[Callable] = None
+              ) -> Iterator[Tuple[int, object]]:
+    """
+    Потоковое чтение строк файла
+    
+    Args:
+        path: Путь к файлу
+        file_format: "csv", "jsonl" или "json" (по умолчанию - по расширению)
+        progress: Функция progress(fraction) - доля разобранной части файла;
+            вызывается после обработки каждой строки
+        
+    Yields:
+        Кортежи (номер строки или элемента, словарь данных); вместо словаря
+        может быть исключение, если строку не удалось разобрать
+    """
+    file_format = file_format or detect_format(path)
+    readers = {"csv": _iter_csv, "jsonl": _iter_jsonl, "json": _iter_json}
+    if file_format not in readers:
+        raise ValueError(f"Неизвестный формат файла: {file_format}")
+    
+    size = os.path.getsize(path) or 1
+    # Байты, разобранные до текущей строки (позиция файла опережает разбор
+    # на размер буфера чтения)
+    consumed = [0]
+    with open(path, "r", encoding="utf-8-sig", newline="") as f:
+        for row in readers[file_format](f, consumed):
+            yield row
+            # Строка уже обработана вызывающим кодом
+            if progress:
+                progress(min(consumed[0] / size, 1.0))
+
+
+def normalize_row(row) -> Dict[str, str]:
+    """Значения строки в виде строк без пробелов по краям; пустые поля отбрасываются"""
+    if not isinstance(row, dict):
+        raise ValueError("Строка не является объектом")
+    return {str(key).strip(): str(value).strip() for key, value in row.items()
+            if key is not None and value is not None and str(value).strip()}
+
+
+def record_description(data: Dict) -> str:
+    """Описание записи в базе: ФИО, как при шифровании из формы"""
+    return f"{data.get('фамилия', '')} {data.get('имя', '')} {data.get('отчество', '')}".strip()
+
+
+class BulkImporter:
+    """Импорт файла в базу: проверка, параллельное шифрование и пакетная запись"""
+    
+    def __init__(self, db_manager, encryption, batch_size: int = DEFAULT_BATCH_SIZE,
+                 max_workers: Optional[int] = None):
+        """
+        Args:
+            db_manager: Хранилище (любая реализация BaseDatabaseManager)
+            encryption: Экземпляр PersonalDataEncryption с ключом базы
+            batch_size: Количество записей в одной транзакции записи. Для
+                JSON-файла, который переписывается при каждой записи, весь
+                импорт записывается одним потоковым проходом
+            max_workers: Количество потоков шифрования (по умолчанию - число ядер)
+        """
+        self.db_manager = db_manager
+        self.encryption = encryption
+        self.batch_size = batch_size
+        self.max_workers = max_workers
+    
+    def _validated(self, rows, default_type: Optional[str], reject, stats: Dict, pending: deque):
+        """
+        Проверенные данные для шифрования
+        
+        Тип, описание и слепые индексы записи складываются в pending в том же
+        порядке: ParallelCipher возвращает зашифрованные записи по порядку.
+        """
+        for row_number, row in rows:
+            stats["read"] += 1
+            try:
+                if isinstance(row, Exception):
+                    raise row
+                data = normalize_row(row)
+                record_type = data.pop(TYPE_FIELD, None) or default_type
+                if not record_type:
+                    raise ValueError("Не указан тип записи")
+                is_valid, message = DataValidator.validate_record(record_type, data)
+                if not is_valid:
+                    raise ValueError(message)
+            except ValueError as e:
+                reject(row_number, str(e), row)
+                continue
+            
+            pending.append((record_type, record_description(data), self.encryption.blind_indexes(data)))
+            yield data
+    
+    def run(self, path: str, record_type: Optional[str] = None, file_format: Optional[str] = None,
+            reject_path: Optional[str] = None, progress: Optional[Callable] = None,
+            check_cancelled: Optional[Callable] = None) -> Dict:
+        """
+        Импорт файла
+        
+        Args:
+            path: Путь к файлу CSV, JSONL или JSON
+            record_type: Тип записей, если в файле нет столбца "тип"
+            file_format: Формат файла (по умолчанию - по расширению)
+            reject_path: Файл отклоненных строк (по умолчанию "<файл>.rejected.jsonl" рядом с исходным);
+                создается, только если есть отклоненные строки
+            progress: Функция progress(fraction, stats), вызывается по мере чтения
+            check_cancelled: Функция, прерывающая импорт исключением
+                (например, BackgroundTask.check_cancelled). Уже записанные
+                пакеты остаются в базе
+                
+        Returns:
+            Словарь: read, imported, rejected, seconds, records_per_second, reject_file
+        """
+        if reject_path is None:
+            reject_path = path + ".rejected.jsonl"
+        stats = {"read": 0, "imported": 0, "rejected": 0, "seconds": 0.0,
+                 "records_per_second": 0.0, "reject_file": None}
+        started = time.perf_counter()
+        reject_file = None
+        
+        def reject(row_number: int, error: str, row):
+            nonlocal reject_file
+            if reject_file is None:
+                reject_file = open(reject_path, "w", encoding="utf-8")
+                stats["reject_file"] = reject_path
+            data = row if isinstance(row, dict) else None
+            reject_file.write(json.dumps({"row": row_number, "error": error, "data": data},
+                                         ensure_ascii=False) + "\n")
+            stats["rejected"] += 1
+        
+        def on_read(fraction: float):
+            if check_cancelled:
+                check_cancelled()
+            if progress and stats["read"] % 100 == 0:
+                elapsed = time.perf_counter() - started
+                stats["seconds"] = elapsed
+                stats["records_per_second"] = stats["imported"] / elapsed if elapsed > 0 else 0.0
+                progress(fraction, dict(stats))
+        
+        pending = deque()
+        rows = read_rows(path, file_format, on_read)
+        # Для JSON-файла пакет не ограничивается: каждая запись переписывает файл целиком
+        batch_size = None if self.db_manager.commit_rewrites_file else self.batch_size
+        
+        try:
+            with ParallelCipher(self.encryption, self.max_workers) as cipher:
+                encrypted = cipher.map_encrypt(self._validated(rows, record_type, reject, stats, pending),
+                                               binary=self.db_manager.supports_binary)
+                
+                def records():
+                    for encrypted_data in encrypted:
+                        stats["imported"] += 1
+                        yield (encrypted_data,) + pending.popleft()
+                
+                stream = records()
+                if batch_size is None:
+                    # Записи сериализуются в файл по мере шифрования и не копятся в памяти
+                    self.db_manager.add_records(stream)
+                else:
+                    # Пакет шифруется до начала транзакции, чтобы не держать блокировку базы
+                    batch = list(islice(stream, batch_size))
+                    while batch:
+                        self.db_manager.add_records(batch)
+                        batch = list(islice(stream, batch_size))
+        finally:
+            if reject_file is not None:
+                reject_file.close()
+        
+        elapsed = time.perf_counter() - started
+        stats["seconds"] = elapsed
+        stats["records_per_second"] = stats["imported"] / elapsed if elapsed > 0 else 0.0
+        if progress:
+            progress(1.0, dict(stats))
+        return stats
+
+
+if __name__ == "__main__":
+    import argparse
+    import getpass
+    from database_manager import open_database
+    from key_rotation import Keyring
+    
+    parser = argparse.ArgumentParser(description="Импорт списков из CSV, JSONL или JSON в базу")
+    parser.add_argument("input", help="Файл со списком")
+    parser.add_argument("database", nargs="?", default="encrypted_database.json", help="Путь к базе данных")
+    parser.add_argument("--type", dest="record_type",
+                        help="Тип записей (ученик, учитель, родитель), если в файле нет столбца \"тип\"")
+    parser.add_argument("--format", choices=FORMATS, help="Формат файла (по умолчанию - по расширению)")
+    parser.add_argument("--backend", choices=("json", "log", "sqlite"), help="Тип хранилища")
+    parser.add_argument("--reject", help="Файл отклоненных строк")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="Записей в одной транзакции")
+    parser.add_argument("--workers", type=int, help="Потоков шифрования")
+    args = parser.parse_args()
+    
+    # Ключ базы берется из файла ключей: после смены пароля он не совпадает
+    # с ключом, выведенным из пароля с солью по умолчанию
+    encryption = Keyring.for_database(args.database).unlock(getpass.getpass("Пароль: "))
+    
+    def show_progress(fraction, stats):
+        print(f"\r{fraction:.0%}  прочитано: {stats['read']}  отклонено: {stats['rejected']}  "
+              f"{stats['records_per_second']:.0f} записей/с", end="", flush=True)
+    
+    with open_database(args.database, args.backend) as manager:
+        importer = BulkImporter(manager, encryption, args.batch_size, args.workers)
+        result = importer.run(args.input, args.record_type, args.format, args.reject, show_progress)
+    
+    print()
+    print(f"Импортировано: {result['imported']} за {result['seconds']:.1f} с "
+          f"({result['records_per_second']:.0f} записей/с)")
+    if result["rejected"]:
+        print(f"Отклонено: {result['rejected']} (см. {result['reject_file']})")
@@ -0,0 +1,406 @@
+"""
+Консольный интерфейс без графической оболочки
+
+Для заданий по расписанию (cron, планировщик Windows) и конвейеров: модуль
+не импортирует tkinter. Ключ выводится из пароля один раз за запуск
+(PBKDF2) и используется всеми потоками шифрования. Результаты выводятся
+построчно в формате JSONL: каждая строка - объект с полем "event"
+(record, rejected, invalid, progress, summary, stats, error).
+
+Пароль берется из переменной окружения PERSONAL_DATA_PASSWORD, из файла
+(--password-file) или запрашивается с терминала.
+
+Примеры:
+
+    python -m cli stats
+    python -m cli --db encrypted_database.db import roster.csv --type ученик
+    echo '{"фамилия": "Иванов", ...}' | python -m cli encrypt --type ученик
+    python -m cli decrypt 1 2 3
+    python -m cli export class7a.pdsf --where класс=7А
+    python -m cli verify
+"""
+
+import argparse
+import getpass
+import json
+import os
+import sys
+from collections import deque
+from itertools import islice
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from bulk_export import BulkExporter, verify_archive
+from bulk_import import FORMATS, TYPE_FIELD, BulkImporter, normalize_row, read_rows, record_description
+from database_manager import open_database
+from encryption_module import DataValidator, PersonalDataEncryption
+from key_rotation import Keyring, KeyRotationJob, checkpoint_path
+from metrics import metrics
+from parallel_cipher import ParallelCipher
+
+
+PASSWORD_ENV = "PERSONAL_DATA_PASSWORD"
+NEW_PASSWORD_ENV = "PERSONAL_DATA_NEW_PASSWORD"
+RECIPIENT_PASSWORD_ENV = "PERSONAL_DATA_RECIPIENT_PASSWORD"
+DEFAULT_DATABASE = "encrypted_database.json"
+BATCH_SIZE = 500
+
+
+def emit(event: str, **fields):
+    """Вывод одного события строкой JSON"""
+    line = json.dumps(dict(event=event, **fields), ensure_ascii=False, default=str)
+    sys.stdout.write(line + "\n")
+    sys.stdout.flush()
+
+
+class CliContext:
+    """Общие для команды хранилище и шифратор, создаваемые по требованию"""
+    
+    def __init__(self, args: argparse.Namespace):
+        self.args = args
+        self._db = None
+        self._encryption: Optional[PersonalDataEncryption] = None
+    
+    @property
+    def db(self):
+        """Открытое хранилище"""
+        if self._db is None:
+            self._db = open_database(self.args.db, self.args.backend)
+        return self._db
+    
+    @property
+    def encryption(self) -> PersonalDataEncryption:
+        """Шифратор базы: ключ выводится один раз за запуск"""
+        if self._encryption is None:
+            password = read_password(self.args.password_env, self.args.password_file, "Пароль: ")
+            self._encryption = Keyring.for_database(self.args.db).unlock(password)
+        return self._encryption
+    
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+
+
+def read_password(env: str, password_file: Optional[str] = None, prompt: str = "Пароль: ") -> str:
+    """
+    Пароль из переменной окружения, файла или с терминала
+    
+    Raises:
+        ValueError: Пароль не задан, а терминала нет
+    """
+    if os.environ.get(env):
+        return os.environ[env]
+    if password_file:
+        with open(password_file, "r", encoding="utf-8") as f:
+            return f.readline().rstrip("\r\n")
+    if sys.stdin.isatty():
+        return getpass.getpass(prompt)
+    raise ValueError(f"Пароль не задан: укажите переменную {env} или --password-file")
+
+
+def _progress_printer(every: float = 0.05):
+    """Событие progress не чаще, чем раз в every доли работы"""
+    last = [-1.0]
+    
+    def report(fraction: float, **fields):
+        if fraction >= 1.0 or fraction - last[0] >= every:
+            last[0] = fraction
+            emit("progress", fraction=round(fraction, 4), **fields)
+    return report
+
+
+def _stdin_rows() -> Iterator[Tuple[int, object]]:
+    for line_number, line in enumerate(sys.stdin, 1):
+        if not line.strip():
+            continue
+        try:
+            yield line_number, json.loads(line)
+        except ValueError as e:
+            yield line_number, ValueError(f"Ошибка JSON: {e}")
+
+
+def cmd_encrypt(ctx: CliContext, args) -> int:
+    """Шифрование объектов JSON (по строке на объект) и сохранение в базу"""
+    encryption = ctx.encryption
+    db = ctx.db
+    rows = _stdin_rows() if args.input == "-" else read_rows(args.input, args.format)
+    pending = deque()
+    rejected = 0
+    
+    def validated():
+        nonlocal rejected
+        for line_number, row in rows:
+            try:
+                if isinstance(row, Exception):
+                    raise row
+                data = normalize_row(row)
+                record_type = data.pop(TYPE_FIELD, None) or args.type
+                if not record_type:
+                    raise ValueError("Не указан тип записи")
+                is_valid, message = DataValidator.validate_record(record_type, data)
+                if not is_valid:
+                    raise ValueError(message)
+            except ValueError as e:
+                rejected += 1
+                emit("rejected", line=line_number, error=str(e))
+                continue
+            pending.append((line_number, record_type, record_description(data), encryption.blind_indexes(data)))
+            yield data
+    
+    stored = deque()
+    
+    def records(encrypted):
+        for encrypted_data in encrypted:
+            line_number, record_type, description, blind_index = pending.popleft()
+            stored.append((line_number, record_type))
+            yield encrypted_data, record_type, description, blind_index
+    
+    count = 0
+    
+    def store(batch):
+        nonlocal count
+        for record_id in db.add_records(batch):
+            line_number, record_type = stored.popleft()
+            emit("record", line=line_number, id=record_id, type=record_type)
+            count += 1
+    
+    with ParallelCipher(encryption, args.workers) as cipher:
+        stream = records(cipher.map_encrypt(validated(), binary=db.supports_binary))
+        if db.commit_rewrites_file:
+            # JSON-файл переписывается при каждой записи: записи сериализуются в файл
+            # по мере шифрования одним проходом, ID выводятся после записи файла
+            store(stream)
+        else:
+            batch = list(islice(stream, BATCH_SIZE))
+            while batch:
+                store(batch)
+                batch = list(islice(stream, BATCH_SIZE))
+    
+    emit("summary", command="encrypt", stored=count, rejected=rejected)
+    return 1 if rejected else 0
+
+
+def _selected_ids(ctx: CliContext, args) -> List[int]:
+    if args.ids:
+        return args.ids
+    if args.type:
+        return [record["id"] for record in ctx.db.find_by_type(args.type)]
+    return [record["id"] for record in ctx.db.get_records_metadata()]
+
+
+def _stored_records(ctx: CliContext, ids: List[int], missing: List[int]) -> Iterator[Dict]:
+    for record_id in ids:
+        record = ctx.db.get_record(record_id)
+        if record is None:
+            missing.append(record_id)
+        else:
+            yield record
+
+
+def _decrypted(ctx: CliContext, args, ids: List[int], missing: List[int]) -> Iterator[Tuple[Dict, object]]:
+    """
+    Пары (запись, расшифрованные данные или ValueError) в порядке ids
+    
+    ID, которых нет в базе, добавляются в missing.
+    """
+    records = deque()
+    
+    def encrypted_data():
+        for record in _stored_records(ctx, ids, missing):
+            records.append(record)
+            yield record["encrypted_data"]
+    
+    with ParallelCipher(ctx.encryption, args.workers) as cipher:
+        for data in cipher.map_decrypt(encrypted_data(), return_errors=True):
+            yield records.popleft(), data
+
+
+def cmd_decrypt(ctx: CliContext, args) -> int:
+    """Вывод расшифрованных записей"""
+    decrypted = failed = 0
+    missing: List[int] = []
+    for record, data in _decrypted(ctx, args, _selected_ids(ctx, args), missing):
+        if isinstance(data, ValueError):
+            failed += 1
+            emit("error", id=record["id"], error=str(data))
+            continue
+        decrypted += 1
+        emit("record", id=record["id"], type=record["type"], description=record.get("description", ""),
+             created_at=record.get("created_at"), data=data)
+    for record_id in missing:
+        emit("error", id=record_id, error="Запись не найдена")
+    failed += len(missing)
+    emit("summary", command="decrypt", decrypted=decrypted, failed=failed)
+    return 1 if failed else 0
+
+
+def cmd_import(ctx: CliContext, args) -> int:
+    """Импорт списка из CSV, JSONL или JSON"""
+    progress = _progress_printer()
+    importer = BulkImporter(ctx.db, ctx.encryption, args.batch_size, args.workers)
+    result = importer.run(args.input, args.type, args.format, args.reject,
+                          progress=lambda fraction, stats: progress(fraction, read=stats["read"],
+                                                                    rejected=stats["rejected"]))
+    emit("summary", command="import", **result)
+    return 1 if result["rejected"] else 0
+
+
+def cmd_export(ctx: CliContext, args) -> int:
+    """Выборочный экспорт в зашифрованный архив"""
+    where = {}
+    for condition in args.where:
+        field, separator, value = condition.partition("=")
+        if not separator:
+            raise ValueError(f"Условие должно иметь вид ПОЛЕ=ЗНАЧЕНИЕ: {condition}")
+        where[field.strip()] = value.strip()
+    
+    encryption = ctx.encryption
+    target = None
+    if args.reencrypt:
+        target = PersonalDataEncryption(read_password(args.recipient_password_env, None, "Пароль получателя: "))
+    
+    progress = _progress_printer()
+    exporter = BulkExporter(ctx.db, encryption, args.workers)
+    manifest = exporter.run(args.archive, args.type, args.created_from, args.created_to, where, target,
+                            progress=lambda fraction, stats: progress(fraction, exported=stats["exported"]))
+    emit("summary", command="export", archive=args.archive, **manifest)
+    return 0
+
+
+def cmd_stats(ctx: CliContext, args) -> int:
+    """Статистика базы (пароль не нужен)"""
+    statistics = ctx.db.rebuild_statistics() if args.rebuild else ctx.db.get_statistics()
+    emit("stats", **statistics)
+    return 0
+
+
+def cmd_verify(ctx: CliContext, args) -> int:
+    """Проверка, что все записи базы (или архив экспорта) расшифровываются"""
+    if args.archive:
+        manifest = verify_archive(args.archive, ctx.encryption)
+        emit("summary", command="verify", archive=args.archive, valid=True, **manifest)
+        return 0
+    
+    checked = invalid = 0
+    missing: List[int] = []
+    progress = _progress_printer()
+    ids = _selected_ids(ctx, args)
+    for record, data in _decrypted(ctx, args, ids, missing):
+        checked += 1
+        if isinstance(data, ValueError):
+            invalid += 1
+            emit("invalid", id=record["id"], error=str(data))
+        progress(checked / len(ids), checked=checked)
+    for record_id in missing:
+        emit("invalid", id=record_id, error="Запись не найдена")
+    invalid += len(missing)
+    emit("summary", command="verify", checked=checked, invalid=invalid, valid=not invalid)
+    return 1 if invalid else 0
+
+
+def cmd_rotate(ctx: CliContext, args) -> int:
+    """Смена пароля и перешифрование базы (или продолжение прерванного)"""
+    keyring = Keyring.for_database(args.db)
+    if args.resume:
+        encryption = ctx.encryption
+    else:
+        if os.path.exists(checkpoint_path(args.db)):
+            raise ValueError("Смена пароля не завершена, запустите с --resume")
+        new_password = read_password(args.new_password_env, None, "Новый пароль: ")
+        encryption = keyring.begin_rotation(ctx.encryption, new_password)
+    
+    progress = _progress_printer()
+    job = KeyRotationJob(ctx.db, args.db, encryption, args.batch_size, args.workers)
+    result = job.run(progress=lambda fraction, stats: progress(fraction, **stats))
+    emit("summary", command="rotate", **result)
+    return 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="python -m cli",
+                                     description="Шифрование персональных данных без графического интерфейса")
+    parser.add_argument("--db", default=DEFAULT_DATABASE, help="Путь к базе данных")
+    parser.add_argument("--backend", choices=("json", "log", "sqlite"), help="Тип хранилища")
+    parser.add_argument("--password-env", default=PASSWORD_ENV, help="Переменная окружения с паролем")
+    parser.add_argument("--password-file", help="Файл с паролем (первая строка)")
+    parser.add_argument("--workers", type=int, help="Потоков шифрования")
+    parser.add_argument("--metrics", metavar="ФАЙЛ", help="Сохранить метрики (.prom или .json) по завершении")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    
+    encrypt_parser = subparsers.add_parser("encrypt", help="Шифрование объектов JSON и сохранение в базу")
+    encrypt_parser.add_argument("--input", default="-", help="Файл (по умолчанию - JSONL со стандартного ввода)")
+    encrypt_parser.add_argument("--format", choices=FORMATS, help="Формат файла")
+    encrypt_parser.add_argument("--type", help="Тип записей, если в данных нет поля \"тип\"")
+    encrypt_parser.set_defaults(handler=cmd_encrypt)
+    
+    decrypt_parser = subparsers.add_parser("decrypt", help="Вывод расшифрованных записей")
+    decrypt_parser.add_argument("ids", nargs="*", type=int, help="ID записей (по умолчанию - все)")
+    decrypt_parser.add_argument("--type", help="Только записи типа")
+    decrypt_parser.set_defaults(handler=cmd_decrypt)
+    
+    import_parser = subparsers.add_parser("import", help="Импорт списка из CSV, JSONL или JSON")
+    import_parser.add_argument("input", help="Файл со списком")
+    import_parser.add_argument("--type", help="Тип записей, если в файле нет столбца \"тип\"")
+    import_parser.add_argument("--format", choices=FORMATS, help="Формат файла")
+    import_parser.add_argument("--reject", help="Файл отклоненных строк")
+    import_parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="Записей в одной транзакции")
+    import_parser.set_defaults(handler=cmd_import)
+    
+    export_parser = subparsers.add_parser("export", help="Выборочный экспорт в зашифрованный архив")
+    export_parser.add_argument("archive", help="Путь к архиву")
+    export_parser.add_argument("--type", help="Тип записей")
+    export_parser.add_argument("--from", dest="created_from", help="Созданные не раньше даты (ГГГГ-ММ-ДД)")
+    export_parser.add_argument("--to", dest="created_to", help="Созданные раньше даты (ГГГГ-ММ-ДД)")
+    export_parser.add_argument("--where", action="append", default=[], metavar="ПОЛЕ=ЗНАЧЕНИЕ",
+                               help="Точное значение зашифрованного поля (можно повторять)")
+    export_parser.add_argument("--reencrypt", action="store_true", help="Перешифровать паролем получателя")
+    export_parser.add_argument("--recipient-password-env", default=RECIPIENT_PASSWORD_ENV,
+                               help="Переменная окружения с паролем получателя")
+    export_parser.set_defaults(handler=cmd_export)
+    
+    stats_parser = subparsers.add_parser("stats", help="Статистика базы")
+    stats_parser.add_argument("--rebuild", action="store_true", help="Пересчитать счетчики по записям")
+    stats_parser.set_defaults(handler=cmd_stats)
+    
+    verify_parser = subparsers.add_parser("verify", help="Проверка расшифровки записей или архива")
+    verify_parser.add_argument("ids", nargs="*", type=int, help="ID записей (по умолчанию - все)")
+    verify_parser.add_argument("--type", help="Только записи типа")
+    verify_parser.add_argument("--archive", help="Проверить архив экспорта вместо базы")
+    verify_parser.set_defaults(handler=cmd_verify)
+    
+    rotate_parser = subparsers.add_parser("rotate", help="Смена пароля и перешифрование базы")
+    rotate_parser.add_argument("--resume", action="store_true", help="Продолжить прерванное перешифрование")
+    rotate_parser.add_argument("--new-password-env", default=NEW_PASSWORD_ENV,
+                               help="Переменная окружения с новым паролем")
+    rotate_parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="Записей в одном пакете")
+    rotate_parser.set_defaults(handler=cmd_rotate)
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """
+    Выполнение команды
+    
+    Returns:
+        Код завершения: 0 - успех, 1 - ошибка или отклоненные записи
+    """
+    args = build_parser().parse_args(argv)
+    if args.metrics:
+        metrics.enable()
+    
+    ctx = CliContext(args)
+    try:
+        return args.handler(ctx, args)
+    except (ValueError, OSError) as e:
+        emit("error", command=args.command, error=str(e))
+        return 1
+    except KeyboardInterrupt:
+        emit("error", command=args.command, error="Прервано")
+        return 130
+    finally:
+        ctx.close()
+        if args.metrics:
+            metrics.write(args.metrics)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -4,13 +4,389 @@
 
 import json
 import os
+from abc import ABC, abstractmethod
 from datetime import datetime
-from typing import List, Dict, Optional
+from typing import Iterable, List, Dict, Optional, Sequence, Tuple, Union
 
+from encryption_module import BLIND_INDEX_FIELDS, is_legacy_record, record_to_text
+from file_lock import FileLock, replace_atomically
+from json_reader import JsonDatabaseReader, read_trailer
+from metrics import metrics
+from record_cache import DecryptedRecordCache
+from record_index import MetadataIndex
+from record_stats import RecordStatistics
 
-class DatabaseManager:
+
+class ConcurrentModificationError(Exception):
+    """Запись изменена или удалена другим пользователем после чтения"""
+
+
+class BaseDatabaseManager(ABC):
+    """
+    Общий интерфейс хранилищ зашифрованных записей
+    
+    Все реализации (JSON-файл, журнальное хранилище и др.) предоставляют
+    одинаковый публичный API, поэтому их можно подставлять друг вместо друга.
+    Реализация, в которой нет абстрактного метода, не создается (TypeError).
+    """
+    
+    # Может ли хранилище держать зашифрованные данные как байты без кодирования
+    supports_binary = False
+    
+    # Переписывает ли каждая запись все хранилище (тогда пакеты лучше не дробить)
+    commit_rewrites_file = False
+    
+    # Необязательный кэш расшифрованных записей (см. get_decrypted_record)
+    record_cache: Optional[DecryptedRecordCache] = None
+    
+    # Пары (прежний ID, новый ID) записей, перенумерованных при переносе из
+    # JSON-базы (см. renumber_duplicate_ids)
+    renumbered_ids: Sequence[Tuple[int, int]] = ()
+    
+    @abstractmethod
+    def add_record(self, encrypted_data: Union[str, bytes], record_type: str, description: str = "",
+                   blind_index: Optional[Dict[str, str]] = None) -> int:
+        raise NotImplementedError
+    
+    @abstractmethod
+    def peek_next_id(self) -> int:
+        """
+        ID, который получит следующая добавленная запись
+        
+        Значение справочное (например, для текста уведомления): при
+        одновременной записи из нескольких потоков или процессов ID
+        добавленной записи нужно брать из результата add_record.
+        """
+        raise NotImplementedError
+    
+    def add_records(self, records: Iterable[Sequence]) -> List[int]:
+        """
+        Пакетное добавление записей
+        
+        Args:
+            records: Итерируемый набор кортежей
+                (encrypted_data, record_type[, description[, blind_index]]); читается потоково
+                
+        Returns:
+            Список ID добавленных записей
+        """
+        return [self.add_record(*record) for record in records]
+    
+    @abstractmethod
+    def get_all_records(self) -> List[Dict]:
+        raise NotImplementedError
+    
+    @abstractmethod
+    def get_record(self, record_id: int) -> Optional[Dict]:
+        raise NotImplementedError
+    
+    def count_records(self) -> int:
+        """Количество записей в базе"""
+        return len(self.metadata_index())
+    
+    def get_records_metadata(self, offset: int = 0, limit: Optional[int] = None) -> List[Dict]:
+        """
+        Метаданные записей по возрастанию ID без зашифрованных данных
+        
+        Позволяет показывать большую базу страницами, не загружая ее целиком.
+        
+        Args:
+            offset: Сколько записей пропустить
+            limit: Максимальное количество записей (None - все)
+            
+        Returns:
+            Список метаданных записей
+        """
+        return self._query("page", offset, limit)
+    
+    @abstractmethod
+    def delete_record(self, record_id: int) -> bool:
+        raise NotImplementedError
+    
+    @abstractmethod
+    def update_record(self, record_id: int, encrypted_data: Union[str, bytes], description: str = "",
+                      blind_index: Optional[Dict[str, str]] = None, expected_version: Optional[int] = None):
+        raise NotImplementedError
+    
+    def update_records(self, updates: Iterable[Sequence]) -> int:
+        """
+        Пакетное обновление записей
+        
+        Args:
+            updates: Итерируемый набор кортежей
+                (record_id, encrypted_data, description[, blind_index[, expected_version]]).
+                Запись, версия которой не совпадает с expected_version, пропускается
+                
+        Returns:
+            Количество обновленных записей
+        """
+        count = 0
+        for record_id, encrypted_data, description, *rest in updates:
+            if self.get_record(record_id):
+                try:
+                    self.update_record(record_id, encrypted_data, description, *rest)
+                except ConcurrentModificationError:
+                    continue
+                count += 1
+        return count
+    
+    def _invalidate_cached(self, record_id: int):
+        """Удаление записи из кэша расшифрованных записей при ее изменении"""
+        if self.record_cache is not None:
+            self.record_cache.invalidate(record_id)
+    
+    def get_metadata(self, record_id: int) -> Optional[Dict]:
+        """
+        Метаданные записи без чтения зашифрованных данных
+        
+        Args:
+            record_id: ID записи
+            
+        Returns:
+            Метаданные записи или None, если запись не найдена
+        """
+        records = self._query("lookup", record_id)
+        return records[0] if records else None
+    
+    def get_decrypted_record(self, record_id: int, encryption) -> Optional[Dict]:
+        """
+        Получение расшифрованной записи с использованием кэша
+        
+        Если к хранилищу подключен record_cache и версия записи (updated_at)
+        не изменилась, запись берется из кэша без чтения базы и дешифрования.
+        
+        Args:
+            record_id: ID записи
+            encryption: Экземпляр PersonalDataEncryption
+            
+        Returns:
+            Словарь с персональными данными или None, если запись не найдена
+        """
+        cache = self.record_cache
+        if cache is not None:
+            meta = self.get_metadata(record_id)
+            if meta is None:
+                return None
+            data = cache.get(record_id, meta["updated_at"], encryption.key_fingerprint)
+            metrics.inc("record_cache_requests_total", result="miss" if data is None else "hit")
+            if data is not None:
+                return data
+        
+        record = self.get_record(record_id)
+        if record is None:
+            return None
+        data = encryption.decrypt_data(record["encrypted_data"])
+        if cache is not None:
+            cache.put(record_id, record["updated_at"], data, encryption.key_fingerprint)
+        return data
+    
+    @staticmethod
+    def _optional_fields(rest: Sequence) -> Tuple[str, Optional[Dict[str, str]]]:
+        """Необязательные элементы кортежа новой записи: описание и слепые индексы"""
+        return (rest[0] if len(rest) > 0 else "",
+                rest[1] if len(rest) > 1 else None)
+    
+    @staticmethod
+    def _check_version(record_id: int, current: Optional[int], expected_version: Optional[int]):
+        """
+        Оптимистическая проверка версии записи перед изменением
+        
+        Args:
+            record_id: ID записи
+            current: Текущая версия записи в базе (None - запись не найдена)
+            expected_version: Версия, прочитанная пользователем (None - без проверки)
+            
+        Raises:
+            ConcurrentModificationError: Запись изменена или удалена после чтения
+        """
+        if expected_version is None:
+            return
+        if current is None:
+            raise ConcurrentModificationError(f"Запись {record_id} удалена другим пользователем")
+        if current != expected_version:
+            raise ConcurrentModificationError(
+                f"Запись {record_id} изменена другим пользователем "
+                f"(версия {current}, ожидалась {expected_version})"
+            )
+    
+    @staticmethod
+    def _apply_update(record: Dict, encrypted_data: Union[str, bytes], description: str,
+                      blind_index: Optional[Dict[str, str]]):
+        """
+        Изменение полей записи при обновлении
+        
+        Args:
+            blind_index: Новые слепые индексы; None - оставить прежние, {} - удалить
+        """
+        record["encrypted_data"] = encrypted_data
+        record["description"] = description
+        record["updated_at"] = datetime.now().isoformat()
+        # Записи, созданные до появления версий, считаются версией 1
+        record["version"] = record.get("version", 1) + 1
+        if blind_index:
+            record["blind_index"] = dict(blind_index)
+        elif blind_index is not None:
+            record.pop("blind_index", None)
+    
+    def upgrade_record_format(self, encryption) -> int:
+        """
+        Перешифрование записей старого формата в компактный формат
+        
+        Args:
+            encryption: Экземпляр PersonalDataEncryption с ключом базы
+            
+        Returns:
+            Количество обновленных записей
+        """
+        updates = (
+            (record["id"],
+             encryption.encrypt_record(encryption.decrypt_data(record["encrypted_data"])),
+             record.get("description", ""))
+            for record in self.get_all_records()
+            if is_legacy_record(record["encrypted_data"])
+        )
+        return self.update_records(updates)
+    
+    def build_blind_indexes(self, encryption, fields: Iterable[str] = BLIND_INDEX_FIELDS) -> int:
+        """
+        Построение слепых индексов для записей, у которых их еще нет
+        
+        Args:
+            encryption: Экземпляр PersonalDataEncryption с ключом базы
+            fields: Индексируемые поля
+            
+        Returns:
+            Количество обновленных записей
+        """
+        fields = tuple(fields)
+        updates = (
+            (record["id"], record["encrypted_data"], record.get("description", ""),
+             encryption.blind_indexes(encryption.decrypt_data(record["encrypted_data"]), fields))
+            for record in self.get_all_records()
+            if not record.get("blind_index")
+        )
+        return self.update_records(updates)
+    
+    def metadata_index(self) -> MetadataIndex:
+        """
+        Индекс по метаданным записей
+        
+        Базовая реализация строит индекс полным чтением базы; хранилища
+        переопределяют метод и поддерживают индекс инкрементально.
+        """
+        return MetadataIndex(self.get_all_records())
+    
+    def _query(self, method: str, *args) -> List[Dict]:
+        """Выполнение запроса к индексу и выборка метаданных найденных записей"""
+        index = self.metadata_index()
+        return index.records(getattr(index, method)(*args))
+    
+    def find_by_type(self, record_type: str) -> List[Dict]:
+        """
+        Поиск записей по типу
+        
+        Args:
+            record_type: Тип записи (ученик, учитель, родитель)
+            
+        Returns:
+            Метаданные записей (без зашифрованных данных) по возрастанию ID
+        """
+        return self._query("find_by_type", record_type)
+    
+    def search_description(self, query: str, substring: bool = False) -> List[Dict]:
+        """
+        Поиск записей по словам описания
+        
+        Args:
+            query: Поисковый запрос; каждое слово должно совпасть с началом слова описания
+            substring: Искать слова запроса в любой части слов описания
+            
+        Returns:
+            Метаданные записей (без зашифрованных данных) по возрастанию ID
+        """
+        return self._query("search_description", query, substring)
+    
+    def find_by_blind_index(self, field: str, token: str) -> List[Dict]:
+        """
+        Поиск записей по точному значению зашифрованного поля
+        
+        Args:
+            field: Имя поля (например, "фамилия")
+            token: Слепой индекс значения (PersonalDataEncryption.blind_index)
+            
+        Returns:
+            Метаданные записей (без зашифрованных данных) по возрастанию ID
+        """
+        return self._query("find_by_blind_index", field, token)
+    
+    def range_by_created_at(self, start: Union[str, datetime, None] = None,
+                            end: Union[str, datetime, None] = None) -> List[Dict]:
+        """
+        Поиск записей по дате создания
+        
+        Args:
+            start: Начало интервала, включительно (None - без ограничения)
+            end: Конец интервала, не включается (None - без ограничения)
+            
+        Returns:
+            Метаданные записей (без зашифрованных данных) по возрастанию даты
+        """
+        return self._query("range_by_created_at", start, end)
+    
+    def range_by_updated_at(self, start: Union[str, datetime, None] = None,
+                            end: Union[str, datetime, None] = None) -> List[Dict]:
+        """
+        Поиск записей по дате изменения
+        
+        Args:
+            start: Начало интервала, включительно (None - без ограничения)
+            end: Конец интервала, не включается (None - без ограничения)
+            
+        Returns:
+            Метаданные записей (без зашифрованных данных) по возрастанию даты
+        """
+        return self._query("range_by_updated_at", start, end)
+    
+    def get_statistics(self) -> Dict:
+        """
+        Получение статистики по базе данных
+        
+        Счетчики поддерживаются при каждом изменении базы, поэтому
+        записи при подсчете не просматриваются.
+        
+        Returns:
+            Словарь: total_records, by_type, by_class (по слепому индексу
+            класса), created_per_day (ГГГГ-ММ-ДД)
+        """
+        return self.metadata_index().statistics.as_dict()
+    
+    def rebuild_statistics(self) -> Dict:
+        """
+        Пересчет счетчиков статистики по всем записям (восстановление)
+        
+        Returns:
+            Новая статистика
+        """
+        index = self.metadata_index()
+        index.rebuild_statistics()
+        return index.statistics.as_dict()
+    
+    def close(self):
+        """Освобождение ресурсов хранилища"""
+        pass
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class DatabaseManager(BaseDatabaseManager):
     """Класс для управления базой данных зашифрованных данных"""
     
+    commit_rewrites_file = True
+    
     def __init__(self, db_file: str = "encrypted_database.json"):
         """
         Инициализация менеджера базы данных
@@ -19,15 +395,178 @@ class DatabaseManager:
             db_file: Путь к файлу базы данных
         """
         self.db_file = db_file
+        # Чтение-изменение-запись выполняется под блокировкой файла "<база>.lock",
+        # общей для потоков и процессов. Чтение идет без блокировки: файл базы
+        # заменяется атомарно, и читатель не ждет окончания долгой записи
+        self._file_lock = FileLock(db_file + ".lock")
         self._ensure_database_exists()
+        # Индекс метаданных и состояние файла, по которому он построен
+        self._index: Optional[MetadataIndex] = None
+        self._index_signature = None
+        self._read_signature = None
+        # Снимок файла с ленивым разбором записей (для постраничного чтения)
+        self._reader: Optional[JsonDatabaseReader] = None
+        # (версия файла, статистика из его конца)
+        self._statistics: Optional[Tuple] = None
+    
+    @staticmethod
+    def _as_text(encrypted_data: Union[str, bytes]) -> str:
+        """JSON не хранит байты: двоичная запись кодируется один раз в base64"""
+        if isinstance(encrypted_data, str):
+            return encrypted_data
+        return record_to_text(encrypted_data)
+    
+    def _signature(self):
+        """Признак версии файла: меняется при любой перезаписи базы"""
+        stat = os.stat(self.db_file)
+        return stat.st_ino, stat.st_size, stat.st_mtime_ns
+    
+    def _load(self) -> Tuple[Dict, Tuple]:
+        """Чтение базы вместе с версией именно того файла, который прочитан"""
+        with open(self.db_file, 'r', encoding='utf-8') as f:
+            stat = os.fstat(f.fileno())
+            return json.load(f), (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+    
+    def _read(self) -> Dict:
+        """Чтение базы с запоминанием версии прочитанного файла"""
+        db, self._read_signature = self._load()
+        return db
+    
+    @staticmethod
+    def _max_id(db: Dict) -> int:
+        """
+        Наибольший выданный ID
+        
+        Хранится в базе ("last_id") и не уменьшается при удалении записей,
+        поэтому ID удаленных записей повторно не выдаются. Для баз без
+        "last_id" берется наибольший ID среди записей.
+        """
+        return max([db.get("last_id", 0)] + [record["id"] for record in db["records"]])
+    
+    def reader(self) -> JsonDatabaseReader:
+        """
+        Снимок текущей версии файла с ленивым разбором записей
+        
+        Снимок строится заново, только если файл изменился. Метаданные
+        записей разбираются по запросу, а зашифрованные данные - только
+        при чтении самой записи.
+        """
+        reader = self._reader
+        if reader is None or reader.signature != self._signature():
+            # Снимок заменяется одним присваиванием, читателям блокировка не нужна
+            reader = self._reader = JsonDatabaseReader(self.db_file)
+        return reader
+    
+    @staticmethod
+    def _statistics_of(db: Dict) -> RecordStatistics:
+        """Счетчики статистики базы; в базах без счетчиков они считаются по записям"""
+        if "statistics" in db:
+            return RecordStatistics(db["statistics"])
+        return RecordStatistics.from_records(db["records"])
+    
+    @staticmethod
+    def _header(db: Dict) -> Dict:
+        """Ключи верхнего уровня, которые пишутся перед записями"""
+        return {key: value for key, value in db.items() if key not in ("records", "last_id", "statistics")}
+    
+    def _write(self, db: Dict, statistics: RecordStatistics):
+        """Атомарная запись всей базы вместе со счетчиками статистики"""
+        self._write_streaming(self._header(db), db["records"],
+                              trailer=lambda: {"last_id": self._max_id(db), "statistics": statistics.as_dict()})
+    
+    def peek_next_id(self) -> int:
+        """ID, который получит следующая добавленная запись"""
+        return self.reader().max_id() + 1
+    
+    def count_records(self) -> int:
+        """Количество записей в базе (без разбора записей)"""
+        return len(self.reader())
+    
+    def get_records_metadata(self, offset: int = 0, limit: Optional[int] = None) -> List[Dict]:
+        """
+        Метаданные записей по возрастанию ID без зашифрованных данных
+        
+        Разбираются только запрошенные записи.
+        
+        Args:
+            offset: Сколько записей пропустить
+            limit: Максимальное количество записей (None - все)
+        """
+        return self.reader().metadata_page(offset, limit)
+    
+    def get_metadata(self, record_id: int) -> Optional[Dict]:
+        """Метаданные записи без чтения зашифрованных данных"""
+        return self.reader().get_metadata(record_id)
+    
+    def get_statistics(self) -> Dict:
+        """
+        Статистика из конца файла базы (записи не читаются)
+        
+        В базах, записанных до появления счетчиков, статистика один раз
+        считается по записям; счетчики сохранятся при следующей записи.
+        """
+        signature = self._signature()
+        cached = self._statistics
+        if cached is None or cached[0] != signature:
+            statistics = read_trailer(self.db_file).get("statistics")
+            if statistics is None:
+                statistics = RecordStatistics.from_records(self.get_all_records()).as_dict()
+            cached = self._statistics = (signature, statistics)
+        return RecordStatistics(cached[1]).as_dict()
+    
+    def rebuild_statistics(self) -> Dict:
+        """
+        Пересчет счетчиков статистики по всем записям (восстановление)
+        
+        Returns:
+            Новая статистика
+        """
+        with self._file_lock.exclusive():
+            db = self._read()
+            statistics = RecordStatistics.from_records(db["records"])
+            self._write(db, statistics)
+            self._index_written(lambda index: index.rebuild_statistics())
+        return statistics.as_dict()
+    
+    def _index_written(self, apply):
+        """
+        Обновление индекса после записи файла этим менеджером
+        
+        Если файл между чтением и записью менялся извне, индекс сбрасывается
+        и будет построен заново при следующем запросе.
+        
+        Args:
+            apply: Функция apply(index), вносящая изменения в индекс
+        """
+        if self._index is not None and self._index_signature == self._read_signature:
+            apply(self._index)
+            self._index_signature = self._signature()
+        else:
+            self._index = None
+    
+    def metadata_index(self) -> MetadataIndex:
+        """
+        Индекс по метаданным записей
+        
+        Индекс строится при первом запросе и затем обновляется
+        инкрементально; при изменении файла другим процессом строится заново.
+        """
+        if self._index is None or self._index_signature != self._signature():
+            records = self._read()["records"]
+            self._index = MetadataIndex(records)
+            self._index_signature = self._read_signature
+        return self._index
     
     def _ensure_database_exists(self):
         """Создание файла базы данных, если он не существует"""
-        if not os.path.exists(self.db_file):
-            with open(self.db_file, 'w', encoding='utf-8') as f:
-                json.dump({"records": []}, f, ensure_ascii=False, indent=2)
+        if os.path.exists(self.db_file):
+            return
+        with self._file_lock.exclusive():
+            if not os.path.exists(self.db_file):
+                self._write({"records": []}, RecordStatistics())
     
-    def add_record(self, encrypted_data: str, record_type: str, description: str = ""):
+    def add_record(self, encrypted_data: Union[str, bytes], record_type: str, description: str = "",
+                   blind_index: Optional[Dict[str, str]] = None):
         """
         Добавление записи в базу данных
         
@@ -35,25 +574,129 @@ class DatabaseManager:
             encrypted_data: Зашифрованные данные
             record_type: Тип записи (ученик, учитель, родитель)
             description: Описание записи
+            blind_index: Слепые индексы полей {поле: индекс}
+            
+        Returns:
+            ID добавленной записи
         """
-        with open(self.db_file, 'r', encoding='utf-8') as f:
-            db = json.load(f)
+        with self._file_lock.exclusive():
+            db = self._read()
+            statistics = self._statistics_of(db)
+            
+            record = {
+                "id": self._max_id(db) + 1,
+                "type": record_type,
+                "description": description,
+                "encrypted_data": self._as_text(encrypted_data),
+                "created_at": datetime.now().isoformat(),
+                "updated_at": datetime.now().isoformat(),
+                "version": 1
+            }
+            if blind_index:
+                record["blind_index"] = dict(blind_index)
+            
+            db["records"].append(record)
+            db["last_id"] = record["id"]
+            statistics.add(record)
+            
+            self._write(db, statistics)
+            self._index_written(lambda index: index.add(record))
         
-        record = {
-            "id": len(db["records"]) + 1,
-            "type": record_type,
-            "description": description,
-            "encrypted_data": encrypted_data,
-            "created_at": datetime.now().isoformat(),
-            "updated_at": datetime.now().isoformat()
-        }
+        return record["id"]
+    
+    def add_records(self, records: Iterable[Sequence]) -> List[int]:
+        """
+        Пакетное добавление записей одной записью файла
         
-        db["records"].append(record)
+        Новые записи не накапливаются в памяти: они сериализуются во временный
+        файл по мере чтения из итератора, после чего файл атомарно заменяет базу
+        (один fsync на весь пакет).
         
-        with open(self.db_file, 'w', encoding='utf-8') as f:
-            json.dump(db, f, ensure_ascii=False, indent=2)
+        Args:
+            records: Итерируемый набор кортежей
+                (encrypted_data, record_type[, description[, blind_index]])
+                
+        Returns:
+            Список ID добавленных записей
+        """
+        with self._file_lock.exclusive():
+            return self._add_records(records)
+    
+    def _add_records(self, records: Iterable[Sequence]) -> List[int]:
+        db = self._read()
+        statistics = self._statistics_of(db)
         
-        return record["id"]
+        first_id = self._max_id(db) + 1
+        header = self._header(db)
+        added_ids = []
+        added = []
+        
+        def new_records():
+            next_id = first_id
+            for encrypted_data, record_type, *rest in records:
+                description, blind_index = self._optional_fields(rest)
+                now = datetime.now().isoformat()
+                record = {
+                    "id": next_id,
+                    "type": record_type,
+                    "description": description,
+                    "encrypted_data": self._as_text(encrypted_data),
+                    "created_at": now,
+                    "updated_at": now,
+                    "version": 1
+                }
+                if blind_index:
+                    record["blind_index"] = dict(blind_index)
+                added_ids.append(next_id)
+                added.append({k: v for k, v in record.items() if k != "encrypted_data"})
+                statistics.add(record)
+                next_id += 1
+                yield record
+        
+        self._write_streaming(header, db["records"], new_records(), trailer=lambda: {
+            "last_id": first_id + len(added_ids) - 1,
+            "statistics": statistics.as_dict()
+        })
+        self._index_written(lambda index: [index.add(record) for record in added])
+        return added_ids
+    
+    def _write_streaming(self, header: Dict, *record_sources: Iterable[Dict], trailer=None):
+        """
+        Атомарная запись базы с потоковой сериализацией записей
+        
+        Формат совпадает с json.dump(..., indent=2).
+        
+        Args:
+            header: Прочие ключи верхнего уровня базы
+            record_sources: Источники записей, записываются подряд
+            trailer: Функция, возвращающая ключи, которые пишутся после записей
+                ("last_id" и "statistics"): они известны только после чтения
+                всех источников и читаются с конца файла без разбора записей
+        """
+        def write(f):
+            f.write("{\n")
+            for key, value in header.items():
+                dumped = json.dumps(value, ensure_ascii=False, indent=2).replace("\n", "\n  ")
+                f.write(f'  {json.dumps(key, ensure_ascii=False)}: {dumped},\n')
+            f.write('  "records": [')
+            
+            separator = "\n"
+            for source in record_sources:
+                for record in source:
+                    dumped = json.dumps(record, ensure_ascii=False, indent=2)
+                    f.write(separator + "    " + dumped.replace("\n", "\n    "))
+                    separator = ",\n"
+            
+            f.write("\n  ]" if separator != "\n" else "]")
+            for key, value in (trailer() if trailer else {}).items():
+                dumped = json.dumps(value, ensure_ascii=False, indent=2).replace("\n", "\n  ")
+                f.write(f',\n  {json.dumps(key, ensure_ascii=False)}: {dumped}')
+            f.write("\n}")
+        
+        with metrics.timer("db_rewrite_seconds", backend="json"):
+            replace_atomically(self.db_file, write)
+        if metrics.enabled:
+            metrics.inc("db_bytes_written_total", os.path.getsize(self.db_file), backend="json")
     
     def get_all_records(self) -> List[Dict]:
         """
@@ -62,8 +705,7 @@ class DatabaseManager:
         Returns:
             Список записей (без расшифровки)
         """
-        with open(self.db_file, 'r', encoding='utf-8') as f:
-            db = json.load(f)
+        db = self._read()
         
         return db["records"]
     
@@ -77,11 +719,8 @@ class DatabaseManager:
         Returns:
             Запись или None, если не найдена
         """
-        records = self.get_all_records()
-        for record in records:
-            if record["id"] == record_id:
-                return record
-        return None
+        with metrics.timer("db_get_record_seconds", backend="json"):
+            return self.reader().get_record(record_id)
     
     def delete_record(self, record_id: int) -> bool:
         """
@@ -93,20 +732,31 @@ class DatabaseManager:
         Returns:
             True, если запись удалена, False если не найдена
         """
-        with open(self.db_file, 'r', encoding='utf-8') as f:
-            db = json.load(f)
-        
-        initial_count = len(db["records"])
-        db["records"] = [r for r in db["records"] if r["id"] != record_id]
-        
-        if len(db["records"]) < initial_count:
-            with open(self.db_file, 'w', encoding='utf-8') as f:
-                json.dump(db, f, ensure_ascii=False, indent=2)
-            return True
+        with self._file_lock.exclusive():
+            db = self._read()
+            statistics = self._statistics_of(db)
+            
+            self._invalidate_cached(record_id)
+            # ID удаленной записи не должен быть выдан повторно
+            db["last_id"] = self._max_id(db)
+            initial_count = len(db["records"])
+            kept = []
+            for record in db["records"]:
+                if record["id"] == record_id:
+                    statistics.remove(record)
+                else:
+                    kept.append(record)
+            db["records"] = kept
+            
+            if len(db["records"]) < initial_count:
+                self._write(db, statistics)
+                self._index_written(lambda index: index.remove(record_id))
+                return True
         
         return False
     
-    def update_record(self, record_id: int, encrypted_data: str, description: str = ""):
+    def update_record(self, record_id: int, encrypted_data: Union[str, bytes], description: str = "",
+                      blind_index: Optional[Dict[str, str]] = None, expected_version: Optional[int] = None):
         """
         Обновление записи в базе данных
         
@@ -114,36 +764,157 @@ class DatabaseManager:
             record_id: ID записи
             encrypted_data: Новые зашифрованные данные
             description: Новое описание
+            blind_index: Новые слепые индексы (None - оставить прежние)
+            expected_version: Версия записи, на основе которой сделано изменение
+                (None - обновить без проверки)
+                
+        Raises:
+            ConcurrentModificationError: Запись изменена или удалена после чтения
         """
-        with open(self.db_file, 'r', encoding='utf-8') as f:
-            db = json.load(f)
-        
-        for record in db["records"]:
-            if record["id"] == record_id:
-                record["encrypted_data"] = encrypted_data
-                record["description"] = description
-                record["updated_at"] = datetime.now().isoformat()
-                break
-        
-        with open(self.db_file, 'w', encoding='utf-8') as f:
-            json.dump(db, f, ensure_ascii=False, indent=2)
+        with self._file_lock.exclusive():
+            db = self._read()
+            statistics = self._statistics_of(db)
+            
+            updated = []
+            for record in db["records"]:
+                if record["id"] == record_id:
+                    self._check_version(record_id, record.get("version", 1), expected_version)
+                    self._invalidate_cached(record_id)
+                    old = dict(record)
+                    self._apply_update(record, self._as_text(encrypted_data), description, blind_index)
+                    statistics.replace(old, record)
+                    updated.append(record)
+                    break
+            else:
+                self._check_version(record_id, None, expected_version)
+            
+            if updated:
+                self._write(db, statistics)
+                self._index_written(lambda index: [index.add(record) for record in updated])
     
-    def get_statistics(self) -> Dict:
+    def update_records(self, updates: Iterable[Sequence]) -> int:
         """
-        Получение статистики по базе данных
+        Пакетное обновление записей одной перезаписью файла
         
+        Args:
+            updates: Итерируемый набор кортежей
+                (record_id, encrypted_data, description[, blind_index[, expected_version]]).
+                Запись, версия которой не совпадает с expected_version, пропускается
+                
         Returns:
-            Словарь со статистикой
+            Количество обновленных записей
         """
-        records = self.get_all_records()
+        with self._file_lock.exclusive():
+            return self._update_records(updates)
+    
+    def _update_records(self, updates: Iterable[Sequence]) -> int:
+        db = self._read()
+        statistics = self._statistics_of(db)
         
-        stats = {
-            "total_records": len(records),
-            "by_type": {}
-        }
+        by_id = {record["id"]: record for record in db["records"]}
+        updated = []
+        for record_id, encrypted_data, description, *rest in updates:
+            record = by_id.get(record_id)
+            if record and (len(rest) < 2 or rest[1] is None or record.get("version", 1) == rest[1]):
+                self._invalidate_cached(record_id)
+                old = dict(record)
+                self._apply_update(record, self._as_text(encrypted_data), description,
+                                   rest[0] if rest else None)
+                statistics.replace(old, record)
+                updated.append(record)
         
-        for record in records:
-            record_type = record["type"]
-            stats["by_type"][record_type] = stats["by_type"].get(record_type, 0) + 1
+        if updated:
+            self._write(db, statistics)
+            self._index_written(lambda index: [index.add(record) for record in updated])
+        return len(updated)
+
+
+def renumber_duplicate_ids(records: List[Dict], last_id: int = 0) -> Tuple[List[Dict], List[Tuple[int, int]]]:
+    """
+    Новые ID для повторяющихся записей старой JSON-базы при переносе
+    
+    Старые версии выдавали ID по количеству записей, поэтому после удаления
+    один ID могли получить записи разных людей. Ни одна запись не теряется:
+    первая сохраняет свой ID (ее же возвращает get_record JSON-базы),
+    следующие получают новые ID после наибольшего из ID записей и last_id.
+    
+    Args:
+        records: Записи JSON-базы в порядке файла
+        last_id: Последний выданный ID (поле last_id базы)
         
-        return stats
+    Returns:
+        Кортеж (записи с уникальными ID, список пар (прежний ID, новый ID))
+    """
+    next_id = max([last_id] + [record["id"] for record in records]) + 1
+    seen = set()
+    result = []
+    renumbered = []
+    for record in records:
+        if record["id"] in seen:
+            renumbered.append((record["id"], next_id))
+            record = dict(record, id=next_id)
+            next_id += 1
+        seen.add(record["id"])
+        result.append(record)
+    return result, renumbered
+
+
+def open_database(path: str = "encrypted_database.json", backend: Optional[str] = None) -> BaseDatabaseManager:
+    """
+    Открытие хранилища с выбором реализации
+    
+    Args:
+        path: Путь к файлу или каталогу хранилища
+        backend: "json", "log" или "sqlite"; если не указан, определяется по пути
+        
+    Returns:
+        Экземпляр менеджера базы данных
+    """
+    if backend is None:
+        if os.path.isdir(path) or path.endswith(".log"):
+            backend = "log"
+        elif path.endswith((".db", ".sqlite", ".sqlite3")):
+            backend = "sqlite"
+        else:
+            backend = "json"
+    
+    if backend == "json":
+        return DatabaseManager(path)
+    if backend == "log":
+        from log_database import LogDatabaseManager
+        return LogDatabaseManager(path)
+    if backend == "sqlite":
+        from sqlite_database import SqliteDatabaseManager
+        return SqliteDatabaseManager(path)
+    
+    raise ValueError(f"Неизвестный тип хранилища: {backend}")
+
+
+if __name__ == "__main__":
+    import argparse
+    import getpass
+    from key_rotation import Keyring
+    
+    parser = argparse.ArgumentParser(description="Обслуживание базы зашифрованных данных")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    upgrade_parser = subparsers.add_parser("upgrade", help="Перевод записей в компактный формат")
+    upgrade_parser.add_argument("path", help="Путь к базе данных")
+    blind_parser = subparsers.add_parser("blind-index", help="Построение слепых индексов для поиска")
+    blind_parser.add_argument("path", help="Путь к базе данных")
+    stats_parser = subparsers.add_parser("rebuild-stats", help="Пересчет счетчиков статистики")
+    stats_parser.add_argument("path", help="Путь к базе данных")
+    args = parser.parse_args()
+    
+    with open_database(args.path) as manager:
+        if args.command == "rebuild-stats":
+            # Счетчики считаются по открытым метаданным, пароль не нужен
+            stats = manager.rebuild_statistics()
+            print(f"Всего записей: {stats['total_records']}")
+            for record_type, count in stats["by_type"].items():
+                print(f"  {record_type}: {count}")
+        else:
+            encryption = Keyring.for_database(args.path).unlock(getpass.getpass("Пароль: "))
+            if args.command == "upgrade":
+                print(f"Обновлено записей: {manager.upgrade_record_format(encryption)}")
+            elif args.command == "blind-index":
+                print(f"Проиндексировано записей: {manager.build_blind_indexes(encryption)}")
@@ -3,51 +3,465 @@
 Использует алгоритм AES-256 для защиты информации
 """
 
-from cryptography.fernet import Fernet
+from cryptography.exceptions import InvalidTag
+from cryptography.fernet import Fernet, MultiFernet
 from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
 from cryptography.hazmat.backends import default_backend
+from concurrent.futures import Future, ThreadPoolExecutor
 import base64
+import hashlib
+import hmac
+import mmap
 import os
 import json
+import secrets
+import struct
+import threading
+import time
 from datetime import datetime
-from typing import Tuple
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+from metrics import metrics
+
+
+DEFAULT_SALT = b'school_data_protection_2024'
+DEFAULT_ITERATIONS = 100000
+
+# Компактный формат записи: версия (1 байт) + идентификатор ключа (8 байт)
+# + nonce (12 байт) + AES-256-GCM. Идентификатор ключа входит в связанные данные
+RECORD_FORMAT_VERSION = 3
+RECORD_KEY_ID_SIZE = 8
+RECORD_NONCE_SIZE = 12
+# Версия 2 - тот же формат без идентификатора ключа (только чтение)
+RECORD_FORMAT_V2 = 2
+RECORD_FORMAT_VERSIONS = (RECORD_FORMAT_V2, RECORD_FORMAT_VERSION)
+# Текстовая форма для хранилищ без двоичных полей (JSON): одно кодирование base64
+RECORD_TEXT_PREFIX = "v3:"
+RECORD_TEXT_PREFIXES = tuple(f"v{version}:" for version in RECORD_FORMAT_VERSIONS)
+
+# Потоковый формат файлов: заголовок (сигнатура, версия, размер порции),
+# далее порции nonce (12 байт) + AES-256-GCM. В связанные данные каждой порции
+# входят заголовок, номер порции и признак последней порции
+FILE_MAGIC = b'PDSF'
+FILE_FORMAT_VERSION = 1
+FILE_HEADER = struct.Struct('>4sBI')
+FILE_CHUNK_AAD = struct.Struct('>QB')
+FILE_TAG_SIZE = 16
+DEFAULT_FILE_CHUNK_SIZE = 1024 * 1024
+
+# Поля, для которых строится слепой индекс (HMAC значения) для поиска
+# по точному совпадению без расшифровки записей
+BLIND_INDEX_FIELDS = ("фамилия", "дата_рождения", "класс", "телефон")
+BLIND_INDEX_SIZE = 16
+
+
+def record_to_text(blob: bytes) -> str:
+    """
+    Текстовая форма компактной записи для JSON
+    
+    Args:
+        blob: Запись в двоичном формате
+        
+    Returns:
+        Строка вида "v3:<base64>" (версия формата из первого байта записи)
+    """
+    return f"v{blob[0]}:" + base64.b64encode(blob).decode('ascii')
+
+
+def _record_bytes(encrypted: Union[str, bytes]) -> Optional[bytes]:
+    """
+    Извлечение двоичной записи компактного формата
+    
+    Returns:
+        Байты записи или None для записи старого формата (base64 от токена Fernet)
+    """
+    if isinstance(encrypted, (bytes, bytearray, memoryview)):
+        encrypted = bytes(encrypted)
+        if encrypted[:1] and encrypted[0] in RECORD_FORMAT_VERSIONS:
+            return encrypted
+        encrypted = encrypted.decode('utf-8')
+    
+    if encrypted.startswith(RECORD_TEXT_PREFIXES):
+        return base64.b64decode(encrypted[3:])
+    return None
+
+
+def record_key_id(encrypted: Union[str, bytes]) -> Optional[str]:
+    """
+    Идентификатор ключа, которым зашифрована запись (без дешифрования)
+    
+    Args:
+        encrypted: Зашифрованные данные в любом формате
+        
+    Returns:
+        Отпечаток ключа (key_fingerprint) или None для записей прежних
+        форматов, в которых ключ не указан
+    """
+    blob = _record_bytes(encrypted)
+    if blob is None or blob[0] != RECORD_FORMAT_VERSION:
+        return None
+    return blob[1:1 + RECORD_KEY_ID_SIZE].hex()
+
+
+def _iter_file_chunks(f, chunk_size: int, offset: int = 0):
+    """
+    Чтение файла порциями фиксированного размера
+    
+    По возможности файл отображается в память (mmap), иначе читается обычным
+    образом с опережением на одну порцию.
+    
+    Yields:
+        Кортежи (данные порции, признак последней порции)
+    """
+    try:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (ValueError, OSError):
+        # Пустой файл или поток, который нельзя отобразить в память
+        mapped = None
+    
+    if mapped is not None:
+        with mapped:
+            size = len(mapped)
+            released = 0
+            for position in range(offset, size, chunk_size):
+                yield mapped[position:position + chunk_size], position + chunk_size >= size
+                # Прочитанные страницы отдаются системе, чтобы не росла резидентная память
+                if hasattr(mapped, 'madvise') and hasattr(mmap, 'MADV_DONTNEED'):
+                    boundary = (position + chunk_size) // mmap.PAGESIZE * mmap.PAGESIZE
+                    if boundary > released:
+                        mapped.madvise(mmap.MADV_DONTNEED, released, boundary - released)
+                        released = boundary
+        return
+    
+    f.seek(offset)
+    current = f.read(chunk_size)
+    while True:
+        following = f.read(chunk_size)
+        yield current, not following
+        if not following:
+            return
+        current = following
+
+
+def normalize_blind_value(field: str, value) -> str:
+    """
+    Приведение значения поля к виду, в котором оно попадает в слепой индекс
+    
+    Регистр и лишние пробелы не влияют на поиск, в телефоне учитываются
+    только цифры (8XXXXXXXXXX и +7XXXXXXXXXX совпадают).
+    
+    Args:
+        field: Имя поля
+        value: Значение поля
+        
+    Returns:
+        Нормализованное значение
+    """
+    text = " ".join(str(value).split()).lower()
+    if field == "телефон":
+        text = "".join(ch for ch in text if ch.isdigit())
+        if len(text) == 11 and text[0] == "8":
+            text = "7" + text[1:]
+    return text
+
+
+def is_legacy_record(encrypted: Union[str, bytes]) -> bool:
+    """
+    Проверка, записаны ли данные в старом формате
+    
+    Args:
+        encrypted: Зашифрованные данные в любом формате
+        
+    Returns:
+        True для base64 от токена Fernet
+    """
+    return _record_bytes(encrypted) is None
+
+
+class KeyDerivationCache:
+    """
+    Кэш выведенных ключей в памяти процесса
+    
+    Записи адресуются по (HMAC пароля, соль, число итераций); сам пароль
+    в кэше не хранится. Ключи живут ограниченное время и могут быть
+    принудительно стерты методом wipe().
+    """
+    
+    def __init__(self, ttl_seconds: float = 15 * 60):
+        """
+        Args:
+            ttl_seconds: Время жизни ключа в кэше
+        """
+        self.ttl_seconds = ttl_seconds
+        # Случайный секрет процесса: по ключам кэша нельзя подбирать пароль
+        self._secret = secrets.token_bytes(32)
+        self._entries: Dict[Tuple[bytes, bytes, int], Tuple[bytearray, float]] = {}
+        self._lock = threading.Lock()
+    
+    def _cache_key(self, password: bytes, salt: bytes, iterations: int) -> Tuple[bytes, bytes, int]:
+        return hmac.new(self._secret, password, hashlib.sha256).digest(), salt, iterations
+    
+    def derive(self, password: bytes, salt: bytes = DEFAULT_SALT,
+               iterations: int = DEFAULT_ITERATIONS) -> bytes:
+        """
+        Получение ключа из кэша или вычисление через PBKDF2
+        
+        Args:
+            password: Пароль
+            salt: Соль
+            iterations: Число итераций PBKDF2
+            
+        Returns:
+            Ключ шифрования в формате Fernet
+        """
+        cache_key = self._cache_key(password, salt, iterations)
+        now = time.monotonic()
+        
+        with self._lock:
+            # Просроченные ключи стираются при каждом обращении, а не только
+            # при повторном запросе того же пароля
+            self._purge(now)
+            entry = self._entries.get(cache_key)
+            if entry:
+                metrics.inc("key_cache_requests_total", result="hit")
+                return bytes(entry[0])
+        
+        metrics.inc("key_cache_requests_total", result="miss")
+        kdf = PBKDF2HMAC(
+            algorithm=hashes.SHA256(),
+            length=32,
+            salt=salt,
+            iterations=iterations,
+            backend=default_backend()
+        )
+        with metrics.timer("kdf_seconds"):
+            key = base64.urlsafe_b64encode(kdf.derive(password))
+        
+        with self._lock:
+            self._entries[cache_key] = (bytearray(key), now + self.ttl_seconds)
+        return key
+    
+    def _erase(self, cache_key):
+        key, _ = self._entries.pop(cache_key)
+        key[:] = bytes(len(key))
+    
+    def wipe(self):
+        """
+        Стирание всех ключей из кэша
+        
+        Буферы кэша перезаписываются нулями. Копии ключа, уже выданные
+        экземплярам PersonalDataEncryption, остаются у них.
+        """
+        with self._lock:
+            for cache_key in list(self._entries):
+                self._erase(cache_key)
+    
+    def _purge(self, now: float) -> int:
+        expired = [k for k, (_, expires) in self._entries.items() if expires <= now]
+        for cache_key in expired:
+            self._erase(cache_key)
+        return len(expired)
+    
+    def purge_expired(self) -> int:
+        """
+        Стирание ключей с истекшим временем жизни
+        
+        Returns:
+            Количество стертых ключей
+        """
+        with self._lock:
+            return self._purge(time.monotonic())
+    
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+
+# Общий для процесса кэш ключей
+key_cache = KeyDerivationCache()
+
+# PBKDF2 выполняется в отдельном потоке, чтобы не блокировать интерфейс
+_kdf_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="kdf")
 
 
 class PersonalDataEncryption:
     """Класс для шифрования и дешифрования персональных данных"""
     
-    def __init__(self, password: str):
+    def __init__(self, password: str, salt: bytes = DEFAULT_SALT, iterations: int = DEFAULT_ITERATIONS):
         """
         Инициализация с паролем пользователя
         
         Args:
             password: Пароль для генерации ключа шифрования
+            salt: Соль для PBKDF2
+            iterations: Число итераций PBKDF2
         """
         self.password = password.encode()
+        self.salt = salt
+        self.iterations = iterations
         self.key = self._generate_key()
+        self._init_ciphers()
+    
+    @classmethod
+    def create_async(cls, password: str, callback: Optional[Callable[['PersonalDataEncryption'], None]] = None,
+                     salt: bytes = DEFAULT_SALT, iterations: int = DEFAULT_ITERATIONS) -> Future:
+        """
+        Создание экземпляра в фоновом потоке
+        
+        Args:
+            password: Пароль для генерации ключа шифрования
+            callback: Функция, вызываемая с готовым экземпляром (в фоновом потоке)
+            salt: Соль для PBKDF2
+            iterations: Число итераций PBKDF2
+            
+        Returns:
+            Future с экземпляром PersonalDataEncryption
+        """
+        future = _kdf_executor.submit(cls, password, salt, iterations)
+        if callback:
+            def on_done(done: Future):
+                if done.exception() is None:
+                    callback(done.result())
+            future.add_done_callback(on_done)
+        return future
+    
+    @classmethod
+    def from_key(cls, key: bytes) -> 'PersonalDataEncryption':
+        """
+        Создание экземпляра по уже выведенному ключу (без повторного PBKDF2)
+        
+        Args:
+            key: Ключ шифрования в формате Fernet
+            
+        Returns:
+            Экземпляр PersonalDataEncryption
+        """
+        instance = cls.__new__(cls)
+        instance.password = None
+        instance.salt = None
+        instance.iterations = None
+        instance.key = key
+        instance._init_ciphers()
+        return instance
+    
+    def _init_ciphers(self):
+        """Создание шифров: Fernet для старого формата и AES-GCM для компактного"""
         self.cipher = Fernet(self.key)
+        self.record_cipher = AESGCM(self._derive_subkey(b'personal-data-record-v2'))
+        self.file_cipher = AESGCM(self._derive_subkey(b'personal-data-file-v1'))
+        # Ключи HMAC слепого индекса выводятся по одному на поле при первом обращении
+        self._blind_keys: Dict[str, bytes] = {}
+        # Отпечаток ключа (не раскрывает ключ): по нему кэши отличают данные разных ключей,
+        # он же записывается в заголовок записи как идентификатор ключа
+        self.key_fingerprint = self._derive_subkey(b'personal-data-key-fingerprint')[:RECORD_KEY_ID_SIZE].hex()
+        self.key_id = bytes.fromhex(self.key_fingerprint)
+        # Прежние ключи, которыми еще могут быть зашифрованы записи (после смены пароля)
+        self._previous: Dict[bytes, 'PersonalDataEncryption'] = {}
     
-    def _generate_key(self) -> bytes:
+    def add_decryption_key(self, key: bytes):
         """
-        Генерация ключа шифрования из пароля
+        Добавление прежнего ключа: записи, зашифрованные им, остаются читаемыми
+        
+        Новые записи шифруются только текущим ключом.
+        
+        Args:
+            key: Прежний ключ в формате Fernet
+        """
+        old = PersonalDataEncryption.from_key(key)
+        if old.key_id != self.key_id:
+            self._previous[old.key_id] = old
+    
+    @property
+    def previous_keys(self) -> List[bytes]:
+        """Прежние ключи, доступные для чтения"""
+        return [old.key for old in self._previous.values()]
+    
+    def blind_index_variants(self, field: str, value) -> List[str]:
+        """
+        Слепые индексы значения на текущем и прежних ключах
+        
+        Пока идет перешифрование базы новым ключом, часть записей еще
+        проиндексирована прежним ключом; поиск выполняется по всем вариантам.
         
         Returns:
-            Ключ шифрования в формате Fernet
+            Список индексов, первым - на текущем ключе
+        """
+        return [self.blind_index(field, value)] + [old.blind_index(field, value)
+                                                   for old in self._previous.values()]
+    
+    def _derive_subkey(self, info: bytes) -> bytes:
         """
-        # Используем соль для дополнительной безопасности
-        salt = b'school_data_protection_2024'
+        Вывод подключа для отдельного назначения
         
-        kdf = PBKDF2HMAC(
+        Отдельные подключи нужны, чтобы один и тот же ключ не использовался
+        разными алгоритмами и форматами.
+        """
+        return HKDF(
             algorithm=hashes.SHA256(),
             length=32,
-            salt=salt,
-            iterations=100000,
+            salt=None,
+            info=info,
             backend=default_backend()
-        )
+        ).derive(base64.urlsafe_b64decode(self.key))
+    
+    def _generate_key(self) -> bytes:
+        """
+        Генерация ключа шифрования из пароля
         
-        key = base64.urlsafe_b64encode(kdf.derive(self.password))
-        return key
+        Повторные вызовы с тем же паролем берут ключ из кэша процесса.
+        
+        Returns:
+            Ключ шифрования в формате Fernet
+        """
+        return key_cache.derive(self.password, self.salt, self.iterations)
+    
+    def _seal(self, payload: bytes) -> bytes:
+        """Шифрование готового JSON в компактный формат"""
+        header = bytes([RECORD_FORMAT_VERSION]) + self.key_id
+        nonce = os.urandom(RECORD_NONCE_SIZE)
+        return header + nonce + self.record_cipher.encrypt(nonce, payload, header)
+    
+    def _open(self, blob: bytes) -> bytes:
+        """
+        Дешифрование записи компактного формата
+        
+        Запись версии 3 расшифровывается ключом из ее заголовка; запись
+        версии 2 не указывает ключ, и ключи перебираются начиная с текущего.
+        """
+        if blob[0] == RECORD_FORMAT_VERSION:
+            header_size = 1 + RECORD_KEY_ID_SIZE
+            key_id = blob[1:header_size]
+            owner = self if key_id == self.key_id else self._previous.get(key_id)
+            if owner is None:
+                raise ValueError(f"запись зашифрована неизвестным ключом {key_id.hex()}")
+            nonce = blob[header_size:header_size + RECORD_NONCE_SIZE]
+            return owner.record_cipher.decrypt(nonce, blob[header_size + RECORD_NONCE_SIZE:], blob[:header_size])
+        
+        nonce = blob[1:1 + RECORD_NONCE_SIZE]
+        for owner in (self, *self._previous.values()):
+            try:
+                return owner.record_cipher.decrypt(nonce, blob[1 + RECORD_NONCE_SIZE:], blob[:1])
+            except InvalidTag:
+                continue
+        raise InvalidTag()
+    
+    def encrypt_record(self, data: dict) -> bytes:
+        """
+        Шифрование словаря в компактный двоичный формат
+        
+        Args:
+            data: Словарь с персональными данными
+            
+        Returns:
+            Байты записи (версия формата, идентификатор ключа, nonce, шифротекст AES-GCM)
+        """
+        with metrics.timer("record_encrypt_seconds"):
+            # Добавляем метаданные о времени шифрования
+            payload = json.dumps(dict(data, _encrypted_at=datetime.now().isoformat()), ensure_ascii=False)
+            return self._seal(payload.encode('utf-8'))
     
     def encrypt_data(self, data: dict) -> str:
         """
@@ -57,30 +471,94 @@ class PersonalDataEncryption:
             data: Словарь с персональными данными
             
         Returns:
-            Зашифрованная строка в формате JSON
+            Зашифрованная строка (текстовая форма компактного формата)
+        """
+        return record_to_text(self.encrypt_record(data))
+    
+    def encrypt_many(self, records: Iterable[dict], binary: bool = False) -> Iterator[Union[str, bytes]]:
+        """
+        Потоковое шифрование набора словарей
+        
+        Записи обрабатываются по одной по мере чтения из итератора, поэтому
+        расход памяти не зависит от размера пакета. Исходные словари
+        не изменяются.
+        
+        Args:
+            records: Итерируемый набор словарей с персональными данными
+            binary: Возвращать байты вместо текстовой формы
+            
+        Yields:
+            Зашифрованные записи в том же порядке
+        """
+        encrypted_at = datetime.now().isoformat()
+        encode = json.JSONEncoder(ensure_ascii=False).encode
+        
+        for data in records:
+            blob = self._seal(encode(dict(data, _encrypted_at=encrypted_at)).encode('utf-8'))
+            yield blob if binary else record_to_text(blob)
+    
+    def blind_index(self, field: str, value) -> str:
         """
-        # Добавляем метаданные о времени шифрования
-        data['_encrypted_at'] = datetime.now().isoformat()
+        Слепой индекс значения поля
+        
+        HMAC-SHA256 нормализованного значения на отдельном для каждого поля
+        подключе. По индексу нельзя восстановить значение без ключа, но равные
+        значения дают равные индексы, что позволяет искать по точному совпадению.
         
-        # Преобразуем в JSON и шифруем
-        json_data = json.dumps(data, ensure_ascii=False)
-        encrypted_data = self.cipher.encrypt(json_data.encode('utf-8'))
+        Args:
+            field: Имя поля (например, "фамилия")
+            value: Значение поля
+            
+        Returns:
+            Индекс в шестнадцатеричном виде
+        """
+        key = self._blind_keys.get(field)
+        if key is None:
+            key = self._derive_subkey(b'personal-data-blind-index-v1:' + field.encode('utf-8'))
+            self._blind_keys[field] = key
+        digest = hmac.new(key, normalize_blind_value(field, value).encode('utf-8'), hashlib.sha256)
+        return digest.digest()[:BLIND_INDEX_SIZE].hex()
+    
+    def blind_indexes(self, data: dict, fields: Iterable[str] = BLIND_INDEX_FIELDS) -> Dict[str, str]:
+        """
+        Слепые индексы заполненных полей записи
         
-        return base64.b64encode(encrypted_data).decode('utf-8')
+        Args:
+            data: Словарь с персональными данными
+            fields: Индексируемые поля
+            
+        Returns:
+            Словарь {поле: индекс}
+        """
+        return {field: self.blind_index(field, data[field])
+                for field in fields if str(data.get(field, "")).strip()}
     
-    def decrypt_data(self, encrypted_string: str) -> dict:
+    def decrypt_data(self, encrypted_string: Union[str, bytes]) -> dict:
         """
         Дешифрование строки с персональными данными
         
+        Формат определяется автоматически: поддерживаются компактные записи
+        (двоичные и текстовые) и записи старого формата (base64 от токена Fernet).
+        Записи прежних ключей читаются, если ключи добавлены add_decryption_key.
+        
         Args:
-            encrypted_string: Зашифрованная строка
+            encrypted_string: Зашифрованная строка или байты
             
         Returns:
             Словарь с персональными данными
         """
         try:
-            encrypted_bytes = base64.b64decode(encrypted_string.encode('utf-8'))
-            decrypted_bytes = self.cipher.decrypt(encrypted_bytes)
+            blob = _record_bytes(encrypted_string)
+            if blob is not None:
+                with metrics.timer("record_decrypt_seconds", format="compact"):
+                    decrypted_bytes = self._open(blob)
+            else:
+                encrypted_bytes = base64.b64decode(encrypted_string)
+                cipher = self.cipher
+                if self._previous:
+                    cipher = MultiFernet([self.cipher] + [old.cipher for old in self._previous.values()])
+                with metrics.timer("record_decrypt_seconds", format="fernet"):
+                    decrypted_bytes = cipher.decrypt(encrypted_bytes)
             json_data = decrypted_bytes.decode('utf-8')
             data = json.loads(json_data)
             
@@ -91,42 +569,188 @@ class PersonalDataEncryption:
         except Exception as e:
             raise ValueError(f"Ошибка дешифрования: {str(e)}")
     
-    def encrypt_file(self, input_file: str, output_file: str):
+    def encrypt_file(self, input_file: str, output_file: str,
+                     progress_callback: Optional[Callable[[int, int], None]] = None,
+                     chunk_size: int = DEFAULT_FILE_CHUNK_SIZE):
         """
-        Шифрование файла
+        Потоковое шифрование файла порциями
+        
+        Расход памяти не зависит от размера файла.
         
         Args:
             input_file: Путь к исходному файлу
             output_file: Путь к зашифрованному файлу
+            progress_callback: Функция (обработано байт, всего байт)
+            chunk_size: Размер порции открытых данных
         """
-        with open(input_file, 'rb') as f:
-            data = f.read()
+        header = FILE_HEADER.pack(FILE_MAGIC, FILE_FORMAT_VERSION, chunk_size)
         
-        encrypted_data = self.cipher.encrypt(data)
+        with open(input_file, 'rb') as src, open(output_file, 'wb') as dst:
+            total = os.fstat(src.fileno()).st_size
+            processed = 0
+            dst.write(header)
+            
+            for index, (chunk, final) in enumerate(_iter_file_chunks(src, chunk_size)):
+                dst.write(self._seal_file_chunk(header, index, chunk, final))
+                
+                processed += len(chunk)
+                metrics.inc("file_bytes_encrypted_total", len(chunk))
+                if progress_callback:
+                    progress_callback(processed, total)
+    
+    def _seal_file_chunk(self, header: bytes, index: int, chunk, final: bool) -> bytes:
+        """Порция потокового формата: nonce и шифротекст со связанными данными"""
+        nonce = os.urandom(RECORD_NONCE_SIZE)
+        aad = header + FILE_CHUNK_AAD.pack(index, final)
+        return nonce + self.file_cipher.encrypt(nonce, chunk, aad)
+    
+    def open_file_writer(self, dst, chunk_size: int = DEFAULT_FILE_CHUNK_SIZE) -> 'EncryptedFileWriter':
+        """
+        Потоковая запись зашифрованного файла из данных, формируемых по частям
         
-        with open(output_file, 'wb') as f:
-            f.write(encrypted_data)
+        Результат имеет тот же формат, что и у encrypt_file, и расшифровывается
+        decrypt_file или iter_decrypted_file.
+        
+        Args:
+            dst: Открытый двоичный файл для записи
+            chunk_size: Размер порции открытых данных
+        """
+        return EncryptedFileWriter(self, dst, chunk_size)
     
-    def decrypt_file(self, input_file: str, output_file: str):
+    def iter_decrypted_file(self, input_file: str,
+                            progress_callback: Optional[Callable[[int, int], None]] = None) -> Iterator[bytes]:
+        """
+        Потоковое дешифрование файла потокового формата
+        
+        Порции возвращаются по мере проверки; обрезанный или поврежденный файл
+        обнаруживается не позже последней порции.
+        
+        Args:
+            input_file: Путь к зашифрованному файлу
+            progress_callback: Функция (обработано байт, всего байт)
+            
+        Yields:
+            Расшифрованные порции
+            
+        Raises:
+            ValueError: Файл не в потоковом формате, поврежден или обрезан
+        """
+        with open(input_file, 'rb') as src:
+            header = src.read(FILE_HEADER.size)
+            if len(header) < FILE_HEADER.size or header[:len(FILE_MAGIC)] != FILE_MAGIC:
+                raise ValueError("файл не в потоковом формате")
+            
+            _, version, chunk_size = FILE_HEADER.unpack(header)
+            if version != FILE_FORMAT_VERSION:
+                raise ValueError(f"неизвестная версия формата {version}")
+            
+            total = os.fstat(src.fileno()).st_size
+            sealed_size = RECORD_NONCE_SIZE + chunk_size + FILE_TAG_SIZE
+            processed = len(header)
+            
+            chunks = _iter_file_chunks(src, sealed_size, offset=len(header))
+            for index, (sealed, final) in enumerate(chunks):
+                if len(sealed) < RECORD_NONCE_SIZE + FILE_TAG_SIZE:
+                    break
+                aad = header + FILE_CHUNK_AAD.pack(index, final)
+                nonce = sealed[:RECORD_NONCE_SIZE]
+                try:
+                    chunk = self.file_cipher.decrypt(nonce, sealed[RECORD_NONCE_SIZE:], aad)
+                except InvalidTag:
+                    raise ValueError(f"порция {index} повреждена или неверный пароль")
+                
+                processed += len(sealed)
+                if progress_callback:
+                    progress_callback(processed, total)
+                metrics.inc("file_bytes_decrypted_total", len(chunk))
+                yield chunk
+            
+            if processed != total or total == len(header):
+                raise ValueError("файл обрезан")
+    
+    def decrypt_file(self, input_file: str, output_file: str,
+                     progress_callback: Optional[Callable[[int, int], None]] = None):
         """
         Дешифрование файла
         
+        Файлы потокового формата расшифровываются порциями; файлы, зашифрованные
+        прежней версией программы (один токен Fernet), читаются целиком.
+        При ошибке частично записанный результат удаляется.
+        
         Args:
             input_file: Путь к зашифрованному файлу
             output_file: Путь к расшифрованному файлу
+            progress_callback: Функция (обработано байт, всего байт)
         """
         try:
-            with open(input_file, 'rb') as f:
-                encrypted_data = f.read()
-            
-            decrypted_data = self.cipher.decrypt(encrypted_data)
+            with open(input_file, 'rb') as src:
+                header = src.read(FILE_HEADER.size)
+                if len(header) < FILE_HEADER.size or header[:len(FILE_MAGIC)] != FILE_MAGIC:
+                    src.seek(0)
+                    decrypted_data = self.cipher.decrypt(src.read())
+                    with open(output_file, 'wb') as f:
+                        f.write(decrypted_data)
+                    return
             
-            with open(output_file, 'wb') as f:
-                f.write(decrypted_data)
+            with open(output_file, 'wb') as dst:
+                for chunk in self.iter_decrypted_file(input_file, progress_callback):
+                    dst.write(chunk)
         except Exception as e:
+            if os.path.exists(output_file):
+                os.remove(output_file)
             raise ValueError(f"Ошибка дешифрования файла: {str(e)}")
 
 
+class EncryptedFileWriter:
+    """
+    Запись файла потокового формата по частям
+    
+    Последняя порция помечается при закрытии, поэтому одна полная порция
+    держится в буфере до поступления следующих данных.
+    """
+    
+    def __init__(self, encryption: PersonalDataEncryption, dst, chunk_size: int = DEFAULT_FILE_CHUNK_SIZE):
+        """
+        Args:
+            encryption: Шифратор с ключом файла
+            dst: Открытый двоичный файл для записи
+            chunk_size: Размер порции открытых данных
+        """
+        self._encryption = encryption
+        self._dst = dst
+        self._chunk_size = chunk_size
+        self._header = FILE_HEADER.pack(FILE_MAGIC, FILE_FORMAT_VERSION, chunk_size)
+        self._buffer = bytearray()
+        self._index = 0
+        self._closed = False
+        dst.write(self._header)
+    
+    def write(self, data: bytes):
+        """Добавление данных; полные порции шифруются и записываются сразу"""
+        self._buffer += data
+        # Порция записывается, только когда известно, что она не последняя
+        while len(self._buffer) > self._chunk_size:
+            chunk = bytes(self._buffer[:self._chunk_size])
+            del self._buffer[:self._chunk_size]
+            self._dst.write(self._encryption._seal_file_chunk(self._header, self._index, chunk, False))
+            self._index += 1
+    
+    def close(self):
+        """Запись последней порции (файл dst не закрывается)"""
+        if self._closed:
+            return
+        self._closed = True
+        self._dst.write(self._encryption._seal_file_chunk(self._header, self._index, bytes(self._buffer), True))
+        self._buffer = bytearray()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.close()
+
+
 class DataValidator:
     """Класс для валидации персональных данных"""
     
@@ -173,3 +797,21 @@ class DataValidator:
                 return False, f"Отсутствует обязательное поле: {field}"
         
         return True, "Данные валидны"
+    
+    @staticmethod
+    def validate_record(record_type: str, data: dict) -> Tuple[bool, str]:
+        """
+        Валидация данных по типу записи
+        
+        Args:
+            record_type: Тип записи (ученик, учитель, родитель)
+            data: Словарь с данными
+            
+        Returns:
+            Кортеж (успех, сообщение об ошибке)
+        """
+        if record_type == "ученик":
+            return DataValidator.validate_student_data(data)
+        if record_type == "учитель":
+            return DataValidator.validate_teacher_data(data)
+        return True, "Данные валидны"
@@ -0,0 +1,130 @@
+"""
+Межпроцессная блокировка файла базы данных
+
+Блокировка берется на отдельном файле "<база>.lock", а не на самой базе:
+файл базы заменяется целиком (os.replace), и блокировка на нем терялась бы
+при каждой записи. На Linux и macOS используется рекомендательная
+блокировка fcntl.flock, на Windows - msvcrt.locking.
+"""
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+class FileLock:
+    """Исключительная блокировка для записи, повторно входимая в пределах процесса"""
+    
+    def __init__(self, path: str):
+        """
+        Args:
+            path: Путь к файлу блокировки (создается при первом захвате)
+        """
+        self.path = path
+        # Потоки процесса упорядочиваются обычной блокировкой, процессы - блокировкой файла
+        self._thread_lock = threading.RLock()
+        self._depth = 0
+        self._file = None
+    
+    def _acquire_file(self):
+        self._file = open(self.path, "a+b")
+        if fcntl is not None:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+            return
+        while True:
+            try:
+                self._file.seek(0)
+                msvcrt.locking(self._file.fileno(), msvcrt.LK_NBLCK, 1)
+                return
+            except OSError:
+                time.sleep(0.05)
+    
+    def _release_file(self):
+        try:
+            if fcntl is not None:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+            else:
+                self._file.seek(0)
+                msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+        finally:
+            self._file.close()
+            self._file = None
+    
+    def try_acquire(self) -> bool:
+        """
+        Захват блокировки без ожидания; держится до вызова release
+        
+        Returns:
+            False, если блокировку держит другой процесс (или другой
+            объект FileLock того же файла)
+        """
+        with self._thread_lock:
+            if self._depth == 0:
+                self._file = open(self.path, "a+b")
+                try:
+                    if fcntl is not None:
+                        fcntl.flock(self._file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    else:
+                        self._file.seek(0)
+                        msvcrt.locking(self._file.fileno(), msvcrt.LK_NBLCK, 1)
+                except OSError:
+                    self._file.close()
+                    self._file = None
+                    return False
+            self._depth += 1
+            return True
+    
+    def release(self):
+        """Освобождение блокировки, захваченной try_acquire"""
+        with self._thread_lock:
+            self._depth -= 1
+            if self._depth == 0:
+                self._release_file()
+    
+    @contextmanager
+    def exclusive(self):
+        """
+        Захват блокировки на время чтения-изменения-записи базы
+        
+        Вложенные захваты в том же потоке не блокируются.
+        """
+        with self._thread_lock:
+            if self._depth == 0:
+                self._acquire_file()
+            self._depth += 1
+            try:
+                yield
+            finally:
+                self._depth -= 1
+                if self._depth == 0:
+                    self._release_file()
+
+
+def replace_atomically(path: str, write) -> None:
+    """
+    Атомарная запись файла: временный файл, fsync и os.replace
+    
+    Читатели видят либо старую, либо новую версию файла целиком.
+    
+    Args:
+        path: Путь к файлу
+        write: Функция write(f), записывающая содержимое в открытый текстовый файл
+    """
+    tmp_file = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            write(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, path)
+    except BaseException:
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+        raise
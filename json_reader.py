@@ -0,0 +1,254 @@
+"""
+Чтение JSON-базы без загрузки всех записей в память
+
+Файл базы отображается в память (mmap). Границы, ID и типы записей находятся
+одним проходом регулярного выражения, остальные метаданные разбираются только
+для запрошенных записей, а зашифрованные данные декодируются, только когда
+запрошена сама запись.
+
+Быстрый путь рассчитан на формат, в котором базу пишет DatabaseManager
+(json.dump с indent=2: каждый ключ записи на отдельной строке, "id" и "type"
+первыми). Файл в другом формате читается целиком через json.load.
+
+Ключи, которые DatabaseManager пишет после массива записей ("last_id",
+"statistics"), читает read_trailer - с конца файла, не просматривая записи.
+"""
+
+import json
+import mmap
+import os
+import re
+from bisect import bisect_left
+from typing import Dict, List, Optional, Tuple
+
+from metrics import metrics
+from record_index import record_metadata
+
+
+_RECORDS_START = re.compile(rb'\n  "records": \[')
+_RECORD_START = re.compile(rb'\n    \{\n      "id": (-?\d+),\n      "type": ("(?:[^"\\\n]|\\.)*"),\n')
+_ANY_RECORD_START = re.compile(rb'\n    \{')
+_LAST_ID = re.compile(rb'\n  "last_id": (\d+)')
+_ENCRYPTED_DATA = b'\n      "encrypted_data": "'
+_RECORD_END = b'\n    }'
+_RECORDS_END = b'\n  ]'
+_EMPTY_RECORDS = b'\n  "records": []'
+# Начальный размер читаемого конца файла
+_TAIL_SIZE = 64 * 1024
+# Строка "\n    " перед "{" записи
+_INDENT = 5
+
+
+def _string_end(data, quote: int) -> int:
+    """Позиция за закрывающей кавычкой строки JSON, открытой в позиции quote"""
+    position = quote + 1
+    while True:
+        position = data.find(b'"', position)
+        if position < 0:
+            raise ValueError("Незакрытая строка в файле базы")
+        backslashes = 0
+        while data[position - 1 - backslashes] == 0x5C:
+            backslashes += 1
+        if backslashes % 2 == 0:
+            return position + 1
+        position += 1
+
+
+def read_trailer(path: str) -> Dict:
+    """
+    Ключи верхнего уровня, записанные после массива записей
+    
+    Читается только конец файла (он увеличивается, пока в него не попадет
+    конец массива записей).
+    
+    Args:
+        path: Путь к файлу базы
+        
+    Returns:
+        Словарь ключей; пустой, если после записей ничего нет или файл
+        не в формате DatabaseManager
+    """
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        tail_size = _TAIL_SIZE
+        while True:
+            start = max(0, size - tail_size)
+            f.seek(start)
+            tail = f.read()
+            end = tail.rfind(_RECORDS_END)
+            if end >= 0:
+                rest = tail[end + len(_RECORDS_END):]
+                break
+            end = tail.rfind(_EMPTY_RECORDS)
+            if end >= 0:
+                rest = tail[end + len(_EMPTY_RECORDS):]
+                break
+            if start == 0:
+                return {}
+            tail_size *= 4
+    
+    # Остаток имеет вид ',\n  "ключ": значение,...\n}'
+    if not rest.startswith(b","):
+        return {}
+    try:
+        trailer = json.loads(b"{" + rest[1:])
+    except ValueError:
+        return {}
+    return trailer if isinstance(trailer, dict) else {}
+
+
+class JsonDatabaseReader:
+    """Снимок файла JSON-базы с ленивым разбором записей"""
+    
+    def __init__(self, path: str):
+        """
+        Args:
+            path: Путь к файлу базы
+        """
+        with open(path, 'rb') as f:
+            stat = os.fstat(f.fileno())
+            # Версия файла, с которой снят снимок (как у DatabaseManager._signature)
+            self.signature = (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+            if stat.st_size == 0:
+                self._data = b""
+            elif os.name == "nt":
+                # На Windows отображенный файл нельзя заменить через os.replace
+                self._data = f.read()
+            else:
+                # Отображение остается связанным со снимком и после замены файла
+                self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        
+        self._starts: List[int] = []
+        self._ids: List[int] = []
+        self._types: List[str] = []
+        self._last_id = 0
+        # {id: номер записи} и номера записей по возрастанию ID,
+        # если записи в файле идут не по возрастанию ID
+        self._positions: Optional[Dict[int, int]] = None
+        self._order: Optional[List[int]] = None
+        # Разобранные записи, если файл не в формате быстрого пути
+        self._records: Optional[List[Dict]] = None
+        
+        if not self._scan():
+            self._load()
+        
+        if any(a >= b for a, b in zip(self._ids, self._ids[1:])):
+            self._positions = {}
+            for position, record_id in enumerate(self._ids):
+                # При повторяющихся ID действует первая запись
+                self._positions.setdefault(record_id, position)
+            self._order = sorted(self._positions.values(), key=lambda position: self._ids[position])
+    
+    def _scan(self) -> bool:
+        """Поиск границ записей; False, если файл не в формате быстрого пути"""
+        data = self._data
+        match = _RECORDS_START.search(data)
+        if match is None:
+            return False
+        
+        match_start, start = match.span()
+        if data[start:start + 1] == b"]":
+            end = start
+        else:
+            # Массив записей закрывается у конца файла: поиск с конца не просматривает записи
+            end = data.rfind(_RECORDS_END)
+            if end < start:
+                return False
+        
+        types = {}
+        for match in _RECORD_START.finditer(data, start, end):
+            self._starts.append(match.start() + _INDENT)
+            self._ids.append(int(match.group(1)))
+            raw_type = match.group(2)
+            if raw_type not in types:
+                types[raw_type] = json.loads(raw_type)
+            self._types.append(types[raw_type])
+        
+        if len(_ANY_RECORD_START.findall(data, start, end)) != len(self._starts):
+            self._starts, self._ids, self._types = [], [], []
+            return False
+        
+        # "last_id" пишется до или после массива записей
+        match = _LAST_ID.search(data, 0, match_start) or _LAST_ID.search(data, end)
+        self._last_id = int(match.group(1)) if match else 0
+        return True
+    
+    def _load(self):
+        """Полное чтение файла в нестандартном формате"""
+        db = json.loads(self._data[:]) if len(self._data) else {"records": []}
+        self._data = b""
+        self._records = db["records"]
+        self._ids = [record["id"] for record in self._records]
+        self._types = [record["type"] for record in self._records]
+        self._last_id = db.get("last_id", 0)
+    
+    def __len__(self) -> int:
+        return len(self._ids) if self._positions is None else len(self._positions)
+    
+    def max_id(self) -> int:
+        """Наибольший выданный ID (с учетом "last_id")"""
+        if not self._ids:
+            return self._last_id
+        highest = self._ids[-1] if self._positions is None else max(self._ids)
+        return max(self._last_id, highest)
+    
+    def types(self) -> List[str]:
+        """Типы всех записей в порядке файла"""
+        return self._types
+    
+    def _position(self, record_id: int) -> Optional[int]:
+        if self._positions is not None:
+            return self._positions.get(record_id)
+        position = bisect_left(self._ids, record_id)
+        if position < len(self._ids) and self._ids[position] == record_id:
+            return position
+        return None
+    
+    def _span(self, position: int) -> Tuple[int, int]:
+        start = self._starts[position]
+        return start, self._data.find(_RECORD_END, start) + len(_RECORD_END)
+    
+    def metadata(self, position: int) -> Dict:
+        """Метаданные записи с номером position (без зашифрованных данных)"""
+        if self._records is not None:
+            return record_metadata(self._records[position])
+        
+        start, end = self._span(position)
+        data = self._data
+        key = data.find(_ENCRYPTED_DATA, start, end)
+        if key < 0:
+            return record_metadata(json.loads(data[start:end]))
+        
+        # Зашифрованные данные заменяются на null, не попадая в память
+        quote = key + len(_ENCRYPTED_DATA) - 1
+        return record_metadata(json.loads(data[start:quote] + b"null" + data[_string_end(data, quote):end]))
+    
+    def record(self, position: int) -> Dict:
+        """Запись с номером position вместе с зашифрованными данными"""
+        if self._records is not None:
+            return dict(self._records[position])
+        start, end = self._span(position)
+        metrics.inc("db_bytes_read_total", end - start, backend="json")
+        return json.loads(self._data[start:end])
+    
+    def get_record(self, record_id: int) -> Optional[Dict]:
+        """Запись по ID или None"""
+        position = self._position(record_id)
+        return self.record(position) if position is not None else None
+    
+    def get_metadata(self, record_id: int) -> Optional[Dict]:
+        """Метаданные записи по ID или None"""
+        position = self._position(record_id)
+        return self.metadata(position) if position is not None else None
+    
+    def metadata_page(self, offset: int = 0, limit: Optional[int] = None) -> List[Dict]:
+        """
+        Метаданные записей по возрастанию ID
+        
+        Args:
+            offset: Сколько записей пропустить
+            limit: Максимальное количество записей (None - все)
+        """
+        positions = range(len(self._ids)) if self._order is None else self._order
+        end = None if limit is None else offset + limit
+        return [self.metadata(position) for position in positions[offset:end]]
@@ -0,0 +1,343 @@
+"""
+Смена пароля и перешифрование базы новым ключом
+
+Параметры ключей хранятся в файле "<база>.keys.json" рядом с базой: для
+каждого ключа - его отпечаток, случайная соль PBKDF2 и число итераций
+(сами ключи и пароли в файле не хранятся). Базы без этого файла используют
+прежнюю фиксированную соль.
+
+Смена пароля:
+
+1. Создается ключ нового пароля со случайной солью, он становится текущим.
+   Прежний ключ сохраняется в файле ключей зашифрованным новым ключом, поэтому
+   новый пароль открывает все записи, а прежний больше не принимается.
+2. Задание перешифрования (KeyRotationJob) читает записи по возрастанию ID,
+   расшифровывает прежним ключом и шифрует новым в пуле исполнителей
+   (ParallelCipher). После каждого пакета позиция сохраняется в файл
+   "<база>.rotation.json", так что прерванное задание продолжается с места
+   остановки. База все это время доступна для чтения и записи: новые записи
+   сразу шифруются новым ключом, а запись, измененная пользователем во время
+   перешифрования, не перезаписывается (проверка версии).
+3. Когда проход по базе не находит записей прежнего ключа, прежний ключ
+   удаляется из файла ключей, а файл позиции - с диска.
+
+Запуск из командной строки:
+
+    python key_rotation.py encrypted_database.json            # смена пароля
+    python key_rotation.py encrypted_database.json --resume   # продолжение
+"""
+
+import base64
+import json
+import os
+import time
+from datetime import datetime
+from itertools import islice
+from typing import Callable, Dict, List, Optional, Tuple
+
+from cryptography.fernet import Fernet, InvalidToken
+
+from encryption_module import DEFAULT_ITERATIONS, PersonalDataEncryption, record_key_id
+from file_lock import replace_atomically
+from parallel_cipher import ParallelCipher
+
+
+KEYRING_SUFFIX = ".keys.json"
+CHECKPOINT_SUFFIX = ".rotation.json"
+SALT_SIZE = 16
+DEFAULT_BATCH_SIZE = 500
+REWRITES_PER_PASS = 20
+
+
+def keyring_path(db_path: str) -> str:
+    """Путь к файлу ключей базы"""
+    return db_path.rstrip("/\\") + KEYRING_SUFFIX
+
+
+def checkpoint_path(db_path: str) -> str:
+    """Путь к файлу позиции задания перешифрования"""
+    return db_path.rstrip("/\\") + CHECKPOINT_SUFFIX
+
+
+def _write_json(path: str, data: Dict):
+    replace_atomically(path, lambda f: json.dump(data, f, ensure_ascii=False, indent=2))
+
+
+class Keyring:
+    """Файл параметров ключей базы"""
+    
+    def __init__(self, path: str):
+        """
+        Args:
+            path: Путь к файлу ключей (см. keyring_path)
+        """
+        self.path = path
+        self.data: Optional[Dict] = None
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                self.data = json.load(f)
+    
+    @classmethod
+    def for_database(cls, db_path: str) -> 'Keyring':
+        """Файл ключей базы по пути к базе"""
+        return cls(keyring_path(db_path))
+    
+    @property
+    def rotating(self) -> bool:
+        """Есть прежние ключи, записи которых еще не перешифрованы"""
+        return bool(self.data and self.data.get("wrapped"))
+    
+    def unlock(self, password: str) -> PersonalDataEncryption:
+        """
+        Шифратор базы по паролю
+        
+        Выполняет PBKDF2, поэтому вызывается в фоне.
+        
+        Args:
+            password: Пароль базы
+            
+        Returns:
+            Шифратор с текущим ключом; прежние ключи незавершенной смены
+            пароля добавлены для чтения
+            
+        Raises:
+            ValueError: Пароль не соответствует текущему ключу базы
+        """
+        if not self.data:
+            return PersonalDataEncryption(password)
+        
+        active = self.data["keys"][self.data["active"]]
+        encryption = PersonalDataEncryption(password, base64.b64decode(active["salt"]), active["iterations"])
+        if encryption.key_fingerprint != self.data["active"]:
+            raise ValueError("Неверный пароль")
+        
+        wrapper = Fernet(encryption.key)
+        for key_id, token in self.data.get("wrapped", {}).items():
+            try:
+                encryption.add_decryption_key(wrapper.decrypt(token.encode("ascii")))
+            except InvalidToken:
+                raise ValueError(f"Прежний ключ {key_id} поврежден")
+        return encryption
+    
+    def begin_rotation(self, current: PersonalDataEncryption, new_password: str,
+                       iterations: int = DEFAULT_ITERATIONS) -> PersonalDataEncryption:
+        """
+        Смена текущего ключа на ключ нового пароля
+        
+        Прежние ключи (текущий и еще не выведенные из оборота) сохраняются
+        зашифрованными новым ключом. Файл ключей заменяется атомарно.
+        
+        Args:
+            current: Шифратор с текущим ключом базы
+            new_password: Новый пароль
+            iterations: Число итераций PBKDF2 для нового ключа
+            
+        Returns:
+            Шифратор с новым ключом, читающий записи прежних ключей
+        """
+        salt = os.urandom(SALT_SIZE)
+        new = PersonalDataEncryption(new_password, salt, iterations)
+        now = datetime.now().isoformat()
+        
+        data = self.data or {"keys": {}}
+        keys = dict(data["keys"])
+        if current.key_fingerprint not in keys:
+            # База без файла ключей: текущий ключ выведен с фиксированной солью
+            keys[current.key_fingerprint] = {
+                "salt": base64.b64encode(current.salt).decode("ascii") if current.salt else None,
+                "iterations": current.iterations,
+                "created_at": None
+            }
+        keys[current.key_fingerprint]["retired_at"] = now
+        keys[new.key_fingerprint] = {
+            "salt": base64.b64encode(salt).decode("ascii"),
+            "iterations": iterations,
+            "created_at": now
+        }
+        
+        wrapper = Fernet(new.key)
+        wrapped = {}
+        for key in [current.key] + current.previous_keys:
+            old = PersonalDataEncryption.from_key(key)
+            wrapped[old.key_fingerprint] = wrapper.encrypt(key).decode("ascii")
+            new.add_decryption_key(key)
+        
+        self.data = {"active": new.key_fingerprint, "keys": keys, "wrapped": wrapped}
+        _write_json(self.path, self.data)
+        return new
+    
+    def finish_rotation(self):
+        """Удаление прежних ключей после перешифрования всех записей"""
+        if self.rotating:
+            self.data["wrapped"] = {}
+            _write_json(self.path, self.data)
+
+
+class KeyRotationJob:
+    """Возобновляемое перешифрование записей текущим ключом"""
+    
+    def __init__(self, db_manager, db_path: str, encryption: PersonalDataEncryption,
+                 batch_size: int = DEFAULT_BATCH_SIZE, max_workers: Optional[int] = None):
+        """
+        Args:
+            db_manager: Хранилище (любая реализация BaseDatabaseManager)
+            db_path: Путь к базе (рядом хранятся файлы ключей и позиции)
+            encryption: Шифратор с новым ключом и прежними ключами для чтения
+                (результат Keyring.unlock или Keyring.begin_rotation)
+            batch_size: Записей в одном пакете; позиция сохраняется после каждого пакета
+            max_workers: Количество потоков шифрования (по умолчанию - число ядер)
+        """
+        self.db_manager = db_manager
+        self.db_path = db_path
+        self.encryption = encryption
+        self.batch_size = batch_size
+        self.max_workers = max_workers
+        self.checkpoint_path = checkpoint_path(db_path)
+    
+    def load_checkpoint(self) -> Dict:
+        """
+        Сохраненная позиция задания или начальная позиция
+        
+        Raises:
+            ValueError: Позиция сохранена заданием для другого ключа
+        """
+        if os.path.exists(self.checkpoint_path):
+            with open(self.checkpoint_path, "r", encoding="utf-8") as f:
+                checkpoint = json.load(f)
+            if checkpoint["key_id"] != self.encryption.key_fingerprint:
+                raise ValueError("Сохраненная позиция относится к другому ключу")
+            return checkpoint
+        return {"key_id": self.encryption.key_fingerprint, "pass": 1, "last_id": 0,
+                "processed": 0, "rotated": 0, "changed_in_pass": 0,
+                "started_at": datetime.now().isoformat()}
+    
+    def _stale(self, record: Optional[Dict]) -> bool:
+        """Запись зашифрована не текущим ключом"""
+        return record is not None and record_key_id(record["encrypted_data"]) != self.encryption.key_fingerprint
+    
+    def _rotate_batch(self, cipher: ParallelCipher, ids: List[int]) -> Tuple[int, int]:
+        """
+        Перешифрование пакета
+        
+        Returns:
+            Кортеж (перешифровано, пропущено из-за одновременного изменения)
+        """
+        records = [record for record in map(self.db_manager.get_record, ids) if self._stale(record)]
+        if not records:
+            return 0, 0
+        
+        reencrypted = cipher.map_reencrypt(records, self.encryption, binary=self.db_manager.supports_binary)
+        # Версия, прочитанная до перешифрования: измененные за это время записи пропускаются
+        updates = [(record["id"], record["encrypted_data"], record.get("description", ""),
+                    record.get("blind_index", {}), record.get("version", 1))
+                   for record in reencrypted]
+        rotated = self.db_manager.update_records(updates)
+        return rotated, len(updates) - rotated
+    
+    def run(self, progress: Optional[Callable] = None, check_cancelled: Optional[Callable] = None) -> Dict:
+        """
+        Перешифрование до тех пор, пока в базе есть записи прежних ключей
+        
+        Первый проход перешифровывает записи, следующий проверяет, что их не
+        осталось (записи могли быть добавлены или изменены прежним ключом
+        другим процессом). Задание можно прервать и запустить снова.
+        
+        Args:
+            progress: Функция progress(fraction, stats); stats - словарь
+                pass, processed, total, rotated, records_per_second, eta_seconds
+            check_cancelled: Функция, прерывающая задание исключением
+            
+        Returns:
+            Словарь: passes, rotated, seconds, records_per_second
+        """
+        checkpoint = self.load_checkpoint()
+        started = time.perf_counter()
+        processed_now = 0
+        
+        with ParallelCipher(self.encryption, self.max_workers) as cipher:
+            while True:
+                ids = sorted(meta["id"] for meta in self.db_manager.get_records_metadata()
+                             if meta["id"] > checkpoint["last_id"])
+                total = checkpoint["processed"] + len(ids)
+                remaining = iter(ids)
+                batch_size = self.batch_size
+                if self.db_manager.commit_rewrites_file:
+                    # JSON-файл переписывается целиком при каждом пакете: не больше
+                    # REWRITES_PER_PASS перезаписей за проход
+                    batch_size = max(batch_size, -(-len(ids) // REWRITES_PER_PASS))
+                
+                for batch in iter(lambda: list(islice(remaining, batch_size)), []):
+                    if check_cancelled:
+                        check_cancelled()
+                    rotated, skipped = self._rotate_batch(cipher, batch)
+                    checkpoint["last_id"] = batch[-1]
+                    checkpoint["processed"] += len(batch)
+                    checkpoint["rotated"] += rotated
+                    checkpoint["changed_in_pass"] += rotated + skipped
+                    _write_json(self.checkpoint_path, checkpoint)
+                    
+                    processed_now += len(batch)
+                    if progress:
+                        elapsed = time.perf_counter() - started
+                        rate = processed_now / elapsed if elapsed > 0 else 0.0
+                        left = total - checkpoint["processed"]
+                        progress(checkpoint["processed"] / total, {
+                            "pass": checkpoint["pass"],
+                            "processed": checkpoint["processed"],
+                            "total": total,
+                            "rotated": checkpoint["rotated"],
+                            "records_per_second": rate,
+                            "eta_seconds": left / rate if rate > 0 else None
+                        })
+                
+                if not checkpoint["changed_in_pass"]:
+                    break
+                checkpoint.update({"pass": checkpoint["pass"] + 1, "last_id": 0,
+                                   "processed": 0, "changed_in_pass": 0})
+                _write_json(self.checkpoint_path, checkpoint)
+        
+        Keyring.for_database(self.db_path).finish_rotation()
+        if os.path.exists(self.checkpoint_path):
+            os.remove(self.checkpoint_path)
+        
+        elapsed = time.perf_counter() - started
+        return {"passes": checkpoint["pass"], "rotated": checkpoint["rotated"], "seconds": elapsed,
+                "records_per_second": processed_now / elapsed if elapsed > 0 else 0.0}
+
+
+if __name__ == "__main__":
+    import argparse
+    import getpass
+    from database_manager import open_database
+    
+    parser = argparse.ArgumentParser(description="Смена пароля и перешифрование базы новым ключом")
+    parser.add_argument("database", nargs="?", default="encrypted_database.json", help="Путь к базе данных")
+    parser.add_argument("--resume", action="store_true", help="Продолжить прерванное перешифрование")
+    parser.add_argument("--backend", choices=("json", "log", "sqlite"), help="Тип хранилища")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="Записей в одном пакете")
+    parser.add_argument("--workers", type=int, help="Потоков шифрования")
+    args = parser.parse_args()
+    
+    keyring = Keyring.for_database(args.database)
+    if args.resume:
+        encryption = keyring.unlock(getpass.getpass("Новый пароль: "))
+    else:
+        if os.path.exists(checkpoint_path(args.database)):
+            parser.error("Смена пароля не завершена, запустите с --resume")
+        current = keyring.unlock(getpass.getpass("Текущий пароль: "))
+        new_password = getpass.getpass("Новый пароль: ")
+        if new_password != getpass.getpass("Повторите новый пароль: "):
+            parser.error("Пароли не совпадают")
+        encryption = keyring.begin_rotation(current, new_password)
+    
+    def show_progress(fraction, stats):
+        eta = f"{stats['eta_seconds']:.0f} с" if stats["eta_seconds"] is not None else "-"
+        print(f"\rпроход {stats['pass']}: {fraction:.0%}  перешифровано: {stats['rotated']}  "
+              f"{stats['records_per_second']:.0f} записей/с  осталось: {eta}", end="", flush=True)
+    
+    with open_database(args.database, args.backend) as manager:
+        job = KeyRotationJob(manager, args.database, encryption, args.batch_size, args.workers)
+        result = job.run(show_progress)
+    
+    print()
+    print(f"Перешифровано записей: {result['rotated']} за {result['seconds']:.1f} с")
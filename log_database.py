@@ -0,0 +1,622 @@
+"""
+Журнальное (append-only) хранилище зашифрованных персональных данных
+
+Каждая операция записи добавляет в конец активного сегмента один кадр:
+новая версия записи или "надгробие" при удалении. Индекс смещений
+строится в памяти при открытии, старые версии удаляются уплотнением.
+"""
+
+import json
+import os
+import struct
+import threading
+import zlib
+from datetime import datetime
+from typing import Iterable, List, Dict, Optional, Sequence, Tuple, Union
+
+from database_manager import BaseDatabaseManager, renumber_duplicate_ids
+from file_lock import FileLock
+from metrics import metrics
+from record_index import MetadataIndex
+
+
+# Заголовок кадра: сигнатура, тип операции, длина метаданных, длина данных, CRC32
+FRAME_HEADER = struct.Struct('>2sBIII')
+FRAME_MAGIC = b'PD'
+
+OP_PUT = 1
+OP_DELETE = 2
+OP_META = 3
+
+SEGMENT_SUFFIX = ".seg"
+# Файл блокировки каталога хранилища (см. LogDatabaseManager.__init__)
+LOCK_FILE = "LOCK"
+
+
+def _segment_name(number: int) -> str:
+    return f"{number:08d}{SEGMENT_SUFFIX}"
+
+
+def _encode_frame(op: int, meta: Dict, blob: bytes = b"") -> bytes:
+    """
+    Формирование кадра журнала
+    
+    Args:
+        op: Тип операции
+        meta: Метаданные кадра (сериализуются в JSON)
+        blob: Зашифрованные данные записи
+        
+    Returns:
+        Байты кадра вместе с заголовком
+    """
+    meta_bytes = json.dumps(meta, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    crc = zlib.crc32(blob, zlib.crc32(meta_bytes))
+    return FRAME_HEADER.pack(FRAME_MAGIC, op, len(meta_bytes), len(blob), crc) + meta_bytes + blob
+
+
+def _read_frames(path: str):
+    """
+    Последовательное чтение кадров сегмента
+    
+    Yields:
+        Кортежи (смещение, длина кадра, операция, метаданные, данные)
+        
+    Чтение останавливается на первом неполном или повреждённом кадре;
+    его смещение доступно через исключение StopIteration.value.
+    """
+    with open(path, 'rb') as f:
+        offset = 0
+        while True:
+            header = f.read(FRAME_HEADER.size)
+            if len(header) < FRAME_HEADER.size:
+                return offset
+            
+            magic, op, meta_len, blob_len, crc = FRAME_HEADER.unpack(header)
+            if magic != FRAME_MAGIC:
+                return offset
+            
+            body = f.read(meta_len + blob_len)
+            if len(body) < meta_len + blob_len or zlib.crc32(body) != crc:
+                return offset
+            
+            meta = json.loads(body[:meta_len].decode('utf-8'))
+            length = FRAME_HEADER.size + meta_len + blob_len
+            yield offset, length, op, meta, body[meta_len:]
+            offset += length
+
+
+class LogDatabaseManager(BaseDatabaseManager):
+    """Журнальное хранилище записей с индексом смещений в памяти"""
+    
+    supports_binary = True
+    
+    def __init__(self, db_dir: str = "encrypted_database.log",
+                 max_segment_bytes: int = 4 * 1024 * 1024, fsync: bool = True):
+        """
+        Инициализация хранилища
+        
+        Args:
+            db_dir: Каталог с сегментами журнала
+            max_segment_bytes: Размер сегмента, после которого начинается новый
+            fsync: Сбрасывать ли каждую запись на диск
+        """
+        self.db_dir = db_dir
+        self.max_segment_bytes = max_segment_bytes
+        self.fsync = fsync
+        
+        self._lock = threading.RLock()
+        self._compaction_lock = threading.Lock()
+        # {id: (номер сегмента, смещение кадра, длина кадра)}
+        self._index: Dict[int, Tuple[int, int, int]] = {}
+        # {номер сегмента: [всего байт, байт в актуальных записях]}
+        self._segment_usage: Dict[int, List[int]] = {}
+        # Индекс по открытым метаданным актуальных версий записей
+        self._metadata = MetadataIndex()
+        self._last_id = 0
+        self._active_number = 0
+        self._active_file = None
+        self._compaction_thread = None
+        self._compaction_stop = threading.Event()
+        
+        os.makedirs(self.db_dir, exist_ok=True)
+        # Индекс смещений живет в памяти одного процесса, а уплотнение удаляет
+        # сегменты: второй процесс читал бы удаленные сегменты и дописывал
+        # кадры, которых нет в индексе первого. Каталог занимается целиком
+        # на все время работы с хранилищем
+        self._dir_lock = FileLock(os.path.join(self.db_dir, LOCK_FILE))
+        if not self._dir_lock.try_acquire():
+            raise ValueError(f"Хранилище {self.db_dir} уже открыто другим процессом")
+        try:
+            self._open()
+        except BaseException:
+            self._dir_lock.release()
+            self._dir_lock = None
+            raise
+    
+    def _segment_path(self, number: int) -> str:
+        return os.path.join(self.db_dir, _segment_name(number))
+    
+    def _list_segments(self) -> List[int]:
+        numbers = []
+        for name in os.listdir(self.db_dir):
+            if name.endswith(SEGMENT_SUFFIX) and name[:-len(SEGMENT_SUFFIX)].isdigit():
+                numbers.append(int(name[:-len(SEGMENT_SUFFIX)]))
+        return sorted(numbers)
+    
+    def _open(self):
+        """Восстановление индекса по всем сегментам журнала"""
+        segments = self._list_segments()
+        # Метаданные актуальных версий: индекс строится один раз после чтения
+        live = {}
+        
+        for number in segments:
+            path = self._segment_path(number)
+            frames = _read_frames(path)
+            self._segment_usage[number] = [0, 0]
+            
+            while True:
+                try:
+                    offset, length, op, meta, _ = next(frames)
+                except StopIteration as stop:
+                    valid_size = stop.value
+                    break
+                self._apply_frame(number, offset, length, op, meta)
+                if op == OP_PUT:
+                    live[meta["id"]] = meta
+                elif op == OP_DELETE:
+                    live.pop(meta["id"], None)
+            
+            if valid_size < os.path.getsize(path):
+                if number != segments[-1]:
+                    raise ValueError(f"Повреждён сегмент журнала: {path}")
+                # Обрыв записи в конце активного сегмента: отбрасываем хвост
+                with open(path, 'r+b') as f:
+                    f.truncate(valid_size)
+            
+            self._segment_usage[number][0] = valid_size
+        
+        self._metadata.rebuild(live.values())
+        self._active_number = segments[-1] if segments else 1
+        self._open_active()
+    
+    def _apply_frame(self, number: int, offset: int, length: int, op: int, meta: Dict):
+        """Применение кадра к индексу в памяти"""
+        if op == OP_META:
+            self._last_id = max(self._last_id, meta.get("last_id", 0))
+            return
+        
+        record_id = meta["id"]
+        self._last_id = max(self._last_id, record_id)
+        self._release(record_id)
+        
+        if op == OP_PUT:
+            self._index[record_id] = (number, offset, length)
+            self._segment_usage.setdefault(number, [0, 0])[1] += length
+        elif op == OP_DELETE:
+            self._index.pop(record_id, None)
+    
+    def _release(self, record_id: int):
+        """Учёт устаревшей версии записи как мусора"""
+        location = self._index.get(record_id)
+        if location:
+            number, _, length = location
+            self._segment_usage[number][1] -= length
+    
+    def _open_active(self):
+        self._active_file = open(self._segment_path(self._active_number), 'ab')
+        self._segment_usage.setdefault(self._active_number, [0, 0])
+        self._segment_usage[self._active_number][0] = self._active_file.tell()
+    
+    def _rotate(self):
+        """Закрытие активного сегмента и начало нового"""
+        self._sync()
+        self._active_file.close()
+        self._active_number += 1
+        self._open_active()
+    
+    def _sync(self):
+        """Сброс буфера активного сегмента на диск"""
+        self._active_file.flush()
+        if self.fsync:
+            with metrics.timer("db_sync_seconds", backend="log"):
+                os.fsync(self._active_file.fileno())
+    
+    def _append(self, frame: bytes, sync: bool = True) -> Tuple[int, int, int]:
+        """
+        Добавление кадра в конец активного сегмента
+        
+        Args:
+            frame: Байты кадра
+            sync: Сразу сбросить кадр на диск (False для пакетной записи)
+            
+        Returns:
+            Положение кадра (номер сегмента, смещение, длина)
+        """
+        if self._segment_usage[self._active_number][0] >= self.max_segment_bytes:
+            self._rotate()
+        
+        offset = self._segment_usage[self._active_number][0]
+        self._active_file.write(frame)
+        metrics.inc("db_bytes_written_total", len(frame), backend="log")
+        if sync:
+            self._sync()
+        
+        self._segment_usage[self._active_number][0] += len(frame)
+        return self._active_number, offset, len(frame)
+    
+    def _read_record(self, location: Tuple[int, int, int]) -> Dict:
+        number, offset, length = location
+        with open(self._segment_path(number), 'rb') as f:
+            f.seek(offset)
+            data = f.read(length)
+        metrics.inc("db_bytes_read_total", length, backend="log")
+        
+        _, _, meta_len, _, _ = FRAME_HEADER.unpack_from(data)
+        start = FRAME_HEADER.size
+        record = json.loads(data[start:start + meta_len].decode('utf-8'))
+        blob = data[start + meta_len:]
+        record["encrypted_data"] = blob if record.pop("binary", False) else blob.decode('utf-8')
+        return record
+    
+    def _put(self, record: Dict, sync: bool = True):
+        meta = {k: v for k, v in record.items() if k != "encrypted_data"}
+        blob = record["encrypted_data"]
+        if isinstance(blob, str):
+            blob = blob.encode('utf-8')
+        else:
+            # Двоичные записи хранятся как есть, без base64
+            meta["binary"] = True
+        frame = _encode_frame(OP_PUT, meta, bytes(blob))
+        location = self._append(frame, sync)
+        
+        self._release(record["id"])
+        self._index[record["id"]] = location
+        self._segment_usage[location[0]][1] += location[2]
+        self._metadata.add(meta)
+    
+    def add_record(self, encrypted_data: Union[str, bytes], record_type: str, description: str = "",
+                   blind_index: Optional[Dict[str, str]] = None) -> int:
+        """
+        Добавление записи в базу данных
+        
+        Args:
+            encrypted_data: Зашифрованные данные
+            record_type: Тип записи (ученик, учитель, родитель)
+            description: Описание записи
+            blind_index: Слепые индексы полей {поле: индекс}
+        """
+        with self._lock:
+            self._last_id += 1
+            now = datetime.now().isoformat()
+            record = {
+                "id": self._last_id,
+                "type": record_type,
+                "description": description,
+                "encrypted_data": encrypted_data,
+                "created_at": now,
+                "updated_at": now,
+                "version": 1
+            }
+            if blind_index:
+                record["blind_index"] = dict(blind_index)
+            self._put(record)
+            return record["id"]
+    
+    def add_records(self, records: Iterable[Sequence]) -> List[int]:
+        """
+        Пакетное добавление записей с одним fsync на весь пакет
+        
+        Args:
+            records: Итерируемый набор кортежей
+                (encrypted_data, record_type[, description[, blind_index]]); читается потоково
+                
+        Returns:
+            Список ID добавленных записей
+        """
+        added_ids = []
+        with self._lock:
+            for encrypted_data, record_type, *rest in records:
+                description, blind_index = self._optional_fields(rest)
+                self._last_id += 1
+                now = datetime.now().isoformat()
+                record = {
+                    "id": self._last_id,
+                    "type": record_type,
+                    "description": description,
+                    "encrypted_data": encrypted_data,
+                    "created_at": now,
+                    "updated_at": now,
+                    "version": 1
+                }
+                if blind_index:
+                    record["blind_index"] = dict(blind_index)
+                self._put(record, sync=False)
+                added_ids.append(self._last_id)
+            self._sync()
+        return added_ids
+    
+    def peek_next_id(self) -> int:
+        """ID, который получит следующая добавленная запись"""
+        with self._lock:
+            return self._last_id + 1
+    
+    def get_all_records(self) -> List[Dict]:
+        """
+        Получение всех записей из базы данных
+        
+        Returns:
+            Список записей (без расшифровки)
+        """
+        with self._lock:
+            return [self._read_record(location) for location in self._index.values()]
+    
+    def get_record(self, record_id: int) -> Optional[Dict]:
+        """
+        Получение конкретной записи по ID
+        
+        Args:
+            record_id: ID записи
+            
+        Returns:
+            Запись или None, если не найдена
+        """
+        with self._lock, metrics.timer("db_get_record_seconds", backend="log"):
+            location = self._index.get(record_id)
+            return self._read_record(location) if location else None
+    
+    def delete_record(self, record_id: int) -> bool:
+        """
+        Удаление записи из базы данных
+        
+        Args:
+            record_id: ID записи для удаления
+            
+        Returns:
+            True, если запись удалена, False если не найдена
+        """
+        with self._lock:
+            if record_id not in self._index:
+                return False
+            
+            self._append(_encode_frame(OP_DELETE, {"id": record_id}))
+            self._release(record_id)
+            del self._index[record_id]
+            self._invalidate_cached(record_id)
+            self._metadata.remove(record_id)
+            return True
+    
+    def update_record(self, record_id: int, encrypted_data: Union[str, bytes], description: str = "",
+                      blind_index: Optional[Dict[str, str]] = None, expected_version: Optional[int] = None):
+        """
+        Обновление записи в базе данных
+        
+        Args:
+            record_id: ID записи
+            encrypted_data: Новые зашифрованные данные
+            description: Новое описание
+            blind_index: Новые слепые индексы (None - оставить прежние)
+            expected_version: Версия записи, на основе которой сделано изменение
+                (None - обновить без проверки)
+                
+        Raises:
+            ConcurrentModificationError: Запись изменена или удалена после чтения
+        """
+        with self._lock:
+            location = self._index.get(record_id)
+            if not location:
+                self._check_version(record_id, None, expected_version)
+                return
+            
+            record = self._read_record(location)
+            self._check_version(record_id, record.get("version", 1), expected_version)
+            self._apply_update(record, encrypted_data, description, blind_index)
+            self._put(record)
+            self._invalidate_cached(record_id)
+    
+    def update_records(self, updates: Iterable[Sequence]) -> int:
+        """
+        Пакетное обновление записей с одним fsync на весь пакет
+        
+        Args:
+            updates: Итерируемый набор кортежей
+                (record_id, encrypted_data, description[, blind_index[, expected_version]]).
+                Запись, версия которой не совпадает с expected_version, пропускается
+                
+        Returns:
+            Количество обновленных записей
+        """
+        count = 0
+        with self._lock:
+            for record_id, encrypted_data, description, *rest in updates:
+                location = self._index.get(record_id)
+                if not location:
+                    continue
+                record = self._read_record(location)
+                if len(rest) > 1 and rest[1] is not None and record.get("version", 1) != rest[1]:
+                    continue
+                self._apply_update(record, encrypted_data, description, rest[0] if rest else None)
+                self._put(record, sync=False)
+                self._invalidate_cached(record_id)
+                count += 1
+            self._sync()
+        return count
+    
+    def metadata_index(self) -> MetadataIndex:
+        """Индекс по метаданным, поддерживаемый при каждой записи в журнал"""
+        return self._metadata
+    
+    def _query(self, method: str, *args) -> List[Dict]:
+        with self._lock:
+            return super()._query(method, *args)
+    
+    def get_statistics(self) -> Dict:
+        """Статистика по индексу метаданных (без чтения сегментов)"""
+        with self._lock:
+            return super().get_statistics()
+    
+    def rebuild_statistics(self) -> Dict:
+        """Пересчет счетчиков статистики по индексу метаданных"""
+        with self._lock:
+            return super().rebuild_statistics()
+    
+    def garbage_ratio(self) -> float:
+        """
+        Доля устаревших данных в закрытых сегментах
+        
+        Returns:
+            Число от 0 до 1
+        """
+        with self._lock:
+            total = live = 0
+            for number, (size, used) in self._segment_usage.items():
+                if number != self._active_number:
+                    total += size
+                    live += used
+            return (total - live) / total if total else 0.0
+    
+    def compact(self):
+        """
+        Уплотнение журнала
+        
+        Актуальные версии записей из закрытых сегментов переписываются в новый
+        сегмент, после чего старые сегменты удаляются. Запись и чтение во время
+        копирования не блокируются: закрытые сегменты неизменяемы.
+        """
+        with self._compaction_lock:
+            self._compact()
+    
+    def _compact(self):
+        with self._lock:
+            # Номер target резервируется между закрытыми сегментами и новым активным,
+            # поэтому при повторном чтении журнала порядок версий сохраняется
+            self._rotate()
+            target = self._active_number
+            self._active_file.close()
+            self._active_number += 1
+            self._open_active()
+            
+            sealed = [n for n in self._segment_usage if n < target]
+            snapshot = {record_id: location for record_id, location in self._index.items()
+                        if location[0] in sealed}
+            last_id = self._last_id
+        
+        target_path = self._segment_path(target)
+        tmp_path = target_path + ".tmp"
+        moved = {}
+        with open(tmp_path, 'wb') as out:
+            frame = _encode_frame(OP_META, {"last_id": last_id})
+            out.write(frame)
+            offset = len(frame)
+            for record_id, location in snapshot.items():
+                number, src_offset, length = location
+                with open(self._segment_path(number), 'rb') as src:
+                    src.seek(src_offset)
+                    out.write(src.read(length))
+                moved[record_id] = (target, offset, length)
+                offset += length
+            out.flush()
+            os.fsync(out.fileno())
+        os.replace(tmp_path, target_path)
+        
+        with self._lock:
+            self._segment_usage[target] = [offset, 0]
+            for record_id, new_location in moved.items():
+                # Запись могла измениться или удалиться во время копирования
+                if self._index.get(record_id) == snapshot[record_id]:
+                    self._release(record_id)
+                    self._index[record_id] = new_location
+                    self._segment_usage[target][1] += new_location[2]
+            
+            # Удаление по возрастанию номеров безопасно при сбое на любом шаге
+            for number in sorted(sealed):
+                os.remove(self._segment_path(number))
+                del self._segment_usage[number]
+    
+    def start_background_compaction(self, interval: float = 60.0, threshold: float = 0.5):
+        """
+        Запуск фонового уплотнения
+        
+        Args:
+            interval: Период проверки в секундах
+            threshold: Доля мусора, при которой запускается уплотнение
+        """
+        if self._compaction_thread and self._compaction_thread.is_alive():
+            return
+        
+        def worker():
+            while not self._compaction_stop.wait(interval):
+                if self.garbage_ratio() >= threshold:
+                    self.compact()
+        
+        self._compaction_stop.clear()
+        self._compaction_thread = threading.Thread(target=worker, name="log-compaction", daemon=True)
+        self._compaction_thread.start()
+    
+    def stop_background_compaction(self):
+        """Остановка фонового уплотнения"""
+        self._compaction_stop.set()
+        if self._compaction_thread:
+            self._compaction_thread.join()
+            self._compaction_thread = None
+    
+    def close(self):
+        """Закрытие хранилища"""
+        self.stop_background_compaction()
+        with self._lock:
+            if self._active_file and not self._active_file.closed:
+                self._active_file.close()
+            if self._dir_lock is not None:
+                self._dir_lock.release()
+                self._dir_lock = None
+    
+    @classmethod
+    def migrate_from_json(cls, json_file: str, db_dir: str = "encrypted_database.log") -> 'LogDatabaseManager':
+        """
+        Однократный перенос записей из JSON-базы в журнальное хранилище
+        
+        Идентификаторы и даты записей сохраняются. Записи с повторяющимся ID
+        (старые базы могли их содержать) получают новые ID, см.
+        renumber_duplicate_ids; пары (прежний ID, новый ID) сохраняются в
+        атрибуте renumbered_ids хранилища.
+        
+        Args:
+            json_file: Путь к файлу encrypted_database.json
+            db_dir: Каталог нового хранилища
+            
+        Returns:
+            Открытое журнальное хранилище
+        """
+        if os.path.isdir(db_dir) and set(os.listdir(db_dir)) - {LOCK_FILE}:
+            raise ValueError(f"Каталог хранилища уже не пуст: {db_dir}")
+        
+        with open(json_file, 'r', encoding='utf-8') as f:
+            db = json.load(f)
+        
+        records, renumbered = renumber_duplicate_ids(db["records"], db.get("last_id", 0))
+        
+        manager = cls(db_dir)
+        with manager._lock:
+            for record in records:
+                manager._put(record, sync=False)
+                manager._last_id = max(manager._last_id, record["id"])
+            # ID записей, удаленных из JSON-базы, не выдаются повторно
+            manager._last_id = max(manager._last_id, db.get("last_id", 0))
+            manager._append(_encode_frame(OP_META, {"last_id": manager._last_id}), sync=False)
+            manager._sync()
+        manager.renumbered_ids = renumbered
+        return manager
+
+
+if __name__ == "__main__":
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Перенос JSON-базы в журнальное хранилище")
+    parser.add_argument("json_file", help="Исходный файл encrypted_database.json")
+    parser.add_argument("db_dir", nargs="?", default="encrypted_database.log",
+                        help="Каталог журнального хранилища")
+    args = parser.parse_args()
+    
+    with LogDatabaseManager.migrate_from_json(args.json_file, args.db_dir) as manager:
+        print(f"Перенесено записей: {len(manager.get_all_records())}")
+        for old_id, new_id in manager.renumbered_ids:
+            print(f"  запись с повторяющимся ID {old_id} получила ID {new_id}")
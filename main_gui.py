@@ -5,13 +5,26 @@
 
 import tkinter as tk
 from tkinter import ttk, messagebox, filedialog, scrolledtext
-from encryption_module import PersonalDataEncryption, DataValidator
+from encryption_module import PersonalDataEncryption, DataValidator, key_cache
 from database_manager import DatabaseManager
 from max_messenger import MaxMessenger, CodeVerification
+from verification_store import RateLimitError
+from task_runner import BackgroundTaskRunner
+from records_view import VirtualRecordsView
+from record_cache import DecryptedRecordCache
+from bulk_import import BulkImporter
+from bulk_export import BulkExporter
+from key_rotation import Keyring, KeyRotationJob, checkpoint_path
+from metrics import format_summary, metrics
 import json
+import os
 from datetime import datetime
 
 
+# Период проверки кэша ключей: просроченные ключи стираются и без новых запросов
+KEY_PURGE_INTERVAL_MS = 60 * 1000
+
+
 class PersonalDataEncryptionApp:
     """Главное окно приложения"""
     
@@ -24,18 +37,61 @@ class PersonalDataEncryptionApp:
         # Инициализация компонентов
         self.encryption = None
         self.db_manager = DatabaseManager()
+        # Недавно расшифрованные записи (ограниченный объем, затираются при смене пароля)
+        self.record_cache = DecryptedRecordCache()
+        self.db_manager.record_cache = self.record_cache
         self.max_messenger = MaxMessenger.load_config()
-        self.code_verification = CodeVerification()
+        # Коды подтверждения: в памяти или в общем файле из конфигурации
+        self.code_verification = CodeVerification.from_config()
+        
+        # Долгие операции (PBKDF2, запись базы, сеть) выполняются в фоне
+        self.task_runner = BackgroundTaskRunner(self.root)
+        self.task_runner.on_state_change = self.update_task_status
+        
+        # Показатели кэша расшифрованных записей выгружаются вместе с метриками
+        metrics.add_collector(self.cache_metrics)
         
         # Создание интерфейса
         self.create_widgets()
         
         # Загрузка статистики
         self.update_statistics()
+        
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+        self.root.after(KEY_PURGE_INTERVAL_MS, self.purge_expired_keys)
+    
+    def purge_expired_keys(self):
+        """Периодическое стирание ключей с истекшим временем жизни"""
+        key_cache.purge_expired()
+        self.root.after(KEY_PURGE_INTERVAL_MS, self.purge_expired_keys)
+    
+    def on_close(self):
+        """Закрытие окна: ключи стираются из памяти процесса"""
+        self.task_runner.shutdown()
+        metrics.remove_collector(self.cache_metrics)
+        self.max_messenger.close()
+        self.code_verification.close()
+        self.record_cache.wipe()
+        key_cache.wipe()
+        self.root.destroy()
     
     def create_widgets(self):
         """Создание элементов интерфейса"""
         
+        # Строка состояния фоновых операций
+        status_frame = ttk.Frame(self.root)
+        status_frame.pack(side=tk.BOTTOM, fill=tk.X, padx=10, pady=(0, 10))
+        
+        self.task_status_label = ttk.Label(status_frame, text="", font=("Arial", 9))
+        self.task_status_label.pack(side=tk.LEFT, padx=5)
+        
+        self.task_cancel_button = ttk.Button(status_frame, text="Отмена",
+                                             command=self.task_runner.cancel_all, state=tk.DISABLED)
+        self.task_cancel_button.pack(side=tk.RIGHT, padx=5)
+        
+        self.task_progress = ttk.Progressbar(status_frame, mode="indeterminate", length=200)
+        self.task_progress.pack(side=tk.RIGHT, padx=5)
+        
         # Создание вкладок
         notebook = ttk.Notebook(self.root)
         notebook.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
@@ -65,7 +121,12 @@ class PersonalDataEncryptionApp:
         notebook.add(messenger_frame, text="Мессенджер MAX")
         self.create_messenger_tab(messenger_frame)
         
-        # Вкладка 6: О программе
+        # Вкладка 6: Диагностика (метрики производительности)
+        diagnostics_frame = ttk.Frame(notebook)
+        notebook.add(diagnostics_frame, text="Диагностика")
+        self.create_diagnostics_tab(diagnostics_frame)
+        
+        # Вкладка 7: О программе
         about_frame = ttk.Frame(notebook)
         notebook.add(about_frame, text="О программе")
         self.create_about_tab(about_frame)
@@ -85,7 +146,13 @@ class PersonalDataEncryptionApp:
         self.password_confirm_entry = ttk.Entry(frame, show="*", width=40, font=("Arial", 10))
         self.password_confirm_entry.pack(pady=5)
         
-        ttk.Button(frame, text="Установить пароль", command=self.set_password).pack(pady=20)
+        self.set_password_button = ttk.Button(frame, text="Установить пароль", command=self.set_password)
+        self.set_password_button.pack(pady=(20, 5))
+        
+        # Смена пароля: введенный пароль становится новым, база перешифровывается в фоне
+        self.change_password_button = ttk.Button(frame, text="Сменить пароль базы",
+                                                 command=self.change_password)
+        self.change_password_button.pack(pady=(0, 20))
         
         self.password_status_label = ttk.Label(frame, text="Пароль не установлен", 
                                                foreground="red", font=("Arial", 9))
@@ -168,6 +235,8 @@ class PersonalDataEncryptionApp:
                   command=self.clear_fields).pack(side=tk.LEFT, padx=5)
         ttk.Button(button_frame, text="Загрузить из файла", 
                   command=self.load_from_file).pack(side=tk.LEFT, padx=5)
+        ttk.Button(button_frame, text="Импорт списка", 
+                  command=self.import_roster).pack(side=tk.LEFT, padx=5)
     
     def create_decrypt_tab(self, parent):
         """Создание вкладки дешифрования"""
@@ -220,23 +289,37 @@ class PersonalDataEncryptionApp:
         self.stats_label = ttk.Label(stats_frame, text="", font=("Arial", 10))
         self.stats_label.pack()
         
+        # Поиск по точному значению зашифрованного поля (слепой индекс)
+        search_frame = ttk.LabelFrame(parent, text="Поиск по зашифрованным полям", padding=10)
+        search_frame.pack(fill=tk.X, padx=10, pady=5)
+        
+        self.search_fields = {
+            "Фамилия": "фамилия",
+            "Дата рождения": "дата_рождения",
+            "Класс": "класс",
+            "Телефон": "телефон"
+        }
+        self.search_field_var = tk.StringVar(value="Фамилия")
+        ttk.Combobox(search_frame, textvariable=self.search_field_var, values=list(self.search_fields),
+                     state="readonly", width=15).pack(side=tk.LEFT, padx=5)
+        self.search_entry = ttk.Entry(search_frame, width=25)
+        self.search_entry.pack(side=tk.LEFT, padx=5)
+        self.search_entry.bind('<Return>', lambda e: self.search_records())
+        ttk.Button(search_frame, text="Найти",
+                  command=self.search_records).pack(side=tk.LEFT, padx=5)
+        ttk.Button(search_frame, text="Показать все",
+                  command=self.refresh_database).pack(side=tk.LEFT, padx=5)
+        self.search_status = ttk.Label(search_frame, text="", font=("Arial", 9))
+        self.search_status.pack(side=tk.LEFT, padx=5)
+        
         # Список записей
         list_frame = ttk.LabelFrame(parent, text="Записи в базе данных", padding=10)
         list_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=5)
         
-        # Таблица записей
+        # Таблица записей: отрисовываются только видимые строки
         columns = ("ID", "Тип", "Описание", "Создано")
-        self.records_tree = ttk.Treeview(list_frame, columns=columns, show="headings", height=15)
-        
-        for col in columns:
-            self.records_tree.heading(col, text=col)
-            self.records_tree.column(col, width=150)
-        
-        scrollbar = ttk.Scrollbar(list_frame, orient=tk.VERTICAL, command=self.records_tree.yview)
-        self.records_tree.configure(yscrollcommand=scrollbar.set)
-        
-        self.records_tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
-        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.records_view = VirtualRecordsView(list_frame, columns, height=15)
+        self.records_view.model.load_page = self.load_records_page
         
         # Кнопки управления
         button_frame = ttk.Frame(parent)
@@ -311,7 +394,8 @@ class PersonalDataEncryptionApp:
 - Нажмите "Сохранить настройки"
 - Проверьте подключение кнопкой "Тест подключения"
 
-Примечание: Если API мессенджера недоступен, сообщения будут сохраняться в файл max_messenger_log.json
+Примечание: Если API мессенджера недоступен, сообщения будут сохраняться в очередь max_messenger_outbox.jsonl
+и будут доставлены после восстановления API
         """
         
         info_widget = scrolledtext.ScrolledText(info_frame, wrap=tk.WORD, height=10, font=("Arial", 9))
@@ -325,7 +409,9 @@ class PersonalDataEncryptionApp:
         chat_id = self.chat_id_entry.get().strip()
         phone = self.phone_entry.get().strip()
         
-        self.max_messenger = MaxMessenger(api_key, chat_id, phone)
+        api_base_url = self.max_messenger.api_base_url
+        self.max_messenger.close()
+        self.max_messenger = MaxMessenger(api_key, chat_id, phone, api_base_url=api_base_url)
         self.max_messenger.save_config()
         
         if self.max_messenger.enabled:
@@ -341,11 +427,80 @@ class PersonalDataEncryptionApp:
             messagebox.showerror("Ошибка", "Сначала настройте мессенджер")
             return
         
-        success, message = self.max_messenger.test_connection()
-        if success:
-            messagebox.showinfo("Успех", f"Подключение успешно: {message}")
+        def on_result(result):
+            success, message = result
+            if success:
+                messagebox.showinfo("Успех", f"Подключение успешно: {message}")
+            else:
+                messagebox.showerror("Ошибка", f"Ошибка подключения: {message}")
+        
+        self.task_runner.submit(
+            lambda task: self.max_messenger.test_connection(),
+            description="Проверка подключения к мессенджеру",
+            on_success=on_result,
+            on_error=lambda e: messagebox.showerror("Ошибка", f"Ошибка подключения: {str(e)}")
+        )
+    
+    def create_diagnostics_tab(self, parent):
+        """Создание вкладки диагностики"""
+        control_frame = ttk.Frame(parent, padding=10)
+        control_frame.pack(fill=tk.X)
+        
+        self.metrics_enabled_var = tk.BooleanVar(value=metrics.enabled)
+        ttk.Checkbutton(control_frame, text="Собирать метрики", variable=self.metrics_enabled_var,
+                        command=self.toggle_metrics).pack(side=tk.LEFT, padx=5)
+        ttk.Button(control_frame, text="Обновить",
+                  command=self.refresh_metrics).pack(side=tk.LEFT, padx=5)
+        ttk.Button(control_frame, text="Сбросить",
+                  command=self.reset_metrics).pack(side=tk.LEFT, padx=5)
+        ttk.Button(control_frame, text="Сохранить в файл",
+                  command=self.save_metrics).pack(side=tk.LEFT, padx=5)
+        
+        self.metrics_text = scrolledtext.ScrolledText(parent, height=25, width=100, font=("Courier", 9))
+        self.metrics_text.pack(fill=tk.BOTH, expand=True, padx=10, pady=(0, 10))
+        self.refresh_metrics()
+    
+    def cache_metrics(self):
+        """Показатели кэша расшифрованных записей для выгрузки метрик"""
+        stats = self.record_cache.stats()
+        return {
+            "record_cache_entries": stats["entries"],
+            "record_cache_bytes": stats["bytes"],
+            "record_cache_hit_ratio": stats["hit_ratio"]
+        }
+    
+    def toggle_metrics(self):
+        """Включение и выключение сбора метрик"""
+        if self.metrics_enabled_var.get():
+            metrics.enable()
         else:
-            messagebox.showerror("Ошибка", f"Ошибка подключения: {message}")
+            metrics.disable()
+        self.refresh_metrics()
+    
+    def refresh_metrics(self):
+        """Отображение текущих метрик"""
+        self.metrics_text.delete("1.0", tk.END)
+        self.metrics_text.insert("1.0", format_summary(metrics.snapshot()))
+    
+    def reset_metrics(self):
+        """Сброс накопленных метрик"""
+        metrics.reset()
+        self.refresh_metrics()
+    
+    def save_metrics(self):
+        """Сохранение метрик в формате Prometheus или JSON"""
+        file_path = filedialog.asksaveasfilename(
+            title="Сохранить метрики",
+            defaultextension=".prom",
+            filetypes=[("Prometheus", "*.prom"), ("JSON", "*.json"), ("Все файлы", "*.*")]
+        )
+        if not file_path:
+            return
+        try:
+            metrics.write(file_path)
+            messagebox.showinfo("Успех", f"Метрики сохранены: {file_path}")
+        except OSError as e:
+            messagebox.showerror("Ошибка", f"Ошибка сохранения метрик: {str(e)}")
     
     def create_about_tab(self, parent):
         """Создание вкладки о программе"""
@@ -409,12 +564,222 @@ class PersonalDataEncryptionApp:
             messagebox.showwarning("Предупреждение", 
                                  "Рекомендуется использовать пароль длиной не менее 8 символов")
         
-        try:
-            self.encryption = PersonalDataEncryption(password)
+        # Вывод ключа (PBKDF2) выполняется в фоне, окно остается отзывчивым
+        self.set_password_button.config(state=tk.DISABLED)
+        self.password_status_label.config(text="Вычисление ключа...", foreground="orange")
+        
+        def on_success(encryption):
+            self.set_password_button.config(state=tk.NORMAL)
+            self.encryption = encryption
+            self.record_cache.wipe()
             self.password_status_label.config(text="Пароль установлен", foreground="green")
             messagebox.showinfo("Успех", "Пароль успешно установлен")
-        except Exception as e:
-            messagebox.showerror("Ошибка", f"Ошибка при установке пароля: {str(e)}")
+            # Прерванная смена пароля продолжается с сохраненной позиции
+            if encryption.previous_keys or os.path.exists(checkpoint_path(self.db_manager.db_file)):
+                self.run_key_rotation(encryption)
+        
+        def on_failure(error=None):
+            self.set_password_button.config(state=tk.NORMAL)
+            self.password_status_label.config(text="Пароль не установлен", foreground="red")
+            if error:
+                messagebox.showerror("Ошибка", f"Ошибка при установке пароля: {str(error)}")
+        
+        # Соль ключа берется из файла ключей базы (если пароль уже меняли)
+        keyring = Keyring.for_database(self.db_manager.db_file)
+        
+        self.task_runner.submit(
+            lambda task: keyring.unlock(password),
+            description="Вычисление ключа шифрования",
+            on_success=on_success,
+            on_error=on_failure,
+            on_cancel=on_failure
+        )
+    
+    def change_password(self):
+        """Смена пароля базы: новый ключ и перешифрование записей в фоне"""
+        if not self.encryption:
+            messagebox.showerror("Ошибка", "Сначала установите текущий пароль")
+            return
+        
+        password = self.password_entry.get()
+        if not password or password != self.password_confirm_entry.get():
+            messagebox.showerror("Ошибка", "Введите новый пароль и его подтверждение")
+            return
+        if len(password) < 8:
+            messagebox.showerror("Ошибка", "Новый пароль должен быть не короче 8 символов")
+            return
+        
+        keyring = Keyring.for_database(self.db_manager.db_file)
+        if keyring.rotating:
+            messagebox.showerror("Ошибка", "Предыдущая смена пароля еще не завершена")
+            return
+        if not messagebox.askyesno("Смена пароля",
+                                   "Все записи будут перешифрованы новым паролем.\n"
+                                   "Прежний пароль перестанет действовать. Продолжить?"):
+            return
+        
+        current = self.encryption
+        self.change_password_button.config(state=tk.DISABLED)
+        
+        def on_changed(encryption):
+            self.change_password_button.config(state=tk.NORMAL)
+            self.encryption = encryption
+            self.record_cache.wipe()
+            self.password_status_label.config(text="Пароль изменен, идет перешифрование",
+                                              foreground="orange")
+            self.run_key_rotation(encryption)
+        
+        def on_failure(error=None):
+            self.change_password_button.config(state=tk.NORMAL)
+            if error:
+                messagebox.showerror("Ошибка", f"Ошибка при смене пароля: {str(error)}")
+        
+        self.task_runner.submit(
+            lambda task: keyring.begin_rotation(current, password),
+            description="Вычисление нового ключа",
+            on_success=on_changed,
+            on_error=on_failure,
+            on_cancel=on_failure
+        )
+    
+    def run_key_rotation(self, encryption):
+        """
+        Перешифрование записей новым ключом в фоне
+        
+        Задание выполняется в отдельной очереди: база остается доступной
+        для чтения и записи. Прерванное задание продолжается при следующем
+        вводе пароля.
+        """
+        job = KeyRotationJob(self.db_manager, self.db_manager.db_file, encryption)
+        
+        def report(task, fraction, stats):
+            text = f"проход {stats['pass']}, {stats['processed']} из {stats['total']}"
+            if stats["eta_seconds"] is not None:
+                text += f", осталось {stats['eta_seconds']:.0f} с"
+            task.report(fraction, text)
+        
+        def run(task):
+            return job.run(progress=lambda fraction, stats: report(task, fraction, stats),
+                           check_cancelled=task.check_cancelled)
+        
+        def on_rotated(result):
+            self.password_status_label.config(text="Пароль установлен", foreground="green")
+            message = f"База перешифрована новым ключом. Записей: {result['rotated']}"
+            self.notify_operation("Смена пароля", "успех", message)
+            self.refresh_database()
+            self.update_statistics()
+        
+        def on_stopped(error=None):
+            self.password_status_label.config(
+                text="Перешифрование не завершено: продолжится при следующем вводе пароля",
+                foreground="orange")
+            if error:
+                messagebox.showerror("Ошибка", f"Ошибка перешифрования: {str(error)}")
+        
+        self.task_runner.submit(
+            run,
+            description="Перешифрование базы",
+            on_success=on_rotated,
+            on_error=on_stopped,
+            on_cancel=on_stopped,
+            lane="rotation"
+        )
+    
+    def ask_verification_code(self, code_entry):
+        """
+        Получение кода подтверждения: из поля ввода или через диалог
+        
+        Args:
+            code_entry: Поле ввода кода на текущей вкладке
+            
+        Returns:
+            Введенный код или None, если диалог закрыт
+        """
+        code_input = code_entry.get().strip()
+        if code_input:
+            return code_input
+        
+        # Показываем диалог для ввода кода
+        code_dialog = tk.Toplevel(self.root)
+        code_dialog.title("Код подтверждения")
+        code_dialog.geometry("400x150")
+        code_dialog.transient(self.root)
+        code_dialog.grab_set()
+        
+        ttk.Label(code_dialog, 
+                 text=f"Код отправлен в мессенджер MAX.\nВведите код подтверждения:",
+                 font=("Arial", 10)).pack(pady=10)
+        
+        dialog_entry = ttk.Entry(code_dialog, width=20, font=("Arial", 12))
+        dialog_entry.pack(pady=5)
+        dialog_entry.focus()
+        
+        result = {"code": None}
+        
+        def confirm_code():
+            result["code"] = dialog_entry.get().strip()
+            code_dialog.destroy()
+        
+        ttk.Button(code_dialog, text="Подтвердить", command=confirm_code).pack(pady=5)
+        code_dialog.bind('<Return>', lambda e: confirm_code())
+        
+        code_dialog.wait_window()
+        return result["code"]
+    
+    def confirm_operation(self, send_code, operation, code_entry, code_status, on_confirmed, record_id=None):
+        """
+        Подтверждение операции кодом из мессенджера
+        
+        Отправка кода выполняется в фоне, ввод и проверка кода - в окне.
+        
+        Args:
+            send_code: Функция отправки кода send_code(code) -> (успех, сообщение)
+            operation: Тип операции (encrypt/decrypt)
+            code_entry: Поле ввода кода
+            code_status: Метка статуса кода
+            on_confirmed: Вызывается после подтверждения
+            record_id: ID записи, к которой привязывается код
+        """
+        if not self.max_messenger.enabled:
+            on_confirmed()
+            return
+        
+        try:
+            issued = self.code_verification.issue_code(operation, record_id)
+        except RateLimitError as e:
+            messagebox.showerror("Ошибка", str(e))
+            return
+        verification_code = issued["code"]
+        
+        def on_sent(result):
+            success, msg = result
+            if success:
+                # Проверяется именно код, выданный для этой операции
+                code_input = self.ask_verification_code(code_entry)
+                is_valid, code_msg = self.code_verification.verify_code(
+                    code_input, operation, record_id=record_id, nonce=issued["nonce"])
+                if not is_valid:
+                    code_status.config(text=code_msg, foreground="red")
+                    messagebox.showerror("Ошибка", f"Неверный код подтверждения: {code_msg}")
+                    return
+                code_status.config(text="Код подтвержден", foreground="green")
+            else:
+                # Если отправка не удалась, но мессенджер настроен, продолжаем с предупреждением
+                if not messagebox.askyesno("Предупреждение", 
+                                           f"Не удалось отправить код в мессенджер: {msg}\nПродолжить без подтверждения?"):
+                    return
+            on_confirmed()
+        
+        self.task_runner.submit(
+            lambda task: send_code(verification_code),
+            description="Отправка кода подтверждения",
+            on_success=on_sent,
+            on_error=lambda e: on_sent((False, str(e)))
+        )
+    
+    def notify_operation(self, operation, status, details):
+        """Постановка уведомления об операции в очередь мессенджера"""
+        self.max_messenger.queue_operation_notification(operation, status, details)
     
     def encrypt_and_save(self):
         """Шифрование данных и сохранение в базу"""
@@ -435,95 +800,54 @@ class PersonalDataEncryptionApp:
         
         # Валидация данных
         data_type = self.data_type_var.get()
-        if data_type == "ученик":
-            is_valid, message = DataValidator.validate_student_data(data)
-        elif data_type == "учитель":
-            is_valid, message = DataValidator.validate_teacher_data(data)
-        else:
-            is_valid, message = True, "Данные валидны"
+        is_valid, message = DataValidator.validate_record(data_type, data)
         
         if not is_valid:
             messagebox.showerror("Ошибка валидации", message)
             return
         
-        try:
-            # Генерация и отправка кода подтверждения
-            verification_code = None
-            if self.max_messenger.enabled:
-                verification_code = self.code_verification.generate_and_store_code("encrypt")
-                record_id = len(self.db_manager.get_all_records()) + 1
-                success, msg = self.max_messenger.send_encryption_code(verification_code, data_type, record_id)
-                
-                if success:
-                    # Запрос кода подтверждения
-                    code_input = self.encrypt_code_entry.get().strip()
-                    if not code_input:
-                        # Показываем диалог для ввода кода
-                        code_dialog = tk.Toplevel(self.root)
-                        code_dialog.title("Код подтверждения")
-                        code_dialog.geometry("400x150")
-                        code_dialog.transient(self.root)
-                        code_dialog.grab_set()
-                        
-                        ttk.Label(code_dialog, 
-                                 text=f"Код отправлен в мессенджер MAX.\nВведите код подтверждения:",
-                                 font=("Arial", 10)).pack(pady=10)
-                        
-                        code_entry = ttk.Entry(code_dialog, width=20, font=("Arial", 12))
-                        code_entry.pack(pady=5)
-                        code_entry.focus()
-                        
-                        result = {"code": None}
-                        
-                        def confirm_code():
-                            result["code"] = code_entry.get().strip()
-                            code_dialog.destroy()
-                        
-                        ttk.Button(code_dialog, text="Подтвердить", command=confirm_code).pack(pady=5)
-                        code_dialog.bind('<Return>', lambda e: confirm_code())
-                        
-                        code_dialog.wait_window()
-                        code_input = result["code"]
-                    
-                    # Проверка кода
-                    is_valid, code_msg = self.code_verification.verify_code(code_input, "encrypt")
-                    if not is_valid:
-                        self.encrypt_code_status.config(text=code_msg, foreground="red")
-                        messagebox.showerror("Ошибка", f"Неверный код подтверждения: {code_msg}")
-                        return
-                    else:
-                        self.encrypt_code_status.config(text="Код подтвержден", foreground="green")
-                else:
-                    # Если отправка не удалась, но мессенджер настроен, продолжаем с предупреждением
-                    if messagebox.askyesno("Предупреждение", 
-                                         f"Не удалось отправить код в мессенджер: {msg}\nПродолжить без подтверждения?"):
-                        pass
-                    else:
-                        return
-            
-            # Шифрование
-            encrypted_data = self.encryption.encrypt_data(data)
-            
-            # Сохранение в базу данных
-            description = f"{data.get('фамилия', '')} {data.get('имя', '')} {data.get('отчество', '')}"
-            record_id = self.db_manager.add_record(encrypted_data, data_type, description.strip())
-            
+        encryption = self.encryption
+        description = f"{data.get('фамилия', '')} {data.get('имя', '')} {data.get('отчество', '')}".strip()
+        
+        def save(task):
+            # Шифрование и сохранение в базу данных вместе со слепыми индексами для поиска
+            encrypted_data = encryption.encrypt_record(data)
+            blind_index = encryption.blind_indexes(data)
+            task.check_cancelled()
+            record_id = self.db_manager.add_record(encrypted_data, data_type, description, blind_index)
+            return self.db_manager.get_metadata(record_id)
+        
+        def on_saved(record):
+            record_id = record["id"]
             # Отправка уведомления об успешном шифровании
-            if self.max_messenger.enabled:
-                self.max_messenger.send_operation_notification(
-                    "Шифрование данных",
-                    "успех",
-                    f"Данные {description} успешно зашифрованы. ID записи: {record_id}"
-                )
+            self.notify_operation(
+                "Шифрование данных",
+                "успех",
+                f"Данные {description} успешно зашифрованы. ID записи: {record_id}"
+            )
             
             messagebox.showinfo("Успех", "Данные успешно зашифрованы и сохранены")
             self.clear_fields()
             self.encrypt_code_entry.delete(0, tk.END)
             self.encrypt_code_status.config(text="", foreground="black")
+            self.records_view.insert(record)
             self.update_statistics()
-            self.refresh_database()
-        except Exception as e:
-            messagebox.showerror("Ошибка", f"Ошибка при шифровании: {str(e)}")
+        
+        def start_save():
+            self.task_runner.submit(
+                save,
+                description="Шифрование и сохранение записи",
+                on_success=on_saved,
+                on_error=lambda e: messagebox.showerror("Ошибка", f"Ошибка при шифровании: {str(e)}"),
+                lane="db"
+            )
+        
+        # Генерация и отправка кода подтверждения
+        self.confirm_operation(
+            lambda code: self.max_messenger.send_encryption_code(
+                code, data_type, self.db_manager.peek_next_id()),
+            "encrypt", self.encrypt_code_entry, self.encrypt_code_status, start_save
+        )
     
     def decrypt_from_database(self):
         """Дешифрование записи из базы данных"""
@@ -533,90 +857,68 @@ class PersonalDataEncryptionApp:
         
         try:
             record_id = int(self.record_id_entry.get())
-            record = self.db_manager.get_record(record_id)
-            
-            if not record:
-                messagebox.showerror("Ошибка", "Запись не найдена")
-                return
-            
-            # Генерация и отправка кода подтверждения
-            if self.max_messenger.enabled:
-                verification_code = self.code_verification.generate_and_store_code("decrypt", record_id)
-                success, msg = self.max_messenger.send_decryption_code(verification_code, record_id)
-                
-                if success:
-                    # Запрос кода подтверждения
-                    code_input = self.decrypt_code_entry.get().strip()
-                    if not code_input:
-                        # Показываем диалог для ввода кода
-                        code_dialog = tk.Toplevel(self.root)
-                        code_dialog.title("Код подтверждения")
-                        code_dialog.geometry("400x150")
-                        code_dialog.transient(self.root)
-                        code_dialog.grab_set()
-                        
-                        ttk.Label(code_dialog, 
-                                 text=f"Код отправлен в мессенджер MAX.\nВведите код подтверждения:",
-                                 font=("Arial", 10)).pack(pady=10)
-                        
-                        code_entry = ttk.Entry(code_dialog, width=20, font=("Arial", 12))
-                        code_entry.pack(pady=5)
-                        code_entry.focus()
-                        
-                        result = {"code": None}
-                        
-                        def confirm_code():
-                            result["code"] = code_entry.get().strip()
-                            code_dialog.destroy()
-                        
-                        ttk.Button(code_dialog, text="Подтвердить", command=confirm_code).pack(pady=5)
-                        code_dialog.bind('<Return>', lambda e: confirm_code())
-                        
-                        code_dialog.wait_window()
-                        code_input = result["code"]
-                    
-                    # Проверка кода
-                    is_valid, code_msg = self.code_verification.verify_code(code_input, "decrypt")
-                    if not is_valid:
-                        self.decrypt_code_status.config(text=code_msg, foreground="red")
-                        messagebox.showerror("Ошибка", f"Неверный код подтверждения: {code_msg}")
-                        return
-                    else:
-                        self.decrypt_code_status.config(text="Код подтвержден", foreground="green")
-                else:
-                    # Если отправка не удалась, но мессенджер настроен, продолжаем с предупреждением
-                    if messagebox.askyesno("Предупреждение", 
-                                         f"Не удалось отправить код в мессенджер: {msg}\nПродолжить без подтверждения?"):
-                        pass
-                    else:
-                        return
-            
-            encrypted_data = record["encrypted_data"]
-            decrypted_data = self.encryption.decrypt_data(encrypted_data)
-            
+        except ValueError:
+            messagebox.showerror("Ошибка", "Введите корректный ID записи")
+            return
+        
+        encryption = self.encryption
+        
+        def on_error(e):
+            messagebox.showerror("Ошибка", f"Ошибка при дешифровании: {str(e)}")
+            self.notify_operation(
+                "Дешифрование данных",
+                "ошибка",
+                f"Ошибка при дешифровании записи: {str(e)}"
+            )
+        
+        def on_decrypted(decrypted_data):
             # Отображение результата
             result_text = json.dumps(decrypted_data, ensure_ascii=False, indent=2)
             self.decrypted_data_text.delete("1.0", tk.END)
             self.decrypted_data_text.insert("1.0", result_text)
             
             # Отправка уведомления об успешном дешифровании
-            if self.max_messenger.enabled:
-                self.max_messenger.send_operation_notification(
-                    "Дешифрование данных",
-                    "успех",
-                    f"Данные записи ID {record_id} успешно расшифрованы"
-                )
+            self.notify_operation(
+                "Дешифрование данных",
+                "успех",
+                f"Данные записи ID {record_id} успешно расшифрованы"
+            )
+        
+        def on_decrypted_or_missing(decrypted_data):
+            if decrypted_data is None:
+                messagebox.showerror("Ошибка", "Запись не найдена")
+                return
+            on_decrypted(decrypted_data)
+        
+        def on_loaded(meta):
+            if not meta:
+                messagebox.showerror("Ошибка", "Запись не найдена")
+                return
             
-        except ValueError:
-            messagebox.showerror("Ошибка", "Введите корректный ID записи")
-        except Exception as e:
-            messagebox.showerror("Ошибка", f"Ошибка при дешифровании: {str(e)}")
-            if self.max_messenger.enabled:
-                self.max_messenger.send_operation_notification(
-                    "Дешифрование данных",
-                    "ошибка",
-                    f"Ошибка при дешифровании записи: {str(e)}"
+            def start_decrypt():
+                # Повторное дешифрование той же версии записи берется из кэша
+                self.task_runner.submit(
+                    lambda task: self.db_manager.get_decrypted_record(record_id, encryption),
+                    description="Дешифрование записи",
+                    on_success=on_decrypted_or_missing,
+                    on_error=on_error,
+                    lane="db"
                 )
+            
+            # Генерация и отправка кода подтверждения
+            self.confirm_operation(
+                lambda code: self.max_messenger.send_decryption_code(code, record_id),
+                "decrypt", self.decrypt_code_entry, self.decrypt_code_status, start_decrypt,
+                record_id=record_id
+            )
+        
+        self.task_runner.submit(
+            lambda task: self.db_manager.get_metadata(record_id),
+            description="Загрузка записи",
+            on_success=on_loaded,
+            on_error=on_error,
+            lane="db"
+        )
     
     def decrypt_manual(self):
         """Дешифрование данных, введенных вручную"""
@@ -667,70 +969,249 @@ class PersonalDataEncryptionApp:
         except Exception as e:
             messagebox.showerror("Ошибка", f"Ошибка при загрузке файла: {str(e)}")
     
+    def import_roster(self):
+        """Импорт списка записей из CSV, JSONL или JSON файла"""
+        if not self.encryption:
+            messagebox.showerror("Ошибка", "Сначала установите пароль")
+            return
+        
+        file_path = filedialog.askopenfilename(
+            title="Выберите файл со списком",
+            filetypes=[("Списки", "*.csv *.jsonl *.json"), ("CSV файлы", "*.csv"),
+                       ("JSONL файлы", "*.jsonl"), ("JSON файлы", "*.json"), ("Все файлы", "*.*")]
+        )
+        
+        if not file_path:
+            return
+        
+        encryption = self.encryption
+        # Тип записей для файлов без столбца "тип" - выбранный в форме
+        data_type = self.data_type_var.get()
+        
+        def run_import(task):
+            importer = BulkImporter(self.db_manager, encryption)
+            return importer.run(
+                file_path, data_type,
+                progress=lambda fraction, stats: task.report(
+                    fraction, f"записей: {stats['imported']}, {stats['records_per_second']:.0f}/с"),
+                check_cancelled=task.check_cancelled
+            )
+        
+        def on_imported(stats):
+            message = (f"Импортировано записей: {stats['imported']} за {stats['seconds']:.1f} с "
+                       f"({stats['records_per_second']:.0f} записей/с)")
+            if stats["rejected"]:
+                message += f"\nОтклонено строк: {stats['rejected']}\nСм. файл {stats['reject_file']}"
+            self.notify_operation("Импорт списка", "успех", message)
+            messagebox.showinfo("Импорт завершен", message)
+            self.encrypt_code_entry.delete(0, tk.END)
+            self.encrypt_code_status.config(text="", foreground="black")
+            self.refresh_database()
+            self.update_statistics()
+        
+        def start_import():
+            self.task_runner.submit(
+                run_import,
+                description="Импорт списка",
+                on_success=on_imported,
+                on_error=lambda e: messagebox.showerror("Ошибка", f"Ошибка при импорте: {str(e)}"),
+                # Записанные до отмены пакеты остаются в базе
+                on_cancel=self.refresh_database,
+                lane="db"
+            )
+        
+        self.confirm_operation(
+            lambda code: self.max_messenger.send_encryption_code(
+                code, data_type, self.db_manager.peek_next_id()),
+            "encrypt", self.encrypt_code_entry, self.encrypt_code_status, start_import
+        )
+    
+    def search_records(self):
+        """Поиск записей по точному значению поля без расшифровки базы"""
+        if not self.encryption:
+            messagebox.showerror("Ошибка", "Сначала установите пароль")
+            return
+        
+        value = self.search_entry.get().strip()
+        if not value:
+            self.refresh_database()
+            return
+        
+        field = self.search_fields[self.search_field_var.get()]
+        # Во время смены пароля часть записей проиндексирована прежним ключом
+        tokens = self.encryption.blind_index_variants(field, value)
+        
+        def find(task):
+            found = {}
+            for token in tokens:
+                for record in self.db_manager.find_by_blind_index(field, token):
+                    found[record["id"]] = record
+            return [found[record_id] for record_id in sorted(found)]
+        
+        def on_found(records):
+            self.records_view.show_rows(records)
+            self.search_status.config(text=f"Найдено записей: {len(records)}")
+        
+        self.task_runner.submit(
+            find,
+            description="Поиск записей",
+            on_success=on_found,
+            on_error=lambda e: messagebox.showerror("Ошибка", f"Ошибка поиска: {str(e)}"),
+            lane="db"
+        )
+    
     def refresh_database(self):
         """Обновление списка записей в базе данных"""
-        # Очистка дерева
-        for item in self.records_tree.get_children():
-            self.records_tree.delete(item)
-        
-        # Загрузка записей
-        records = self.db_manager.get_all_records()
-        for record in records:
-            created_at = record.get("created_at", "")
-            if created_at:
-                try:
-                    dt = datetime.fromisoformat(created_at)
-                    created_at = dt.strftime("%d.%m.%Y %H:%M")
-                except:
-                    pass
-            
-            self.records_tree.insert("", tk.END, values=(
-                record["id"],
-                record["type"],
-                record.get("description", ""),
-                created_at
-            ))
-        
+        self.search_status.config(text="")
+        self.task_runner.submit(
+            lambda task: self.db_manager.count_records(),
+            description="Загрузка записей",
+            on_success=self.show_records,
+            on_error=lambda e: messagebox.showerror("Ошибка", f"Ошибка чтения базы данных: {str(e)}"),
+            lane="db"
+        )
+    
+    def show_records(self, total):
+        """Показ всех записей: метаданные загружаются страницами по мере прокрутки"""
+        self.records_view.reset(total)
         self.update_statistics()
     
+    def load_records_page(self, page, offset, limit, generation):
+        """Загрузка страницы метаданных записей для таблицы (без зашифрованных данных)"""
+        self.task_runner.submit(
+            lambda task: self.db_manager.get_records_metadata(offset, limit),
+            description="Загрузка записей",
+            on_success=lambda records: self.records_view.page_loaded(page, records, generation),
+            on_error=lambda e: messagebox.showerror("Ошибка", f"Ошибка чтения базы данных: {str(e)}"),
+            lane="db"
+        )
+    
     def delete_record(self):
         """Удаление выбранной записи"""
-        selected = self.records_tree.selection()
+        selected = self.records_view.selection()
         if not selected:
             messagebox.showwarning("Предупреждение", "Выберите запись для удаления")
             return
         
-        item = self.records_tree.item(selected[0])
+        item = self.records_view.item(selected[0])
         record_id = item["values"][0]
+        if record_id == "":
+            # Строка еще загружается
+            return
         
-        if messagebox.askyesno("Подтверждение", f"Удалить запись ID {record_id}?"):
-            if self.db_manager.delete_record(record_id):
+        if not messagebox.askyesno("Подтверждение", f"Удалить запись ID {record_id}?"):
+            return
+        
+        def on_deleted(deleted):
+            if deleted:
                 messagebox.showinfo("Успех", "Запись удалена")
-                self.refresh_database()
+                self.records_view.remove(record_id)
+                self.update_statistics()
             else:
                 messagebox.showerror("Ошибка", "Не удалось удалить запись")
+        
+        self.task_runner.submit(
+            lambda task: self.db_manager.delete_record(record_id),
+            description="Удаление записи",
+            on_success=on_deleted,
+            on_error=lambda e: messagebox.showerror("Ошибка", f"Не удалось удалить запись: {str(e)}"),
+            lane="db"
+        )
     
     def export_database(self):
-        """Экспорт базы данных в файл"""
+        """Выборочный экспорт записей в зашифрованный архив"""
+        if not self.encryption:
+            messagebox.showerror("Ошибка", "Сначала установите пароль")
+            return
+        
+        dialog = tk.Toplevel(self.root)
+        dialog.title("Экспорт записей")
+        dialog.transient(self.root)
+        
+        form = ttk.Frame(dialog, padding=10)
+        form.pack(fill=tk.BOTH, expand=True)
+        
+        ttk.Label(form, text="Тип записей:").grid(row=0, column=0, sticky=tk.W, pady=3)
+        type_var = tk.StringVar(value="все")
+        ttk.Combobox(form, textvariable=type_var, values=("все", "ученик", "учитель", "родитель"),
+                     state="readonly", width=27).grid(row=0, column=1, pady=3)
+        
+        entries = {}
+        labels = (("класс", "Класс:"), ("created_from", "Созданы с (ГГГГ-ММ-ДД):"),
+                  ("created_to", "Созданы до (ГГГГ-ММ-ДД):"), ("password", "Пароль получателя:"))
+        for row, (name, label) in enumerate(labels, 1):
+            ttk.Label(form, text=label).grid(row=row, column=0, sticky=tk.W, pady=3)
+            entry = ttk.Entry(form, width=30, show="*" if name == "password" else "")
+            entry.grid(row=row, column=1, pady=3)
+            entries[name] = entry
+        ttk.Label(form, text="Без пароля получателя записи остаются зашифрованными паролем базы",
+                  font=("Arial", 8)).grid(row=len(labels) + 1, column=0, columnspan=2, sticky=tk.W)
+        
+        def start():
+            filters = {name: entry.get().strip() for name, entry in entries.items()}
+            dialog.destroy()
+            self.run_export(None if type_var.get() == "все" else type_var.get(), filters)
+        
+        ttk.Button(form, text="Экспортировать", command=start).grid(
+            row=len(labels) + 2, column=0, columnspan=2, pady=10)
+    
+    def run_export(self, record_type, filters):
+        """
+        Запуск экспорта в фоне
+        
+        Args:
+            record_type: Тип записей или None (все типы)
+            filters: Значения полей диалога экспорта
+        """
         file_path = filedialog.asksaveasfilename(
-            title="Сохранить базу данных",
-            defaultextension=".json",
-            filetypes=[("JSON файлы", "*.json"), ("Все файлы", "*.*")]
+            title="Сохранить архив экспорта",
+            defaultextension=".pdsf",
+            filetypes=[("Архивы экспорта", "*.pdsf"), ("Все файлы", "*.*")]
         )
         
         if not file_path:
             return
         
-        try:
-            import shutil
-            shutil.copy(self.db_manager.db_file, file_path)
-            messagebox.showinfo("Успех", "База данных экспортирована")
-        except Exception as e:
-            messagebox.showerror("Ошибка", f"Ошибка при экспорте: {str(e)}")
+        encryption = self.encryption
+        where = {"класс": filters["класс"]} if filters["класс"] else None
+        
+        def run(task):
+            # Ключ получателя выводится из пароля (PBKDF2) в фоне
+            target = PersonalDataEncryption(filters["password"]) if filters["password"] else None
+            exporter = BulkExporter(self.db_manager, encryption)
+            return exporter.run(
+                file_path, record_type, filters["created_from"] or None, filters["created_to"] or None,
+                where, target,
+                progress=lambda fraction, stats: task.report(fraction, f"записей: {stats['exported']}"),
+                check_cancelled=task.check_cancelled
+            )
+        
+        def on_exported(manifest):
+            message = f"Экспортировано записей: {manifest['records']}"
+            if manifest["reencrypted"]:
+                message += "\nАрхив зашифрован паролем получателя"
+            self.notify_operation("Экспорт записей", "успех", message)
+            messagebox.showinfo("Успех", message)
+        
+        self.task_runner.submit(
+            run,
+            description="Экспорт записей",
+            on_success=on_exported,
+            on_error=lambda e: messagebox.showerror("Ошибка", f"Ошибка при экспорте: {str(e)}"),
+            lane="db"
+        )
     
     def update_statistics(self):
         """Обновление статистики"""
-        stats = self.db_manager.get_statistics()
+        self.task_runner.submit(
+            lambda task: self.db_manager.get_statistics(),
+            description="Подсчет статистики",
+            on_success=self.show_statistics,
+            lane="db"
+        )
+    
+    def show_statistics(self, stats):
+        """Отображение статистики"""
         stats_text = f"Всего записей: {stats['total_records']}"
         
         if stats['by_type']:
@@ -739,7 +1220,37 @@ class PersonalDataEncryptionApp:
                 stats_text += f"{record_type}: {count}, "
             stats_text = stats_text.rstrip(", ")
         
+        if stats.get('by_class'):
+            stats_text += f"\nКлассов: {len(stats['by_class'])}"
+        today = stats.get('created_per_day', {}).get(datetime.now().date().isoformat(), 0)
+        stats_text += f"\nДобавлено сегодня: {today}"
+        
         self.stats_label.config(text=stats_text)
+    
+    def update_task_status(self, tasks):
+        """Обновление строки состояния фоновых операций"""
+        if not tasks:
+            self.task_progress.stop()
+            self.task_progress.config(mode="indeterminate", value=0)
+            self.task_status_label.config(text="")
+            self.task_cancel_button.config(state=tk.DISABLED)
+            return
+        
+        task = tasks[-1]
+        text = task.description
+        if task.progress_text:
+            text += f": {task.progress_text}"
+        if len(tasks) > 1:
+            text += f" (операций: {len(tasks)})"
+        self.task_status_label.config(text=text)
+        self.task_cancel_button.config(state=tk.NORMAL)
+        
+        if task.progress is None:
+            self.task_progress.config(mode="indeterminate")
+            self.task_progress.start(10)
+        else:
+            self.task_progress.stop()
+            self.task_progress.config(mode="determinate", value=task.progress * 100)
 
 
 def main():
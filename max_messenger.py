@@ -5,16 +5,45 @@
 
 import requests
 import json
+import queue
+import random
 import secrets
 import string
-from typing import Optional, Tuple
+import threading
+import os
+import time
+import uuid
+from typing import Dict, List, Optional, Tuple
 from datetime import datetime
 
+from requests.adapters import HTTPAdapter
+
+from messenger_outbox import MessageOutbox
+from metrics import metrics
+from verification_store import DEFAULT_PRINCIPAL, MemoryCodeStore, SqliteCodeStore
+
+
+# Базовый URL API мессенджера MAX (может потребоваться настройка)
+DEFAULT_API_BASE_URL = "https://api.max.im/v1"  # Примерный URL, нужно уточнить
+
+# Коды ответа, при которых запрос повторяется
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+# Журнал сообщений, ожидающих доставки
+DEFAULT_OUTBOX_FILE = "max_messenger_outbox.jsonl"
+
+# Разделитель уведомлений, объединенных в одно сообщение
+BATCH_SEPARATOR = "\n\n" + "─" * 20 + "\n\n"
+
 
 class MaxMessenger:
     """Класс для работы с мессенджером MAX"""
     
-    def __init__(self, api_key: str = "", chat_id: str = "", phone_number: str = ""):
+    def __init__(self, api_key: str = "", chat_id: str = "", phone_number: str = "",
+                 api_base_url: str = DEFAULT_API_BASE_URL, timeout: float = 10,
+                 max_retries: int = 3, backoff_base: float = 0.5, backoff_max: float = 8.0,
+                 batch_interval: float = 2.0, batch_size: int = 20,
+                 outbox_file: str = DEFAULT_OUTBOX_FILE):
         """
         Инициализация мессенджера MAX
         
@@ -22,13 +51,45 @@ class MaxMessenger:
             api_key: API ключ для доступа к мессенджеру
             chat_id: ID чата или получателя
             phone_number: Номер телефона получателя
+            api_base_url: Базовый URL API мессенджера
+            timeout: Таймаут одного HTTP-запроса в секундах
+            max_retries: Количество повторов при сетевой ошибке или ответах 429/5xx
+            backoff_base: Начальная задержка между повторами в секундах
+            backoff_max: Максимальная задержка между повторами в секундах
+            batch_interval: Время накопления уведомлений перед отправкой одним сообщением
+            batch_size: Максимальное количество уведомлений в одном сообщении
+            outbox_file: Журнал сообщений, которые не удалось доставить сразу
         """
         self.api_key = api_key
         self.chat_id = chat_id
         self.phone_number = phone_number
-        # Базовый URL API мессенджера MAX (может потребоваться настройка)
-        self.api_base_url = "https://api.max.im/v1"  # Примерный URL, нужно уточнить
+        self.api_base_url = api_base_url.rstrip("/")
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.batch_interval = batch_interval
+        self.batch_size = batch_size
         self.enabled = bool(api_key and (chat_id or phone_number))
+        
+        # Одна сессия на мессенджер: TCP/TLS-соединения переиспользуются между запросами
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=4)
+        self._session.mount("https://", adapter)
+        self._session.mount("http://", adapter)
+        
+        # Очередь уведомлений, которые отправляются пачками в фоновом потоке
+        self._notifications: "queue.Queue" = queue.Queue()
+        self._notifier: Optional[threading.Thread] = None
+        self._notifier_lock = threading.Lock()
+        
+        # Надежная очередь доставки открывается при первом обращении или сразу,
+        # если в журнале остались сообщения с прошлого запуска
+        self.outbox_file = outbox_file
+        self._outbox: Optional[MessageOutbox] = None
+        self._outbox_lock = threading.Lock()
+        if self.enabled and os.path.exists(outbox_file):
+            self._outbox = MessageOutbox(outbox_file, self._deliver)
     
     def generate_verification_code(self, length: int = 6) -> str:
         """
@@ -61,59 +122,132 @@ class MaxMessenger:
         try:
             recipient = recipient or self.chat_id or self.phone_number
             
-            # Вариант 1: Отправка через API мессенджера MAX
-            # Нужно уточнить точный формат API для мессенджера MAX
-            payload = {
-                "api_key": self.api_key,
-                "recipient": recipient,
-                "message": message,
-                "timestamp": datetime.now().isoformat()
-            }
+            # ID сообщения передается в API, чтобы повторная доставка из очереди
+            # не создавала дубль, если первый запрос все же дошел до сервера
+            message_id = uuid.uuid4().hex
             
             # Попытка отправки через API
             try:
-                response = requests.post(
-                    f"{self.api_base_url}/messages/send",
-                    json=payload,
-                    timeout=10
-                )
+                response = self._post("/messages/send", self._payload(message, recipient, message_id))
                 
                 if response.status_code == 200:
                     return True, "Сообщение отправлено"
                 else:
                     return False, f"Ошибка API: {response.status_code}"
             except requests.exceptions.RequestException:
-                # Если API недоступен, используем альтернативный метод
-                # Можно использовать файловый лог или другой способ
-                return self._send_alternative(message, recipient)
+                # Если API недоступен, сообщение доставляется позже из очереди
+                return self._send_alternative(message, recipient, message_id)
         
         except Exception as e:
             return False, f"Ошибка отправки: {str(e)}"
     
-    def _send_alternative(self, message: str, recipient: str) -> Tuple[bool, str]:
+    def _payload(self, message: str, recipient: str, message_id: str) -> Dict:
+        """Тело запроса отправки сообщения"""
+        # Нужно уточнить точный формат API для мессенджера MAX
+        return {
+            "api_key": self.api_key,
+            "message_id": message_id,
+            "recipient": recipient,
+            "message": message,
+            "timestamp": datetime.now().isoformat()
+        }
+    
+    def _post(self, path: str, payload: dict) -> requests.Response:
+        """
+        POST-запрос через общую сессию с повторами
+        
+        Повторяются сетевые ошибки и ответы 429/5xx. Задержка растет
+        экспоненциально и выбирается случайно в пределах [0, предел]
+        ("full jitter"), чтобы повторы разных клиентов не совпадали.
+        Для ответа 429 учитывается заголовок Retry-After.
+        
+        Args:
+            path: Путь относительно api_base_url
+            payload: Тело запроса (JSON)
+            
+        Returns:
+            Последний полученный ответ
+            
+        Raises:
+            requests.exceptions.RequestException: Если все попытки завершились сетевой ошибкой
+        """
+        url = f"{self.api_base_url}{path}"
+        attempt = 0
+        
+        while True:
+            started = time.perf_counter()
+            try:
+                response = self._session.post(url, json=payload, timeout=self.timeout)
+                metrics.observe("messenger_request_seconds", time.perf_counter() - started,
+                                status=response.status_code)
+                if metrics.enabled:
+                    metrics.inc("messenger_bytes_sent_total", len(response.request.body or b""))
+                if response.status_code not in RETRY_STATUS_CODES or attempt >= self.max_retries:
+                    return response
+                delay = self._retry_after(response)
+                response.close()
+            except requests.exceptions.RequestException:
+                metrics.observe("messenger_request_seconds", time.perf_counter() - started, status="error")
+                if attempt >= self.max_retries:
+                    raise
+                delay = None
+            
+            metrics.inc("messenger_retries_total")
+            if delay is None:
+                delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+            time.sleep(delay)
+            attempt += 1
+    
+    def _retry_after(self, response: requests.Response) -> Optional[float]:
+        """Задержка из заголовка Retry-After (только в секундах)"""
+        value = response.headers.get("Retry-After", "")
+        try:
+            return min(self.backoff_max, max(0.0, float(value)))
+        except ValueError:
+            return None
+    
+    @property
+    def outbox(self) -> MessageOutbox:
+        """Очередь сообщений, доставляемых в фоне"""
+        with self._outbox_lock:
+            if self._outbox is None:
+                self._outbox = MessageOutbox(self.outbox_file, self._deliver)
+            return self._outbox
+    
+    def _deliver(self, entry: Dict) -> bool:
+        """
+        Доставка сообщения из очереди
+        
+        Returns:
+            True, если сообщение доставлено, False, если API его отклонил
+            
+        Raises:
+            requests.exceptions.RequestException: API временно недоступен
+        """
+        response = self._post("/messages/send",
+                              self._payload(entry["message"], entry["recipient"], entry["id"]))
+        if response.status_code in RETRY_STATUS_CODES:
+            raise requests.exceptions.HTTPError(f"Ошибка API: {response.status_code}", response=response)
+        return response.status_code == 200
+    
+    def _send_alternative(self, message: str, recipient: str,
+                          message_id: Optional[str] = None) -> Tuple[bool, str]:
         """
         Альтернативный метод отправки (если API недоступен)
-        Сохраняет сообщения в файл для тестирования
+        Сохраняет сообщение в журнал очереди, откуда оно будет доставлено
+        после восстановления API
         
         Args:
             message: Текст сообщения
             recipient: Получатель
+            message_id: ID сообщения для устранения дублей
             
         Returns:
             Кортеж (успех, сообщение)
         """
         try:
-            log_entry = {
-                "timestamp": datetime.now().isoformat(),
-                "recipient": recipient,
-                "message": message
-            }
-            
-            # Сохранение в файл для тестирования
-            with open("max_messenger_log.json", "a", encoding="utf-8") as f:
-                f.write(json.dumps(log_entry, ensure_ascii=False) + "\n")
-            
-            return True, "Сообщение сохранено в лог (API недоступен)"
+            self.outbox.enqueue(message, recipient, message_id, sync=True)
+            return True, "Сообщение поставлено в очередь (API недоступен)"
         except Exception as e:
             return False, f"Ошибка альтернативной отправки: {str(e)}"
     
@@ -192,6 +326,108 @@ ID записи: {record_id if record_id else 'N/A'}
         
         return self.send_message(message)
     
+    def queue_operation_notification(self, operation: str, status: str, details: str = ""):
+        """
+        Постановка уведомления об операции в очередь
+        
+        Метод не ждет сети. Уведомления, накопленные за batch_interval,
+        отправляются фоновым потоком одним сообщением.
+        
+        Args:
+            operation: Тип операции (шифрование/дешифрование)
+            status: Статус (успех/ошибка)
+            details: Дополнительные детали
+        """
+        if not self.enabled:
+            return
+        
+        emoji = "✅" if status == "успех" else "❌"
+        text = f"{emoji} {operation}: {status}"
+        if details:
+            text += f"\n{details}"
+        text += f"\nВремя: {datetime.now().strftime('%d.%m.%Y %H:%M:%S')}"
+        
+        self._notifications.put(text)
+        with self._notifier_lock:
+            if self._notifier is None or not self._notifier.is_alive():
+                self._notifier = threading.Thread(target=self._notification_loop,
+                                                  name="max-notifications", daemon=True)
+                self._notifier.start()
+    
+    def _notification_loop(self):
+        """Фоновая отправка накопленных уведомлений пачками"""
+        while True:
+            first = self._notifications.get()
+            if first is None:
+                return
+            
+            batch = [first]
+            deadline = time.monotonic() + self.batch_interval
+            stop = False
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._notifications.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+            
+            self._send_batch(batch)
+            if stop:
+                return
+    
+    def _send_batch(self, batch: List[str]):
+        """Постановка пачки уведомлений в очередь доставки одним сообщением"""
+        header = "📋 УВЕДОМЛЕНИЯ ОБ ОПЕРАЦИЯХ" if len(batch) > 1 else "📋 УВЕДОМЛЕНИЕ ОБ ОПЕРАЦИИ"
+        self.outbox.enqueue(header + "\n\n" + BATCH_SEPARATOR.join(batch),
+                            self.chat_id or self.phone_number)
+    
+    def flush(self, timeout: Optional[float] = None):
+        """
+        Передача накопленных уведомлений в очередь доставки и остановка фонового потока
+        
+        Args:
+            timeout: Максимальное время ожидания в секундах
+        """
+        with self._notifier_lock:
+            notifier = self._notifier
+            self._notifier = None
+        if notifier is not None and notifier.is_alive():
+            self._notifications.put(None)
+            notifier.join(timeout)
+    
+    def close(self, timeout: Optional[float] = 5):
+        """
+        Передача оставшихся уведомлений в очередь, остановка доставки
+        и закрытие HTTP-соединений
+        
+        Недоставленные сообщения остаются в журнале очереди и будут
+        отправлены при следующем запуске.
+        
+        Args:
+            timeout: Максимальное время ожидания фоновых потоков
+        """
+        self.flush(timeout)
+        with self._outbox_lock:
+            if self._outbox is not None:
+                self._outbox.close(timeout)
+                self._outbox = None
+        self._session.close()
+    
+    def outbox_metrics(self) -> Dict:
+        """
+        Метрики очереди доставки
+        
+        Returns:
+            Словарь с глубиной очереди, счетчиками и задержкой доставки
+        """
+        return self.outbox.metrics()
+    
     def test_connection(self) -> Tuple[bool, str]:
         """
         Тестирование подключения к мессенджеру
@@ -212,12 +448,19 @@ ID записи: {record_id if record_id else 'N/A'}
         Args:
             config_file: Путь к файлу конфигурации
         """
-        config = {
+        try:
+            # Прочие ключи (например, "verification_store") сохраняются
+            with open(config_file, "r", encoding="utf-8") as f:
+                config = json.load(f)
+        except (OSError, ValueError):
+            config = {}
+        config.update({
             "api_key": self.api_key,
             "chat_id": self.chat_id,
             "phone_number": self.phone_number,
+            "api_base_url": self.api_base_url,
             "enabled": self.enabled
-        }
+        })
         
         with open(config_file, "w", encoding="utf-8") as f:
             json.dump(config, f, ensure_ascii=False, indent=2)
@@ -240,7 +483,8 @@ ID записи: {record_id if record_id else 'N/A'}
             return cls(
                 api_key=config.get("api_key", ""),
                 chat_id=config.get("chat_id", ""),
-                phone_number=config.get("phone_number", "")
+                phone_number=config.get("phone_number", ""),
+                api_base_url=config.get("api_base_url", DEFAULT_API_BASE_URL)
             )
         except FileNotFoundError:
             return cls()
@@ -252,10 +496,54 @@ ID записи: {record_id if record_id else 'N/A'}
 class CodeVerification:
     """Класс для управления кодами подтверждения"""
     
-    def __init__(self):
-        self.active_codes = {}  # {code: (operation, timestamp, record_id)}
+    def __init__(self, store=None):
+        """
+        Args:
+            store: Хранилище кодов (по умолчанию - в памяти процесса);
+                SqliteCodeStore позволяет проверять код в другом процессе
+        """
+        self.store = store or MemoryCodeStore()
         self.code_expiry_minutes = 10  # Время жизни кода в минутах
     
+    @classmethod
+    def from_config(cls, config_file: str = "max_messenger_config.json") -> 'CodeVerification':
+        """
+        Создание с хранилищем из конфигурации мессенджера
+        
+        Если в конфигурации указан "verification_store" (путь к файлу SQLite),
+        коды хранятся в нем и доступны всем копиям программы.
+        """
+        try:
+            with open(config_file, "r", encoding="utf-8") as f:
+                path = json.load(f).get("verification_store")
+        except (OSError, ValueError):
+            path = None
+        return cls(SqliteCodeStore(path) if path else None)
+    
+    @property
+    def active_codes(self) -> Dict[str, Dict]:
+        """Действующие коды: {код: {operation, record_id, nonce, expires_at}}"""
+        return self.store.active()
+    
+    def issue_code(self, operation: str, record_id: Optional[int] = None,
+                   principal: str = DEFAULT_PRINCIPAL) -> Dict:
+        """
+        Выдача кода подтверждения для конкретной операции
+        
+        Args:
+            operation: Тип операции (encrypt/decrypt)
+            record_id: ID записи
+            principal: Пользователь или процесс, запросивший код
+            
+        Returns:
+            Словарь: code, nonce (передается в verify_code), expires_at
+            
+        Raises:
+            RateLimitError: Слишком много запросов кода
+        """
+        with metrics.timer("verification_issue_seconds", operation=operation):
+            return self.store.issue(operation, record_id, self.code_expiry_minutes * 60, principal)
+    
     def generate_and_store_code(self, operation: str, record_id: Optional[int] = None) -> str:
         """
         Генерация и сохранение кода подтверждения
@@ -267,51 +555,36 @@ class CodeVerification:
         Returns:
             Сгенерированный код
         """
-        code = ''.join(secrets.choice(string.digits) for _ in range(6))
-        self.active_codes[code] = {
-            "operation": operation,
-            "timestamp": datetime.now(),
-            "record_id": record_id
-        }
-        return code
+        return self.issue_code(operation, record_id)["code"]
     
-    def verify_code(self, code: str, operation: str) -> Tuple[bool, str]:
+    def verify_code(self, code: str, operation: str, record_id: Optional[int] = None,
+                    nonce: Optional[str] = None, principal: str = DEFAULT_PRINCIPAL) -> Tuple[bool, str]:
         """
         Проверка кода подтверждения
         
+        Использованный код удаляется. Число неверных попыток ограничено.
+        
         Args:
             code: Код для проверки
             operation: Ожидаемая операция
+            record_id: ID записи (проверяется, если указан)
+            nonce: Идентификатор кода из issue_code: проверяется именно этот код
+            principal: Пользователь или процесс, вводящий код
             
         Returns:
             Кортеж (валидность, сообщение)
         """
-        if code not in self.active_codes:
-            return False, "Код не найден или истек"
-        
-        code_data = self.active_codes[code]
-        
-        # Проверка времени жизни
-        elapsed = (datetime.now() - code_data["timestamp"]).total_seconds() / 60
-        if elapsed > self.code_expiry_minutes:
-            del self.active_codes[code]
-            return False, "Код истек"
-        
-        # Проверка операции
-        if code_data["operation"] != operation:
-            return False, "Код не соответствует операции"
-        
-        # Удаление использованного кода
-        del self.active_codes[code]
-        return True, "Код подтвержден"
+        if not code:
+            return False, "Код не введен"
+        with metrics.timer("verification_check_seconds", operation=operation):
+            valid, message = self.store.verify(code, operation, record_id, nonce, principal)
+        metrics.inc("verification_checks_total", result="valid" if valid else "invalid")
+        return valid, message
+    
+    def cleanup_expired_codes(self) -> int:
+        """Очистка истекших кодов (выполняется и при каждой выдаче и проверке)"""
+        return self.store.purge_expired()
     
-    def cleanup_expired_codes(self):
-        """Очистка истекших кодов"""
-        current_time = datetime.now()
-        expired_codes = [
-            code for code, data in self.active_codes.items()
-            if (current_time - data["timestamp"]).total_seconds() / 60 > self.code_expiry_minutes
-        ]
-        
-        for code in expired_codes:
-            del self.active_codes[code]
+    def close(self):
+        """Закрытие хранилища кодов"""
+        self.store.close()
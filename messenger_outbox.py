@@ -0,0 +1,296 @@
+"""
+Надежная очередь исходящих сообщений мессенджера
+
+Сообщения записываются в локальный журнал (JSON Lines) через один открытый
+дескриптор. Запись на диск (fsync) выполняется пачкой раз в fsync_interval,
+а фоновый поток доставляет сообщения в API и отмечает доставленные
+записью подтверждения. Недоставленные сообщения переживают перезапуск.
+Журнал переписывается только с недоставленными сообщениями при открытии и
+после каждых compact_after подтверждений, поэтому не растет при долгой работе.
+"""
+
+import json
+import os
+import random
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from typing import Callable, Dict, Optional
+
+
+# Количество ID доставленных сообщений, которые помнятся для устранения дублей
+DEDUP_WINDOW = 10000
+# Количество подтверждений в журнале, после которого он переписывается
+COMPACT_AFTER = 1000
+
+
+class MessageOutbox:
+    """Очередь сообщений с журналом на диске и фоновой доставкой"""
+    
+    def __init__(self, path: str, send: Callable[[Dict], bool], fsync_interval: float = 1.0,
+                 retry_base: float = 1.0, retry_max: float = 60.0, compact_after: int = COMPACT_AFTER):
+        """
+        Открытие очереди и восстановление недоставленных сообщений
+        
+        Args:
+            path: Путь к файлу журнала
+            send: Функция доставки send(entry). Возвращает True, если сообщение
+                доставлено, False, если API его окончательно отклонил; исключение
+                означает временную ошибку, и доставка будет повторена
+            fsync_interval: Период сброса журнала на диск в секундах
+            retry_base: Начальная задержка повтора после ошибки доставки
+            retry_max: Максимальная задержка повтора
+            compact_after: Количество подтверждений доставки, после которого
+                журнал переписывается только с недоставленными сообщениями
+        """
+        self.path = path
+        self.fsync_interval = fsync_interval
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self.compact_after = compact_after
+        self._send = send
+        
+        self._cond = threading.Condition()
+        # {id: запись} в порядке постановки в очередь
+        self._pending: "OrderedDict[str, Dict]" = OrderedDict()
+        self._delivered_ids: "OrderedDict[str, None]" = OrderedDict()
+        self._dirty = False
+        self._last_sync = time.monotonic()
+        self._failures = 0
+        self._next_attempt = 0.0
+        self._stopping = False
+        # Подтверждения, записанные в журнал после последней перезаписи
+        self._acked_in_log = 0
+        self._thread: Optional[threading.Thread] = None
+        
+        self._metrics = {
+            "enqueued": 0,
+            "delivered": 0,
+            "rejected": 0,
+            "failed_attempts": 0,
+            "last_latency": 0.0,
+            "max_latency": 0.0,
+            "total_latency": 0.0
+        }
+        
+        self._recover()
+        self._file = open(self.path, "a", encoding="utf-8")
+        if self._pending:
+            self._start()
+    
+    def _recover(self):
+        """Чтение журнала и перезапись его только с недоставленными сообщениями"""
+        if not os.path.exists(self.path):
+            return
+        
+        needs_rewrite = False
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                    op = entry["op"]
+                except (ValueError, KeyError, TypeError):
+                    # Оборванная при сбое последняя строка
+                    needs_rewrite = True
+                    continue
+                if op == "put":
+                    self._pending[entry["id"]] = entry
+                elif op == "ack":
+                    self._pending.pop(entry["id"], None)
+                    self._remember(entry["id"])
+                    needs_rewrite = True
+        
+        if needs_rewrite:
+            self._rewrite()
+    
+    def _rewrite(self):
+        """Атомарная перезапись журнала только с недоставленными сообщениями"""
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            for entry in self._pending.values():
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.path)
+        self._acked_in_log = 0
+    
+    def _compact(self):
+        """Перезапись открытого журнала (вызывается под блокировкой)"""
+        self._file.close()
+        self._rewrite()
+        self._file = open(self.path, "a", encoding="utf-8")
+        self._dirty = False
+    
+    def _remember(self, message_id: str):
+        self._delivered_ids[message_id] = None
+        if len(self._delivered_ids) > DEDUP_WINDOW:
+            self._delivered_ids.popitem(last=False)
+    
+    def _write(self, entry: Dict):
+        """Добавление строки в журнал (вызывается под блокировкой)"""
+        self._file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        self._dirty = True
+    
+    def _sync(self):
+        """Сброс журнала на диск (вызывается под блокировкой)"""
+        if self._dirty:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._dirty = False
+        self._last_sync = time.monotonic()
+    
+    def enqueue(self, message: str, recipient: str = "", message_id: Optional[str] = None,
+                sync: bool = False) -> str:
+        """
+        Постановка сообщения в очередь
+        
+        Args:
+            message: Текст сообщения
+            recipient: Получатель
+            message_id: ID сообщения; сообщение с уже известным ID не дублируется
+            sync: Сбросить журнал на диск сразу, не дожидаясь периодического fsync
+            
+        Returns:
+            ID сообщения
+        """
+        message_id = message_id or uuid.uuid4().hex
+        
+        with self._cond:
+            if message_id in self._pending or message_id in self._delivered_ids:
+                return message_id
+            
+            entry = {
+                "op": "put",
+                "id": message_id,
+                "created": time.time(),
+                "timestamp": datetime.now().isoformat(),
+                "recipient": recipient,
+                "message": message
+            }
+            self._pending[message_id] = entry
+            self._write(entry)
+            self._metrics["enqueued"] += 1
+            if sync:
+                self._sync()
+            self._start()
+            self._cond.notify_all()
+        
+        return message_id
+    
+    def _start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name="messenger-outbox", daemon=True)
+            self._thread.start()
+    
+    def _run(self):
+        """Фоновая доставка сообщений по порядку"""
+        while True:
+            with self._cond:
+                if self._stopping:
+                    self._sync()
+                    return
+                
+                now = time.monotonic()
+                if not self._pending or now < self._next_attempt:
+                    timeout = self.fsync_interval
+                    if self._pending:
+                        timeout = min(timeout, self._next_attempt - now)
+                    self._cond.wait(max(timeout, 0.0))
+                    if time.monotonic() - self._last_sync >= self.fsync_interval:
+                        self._sync()
+                    continue
+                
+                entry = next(iter(self._pending.values()))
+            
+            try:
+                delivered = self._send(entry)
+            except Exception:
+                with self._cond:
+                    self._metrics["failed_attempts"] += 1
+                    delay = min(self.retry_max, self.retry_base * 2 ** self._failures)
+                    self._failures += 1
+                    self._next_attempt = time.monotonic() + random.uniform(delay / 2, delay)
+                continue
+            
+            with self._cond:
+                if self._file.closed:
+                    return
+                self._failures = 0
+                self._next_attempt = 0.0
+                self._pending.pop(entry["id"], None)
+                self._remember(entry["id"])
+                self._write({
+                    "op": "ack",
+                    "id": entry["id"],
+                    "status": "delivered" if delivered else "rejected",
+                    "timestamp": datetime.now().isoformat()
+                })
+                self._acked_in_log += 1
+                if self._acked_in_log >= self.compact_after:
+                    self._compact()
+                
+                if delivered:
+                    latency = max(0.0, time.time() - entry.get("created", time.time()))
+                    self._metrics["delivered"] += 1
+                    self._metrics["last_latency"] = latency
+                    self._metrics["max_latency"] = max(self._metrics["max_latency"], latency)
+                    self._metrics["total_latency"] += latency
+                else:
+                    self._metrics["rejected"] += 1
+                self._cond.notify_all()
+    
+    def wait_empty(self, timeout: Optional[float] = None) -> bool:
+        """
+        Ожидание доставки всех сообщений
+        
+        Args:
+            timeout: Максимальное время ожидания в секундах
+            
+        Returns:
+            True, если очередь пуста
+        """
+        with self._cond:
+            return self._cond.wait_for(lambda: not self._pending, timeout)
+    
+    @property
+    def depth(self) -> int:
+        """Количество недоставленных сообщений"""
+        with self._cond:
+            return len(self._pending)
+    
+    def metrics(self) -> Dict:
+        """
+        Метрики очереди
+        
+        Returns:
+            Словарь: глубина очереди, счетчики доставки и задержка доставки в секундах
+        """
+        with self._cond:
+            metrics = dict(self._metrics)
+            metrics["queue_depth"] = len(self._pending)
+        total_latency = metrics.pop("total_latency")
+        metrics["avg_latency"] = total_latency / metrics["delivered"] if metrics["delivered"] else 0.0
+        return metrics
+    
+    def close(self, timeout: Optional[float] = 5):
+        """
+        Остановка доставки и закрытие журнала
+        
+        Недоставленные сообщения остаются в журнале и будут отправлены
+        после следующего открытия очереди.
+        
+        Args:
+            timeout: Максимальное время ожидания текущей попытки доставки
+        """
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+            thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+        with self._cond:
+            self._sync()
+            self._file.close()
@@ -0,0 +1,385 @@
+"""
+Метрики производительности: гистограммы задержек, счетчики и показатели
+
+Модули программы отмечают горячие участки (вывод ключа, шифрование записи,
+перезапись базы, запрос к API мессенджера, проверка кода) через общий реестр
+metrics:
+
+    with metrics.timer("kdf_seconds"):
+        ...
+    metrics.inc("db_bytes_written_total", size, backend="json")
+
+Сбор выключен по умолчанию. Выключенный таймер - общий пустой контекстный
+менеджер, счетчик - проверка одного флага, поэтому накладные расходы почти
+нулевые. Сбор включается переменной окружения PERSONAL_DATA_METRICS=1,
+флажком на вкладке "Диагностика" или вызовом metrics.enable().
+
+Метрики выгружаются в текстовом формате Prometheus (для textfile collector
+node_exporter) или в JSON. Если задана переменная PERSONAL_DATA_METRICS_FILE,
+файл перезаписывается раз в 15 секунд (.json - JSON, иначе Prometheus).
+"""
+
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, List, Optional, Tuple
+
+from file_lock import replace_atomically
+
+
+# Префикс имен метрик при выгрузке
+PREFIX = "personal_data_"
+
+# Верхние границы корзин гистограмм задержек, секунды
+DEFAULT_BUCKETS = (0.000005, 0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001,
+                   0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+DEFAULT_EXPORT_INTERVAL = 15.0
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Dict) -> LabelKey:
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def _format_labels(labels: LabelKey, extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+    pairs = labels + extra
+    if not pairs:
+        return ""
+    escaped = (value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+class _NullTimer:
+    """Таймер выключенного реестра: ничего не замеряет"""
+    
+    __slots__ = ()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class _Timer:
+    __slots__ = ("_registry", "_name", "_labels", "_started")
+    
+    def __init__(self, registry: 'MetricsRegistry', name: str, labels: Dict):
+        self._registry = registry
+        self._name = name
+        self._labels = labels
+    
+    def __enter__(self):
+        self._started = time.perf_counter()
+        return self
+    
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        labels = dict(self._labels, error=exc_type.__name__) if exc_type else self._labels
+        self._registry.observe(self._name, time.perf_counter() - self._started, **labels)
+        return False
+
+
+class Histogram:
+    """Гистограмма значений с фиксированными корзинами"""
+    
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        """
+        Args:
+            buckets: Верхние границы корзин по возрастанию
+        """
+        self.buckets = buckets
+        # Последняя корзина - значения больше последней границы
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+    
+    def observe(self, value: float):
+        """Учет значения"""
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+    
+    def quantile(self, q: float) -> float:
+        """
+        Оценка квантиля по корзинам
+        
+        Returns:
+            Верхняя граница корзины, в которую попадает квантиль
+            (для последней корзины - наибольшее значение)
+        """
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        cumulative = 0
+        for index, count in enumerate(self.counts):
+            cumulative += count
+            if cumulative >= rank and count:
+                return min(self.buckets[index], self.max) if index < len(self.buckets) else self.max
+        return self.max
+    
+    def as_dict(self) -> Dict:
+        """
+        Returns:
+            Словарь: count, sum, mean, p50, p95, p99, max и buckets
+            (накопленные количества {граница: значений не больше границы})
+        """
+        cumulative = 0
+        buckets = {}
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            buckets[repr(bound)] = cumulative
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "mean": self.sum / self.count if self.count else 0.0,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+            "max": self.max,
+            "buckets": buckets
+        }
+
+
+class MetricsRegistry:
+    """Реестр метрик процесса"""
+    
+    def __init__(self, enabled: bool = False, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        """
+        Args:
+            enabled: Собирать метрики сразу
+            buckets: Границы корзин гистограмм
+        """
+        self.enabled = enabled
+        self.buckets = buckets
+        self.started_at = time.time()
+        self._lock = threading.Lock()
+        self._histograms: Dict[Tuple[str, LabelKey], Histogram] = {}
+        self._counters: Dict[Tuple[str, LabelKey], float] = {}
+        # Источники показателей, которые считаются в момент выгрузки (например, кэши)
+        self._collectors: List[Callable[[], Dict[str, float]]] = []
+        self._exporter: Optional[threading.Thread] = None
+        self._exporter_stop = threading.Event()
+    
+    def enable(self):
+        """Включение сбора"""
+        self.enabled = True
+    
+    def disable(self):
+        """Выключение сбора (накопленные значения сохраняются)"""
+        self.enabled = False
+    
+    def timer(self, name: str, **labels):
+        """
+        Замер длительности блока with в гистограмму name
+        
+        Если блок завершился исключением, к меткам добавляется error.
+        
+        Args:
+            name: Имя гистограммы (в секундах, с суффиксом _seconds)
+            labels: Метки замера
+        """
+        if not self.enabled:
+            return _NULL_TIMER
+        return _Timer(self, name, labels)
+    
+    def observe(self, name: str, value: float, **labels):
+        """Учет значения в гистограмме name"""
+        if not self.enabled:
+            return
+        key = (name, _label_key(labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(self.buckets)
+            histogram.observe(value)
+    
+    def inc(self, name: str, value: float = 1, **labels):
+        """Увеличение счетчика name (имя с суффиксом _total)"""
+        if not self.enabled:
+            return
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+    
+    def add_collector(self, collector: Callable[[], Dict[str, float]]):
+        """
+        Добавление источника показателей
+        
+        Args:
+            collector: Функция без аргументов, возвращающая {имя: значение};
+                вызывается при каждой выгрузке
+        """
+        with self._lock:
+            self._collectors.append(collector)
+    
+    def remove_collector(self, collector: Callable[[], Dict[str, float]]):
+        """Удаление источника показателей"""
+        with self._lock:
+            if collector in self._collectors:
+                self._collectors.remove(collector)
+    
+    def reset(self):
+        """Сброс накопленных гистограмм и счетчиков"""
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+            self.started_at = time.time()
+    
+    def _gauges(self) -> Dict[str, float]:
+        with self._lock:
+            collectors = list(self._collectors)
+        gauges = {}
+        for collector in collectors:
+            gauges.update(collector())
+        return gauges
+    
+    def snapshot(self) -> Dict:
+        """
+        Текущие значения всех метрик
+        
+        Returns:
+            Словарь: enabled, started_at, histograms, counters и gauges;
+            гистограммы и счетчики - списки словарей с name и labels
+        """
+        with self._lock:
+            histograms = [dict(histogram.as_dict(), name=name, labels=dict(labels))
+                          for (name, labels), histogram in sorted(self._histograms.items())]
+            counters = [{"name": name, "labels": dict(labels), "value": value}
+                        for (name, labels), value in sorted(self._counters.items())]
+        return {
+            "enabled": self.enabled,
+            "started_at": self.started_at,
+            "histograms": histograms,
+            "counters": counters,
+            "gauges": self._gauges()
+        }
+    
+    def to_prometheus(self) -> str:
+        """Выгрузка в текстовом формате Prometheus"""
+        lines = []
+        with self._lock:
+            histograms = sorted(self._histograms.items())
+            counters = sorted(self._counters.items())
+        
+        typed = set()
+        for (name, labels), histogram in histograms:
+            full_name = PREFIX + name
+            if full_name not in typed:
+                lines.append(f"# TYPE {full_name} histogram")
+                typed.add(full_name)
+            cumulative = 0
+            for bound, count in zip(histogram.buckets, histogram.counts):
+                cumulative += count
+                lines.append(f"{full_name}_bucket{_format_labels(labels, (('le', repr(bound)),))} {cumulative}")
+            lines.append(f"{full_name}_bucket{_format_labels(labels, (('le', '+Inf'),))} {histogram.count}")
+            lines.append(f"{full_name}_sum{_format_labels(labels)} {histogram.sum!r}")
+            lines.append(f"{full_name}_count{_format_labels(labels)} {histogram.count}")
+        
+        for (name, labels), value in counters:
+            full_name = PREFIX + name
+            if full_name not in typed:
+                lines.append(f"# TYPE {full_name} counter")
+                typed.add(full_name)
+            lines.append(f"{full_name}{_format_labels(labels)} {value!r}")
+        
+        for name, value in sorted(self._gauges().items()):
+            lines.append(f"# TYPE {PREFIX + name} gauge")
+            lines.append(f"{PREFIX + name} {float(value)!r}")
+        return "\n".join(lines) + "\n"
+    
+    def write(self, path: str):
+        """
+        Атомарная запись метрик в файл
+        
+        Args:
+            path: Путь к файлу; .json - JSON, иначе формат Prometheus
+        """
+        if path.lower().endswith(".json"):
+            snapshot = self.snapshot()
+            replace_atomically(path, lambda f: json.dump(snapshot, f, ensure_ascii=False, indent=2))
+        else:
+            text = self.to_prometheus()
+            replace_atomically(path, lambda f: f.write(text))
+    
+    def start_file_export(self, path: str, interval: float = DEFAULT_EXPORT_INTERVAL):
+        """
+        Периодическая запись метрик в файл в фоновом потоке
+        
+        Args:
+            path: Путь к файлу (см. write)
+            interval: Период записи в секундах
+        """
+        self.stop_file_export()
+        self._exporter_stop.clear()
+        
+        def export_loop():
+            while True:
+                stopped = self._exporter_stop.wait(interval)
+                try:
+                    self.write(path)
+                except OSError:
+                    pass
+                if stopped:
+                    return
+        
+        self._exporter = threading.Thread(target=export_loop, name="metrics-export", daemon=True)
+        self._exporter.start()
+    
+    def stop_file_export(self):
+        """Остановка периодической записи (с последней записью файла)"""
+        if self._exporter is not None:
+            self._exporter_stop.set()
+            self._exporter.join()
+            self._exporter = None
+
+
+def format_summary(snapshot: Dict) -> str:
+    """
+    Текстовая сводка метрик для просмотра человеком
+    
+    Args:
+        snapshot: Результат MetricsRegistry.snapshot()
+        
+    Returns:
+        Таблицы задержек (в миллисекундах), счетчиков и показателей
+    """
+    def title(item: Dict) -> str:
+        labels = ", ".join(f"{name}={value}" for name, value in item["labels"].items())
+        return f"{item['name']} ({labels})" if labels else item["name"]
+    
+    lines = [f"Сбор метрик: {'включен' if snapshot['enabled'] else 'выключен'}", ""]
+    if snapshot["histograms"]:
+        lines.append(f"{'Задержки, мс':<58} {'кол-во':>8} {'среднее':>9} {'p95':>9} {'макс':>9}")
+        for item in snapshot["histograms"]:
+            lines.append(f"{title(item):<58} {item['count']:>8} {item['mean'] * 1000:>9.3f} "
+                         f"{item['p95'] * 1000:>9.3f} {item['max'] * 1000:>9.3f}")
+        lines.append("")
+    if snapshot["counters"]:
+        lines.append("Счетчики")
+        for item in snapshot["counters"]:
+            lines.append(f"{title(item):<58} {item['value']:>12g}")
+        lines.append("")
+    if snapshot["gauges"]:
+        lines.append("Показатели")
+        for name, value in sorted(snapshot["gauges"].items()):
+            lines.append(f"{name:<58} {value:>12g}")
+    if len(lines) == 2:
+        lines.append("Нет данных")
+    return "\n".join(lines)
+
+
+# Общий реестр процесса
+metrics = MetricsRegistry(enabled=os.environ.get("PERSONAL_DATA_METRICS", "") not in ("", "0"))
+
+if os.environ.get("PERSONAL_DATA_METRICS_FILE"):
+    metrics.start_file_export(os.environ["PERSONAL_DATA_METRICS_FILE"])
@@ -0,0 +1,195 @@
+"""
+Параллельное шифрование и дешифрование больших наборов записей
+
+Ключ выводится один раз (PBKDF2) и передаётся исполнителям в готовом виде.
+Записи разбиваются на порции, результаты возвращаются в исходном порядке.
+"""
+
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import islice
+from functools import partial
+from typing import Dict, Iterable, Iterator, List, Optional, Union
+
+from encryption_module import PersonalDataEncryption, record_to_text
+
+
+# Шифратор процесса-исполнителя, создаётся инициализатором пула
+_worker_encryption: Optional[PersonalDataEncryption] = None
+
+
+def _init_worker(key: bytes, previous_keys: List[bytes] = ()):
+    """Инициализация процесса-исполнителя готовым ключом и прежними ключами для чтения"""
+    global _worker_encryption
+    _worker_encryption = PersonalDataEncryption.from_key(key)
+    for old_key in previous_keys:
+        _worker_encryption.add_decryption_key(old_key)
+
+
+def _encrypt_chunk(encryption: Optional[PersonalDataEncryption], chunk: List[dict],
+                   binary: bool = False) -> List[Union[str, bytes]]:
+    return list((encryption or _worker_encryption).encrypt_many(chunk, binary))
+
+
+def _decrypt_chunk(encryption: Optional[PersonalDataEncryption], chunk: List[str],
+                   return_errors: bool = False) -> List[Union[dict, ValueError]]:
+    decrypt = (encryption or _worker_encryption).decrypt_data
+    if not return_errors:
+        return [decrypt(item) for item in chunk]
+    
+    result = []
+    for item in chunk:
+        try:
+            result.append(decrypt(item))
+        except ValueError as e:
+            result.append(e)
+    return result
+
+
+def _reencrypt_chunk(encryption: Optional[PersonalDataEncryption], chunk: List[dict],
+                     target_key: bytes, binary: bool = False) -> List[dict]:
+    decrypt = (encryption or _worker_encryption).decrypt_data
+    # Исполнителю передается только ключ получателя, шифратор создается на порцию
+    target = PersonalDataEncryption.from_key(target_key)
+    result = []
+    for record in chunk:
+        data = decrypt(record["encrypted_data"])
+        data.pop("_encrypted_at", None)
+        blob = target.encrypt_record(data)
+        reencrypted = dict(record, encrypted_data=blob if binary else record_to_text(blob))
+        reencrypted.pop("blind_index", None)
+        # Слепые индексы зависят от ключа и строятся заново
+        blind_index = target.blind_indexes(data)
+        if blind_index:
+            reencrypted["blind_index"] = blind_index
+        result.append(reencrypted)
+    return result
+
+
+class ParallelCipher:
+    """Обёртка над PersonalDataEncryption для пакетной обработки на нескольких ядрах"""
+    
+    def __init__(self, encryption: PersonalDataEncryption, max_workers: Optional[int] = None,
+                 use_processes: bool = False, chunk_size: int = 256):
+        """
+        Инициализация пула исполнителей
+        
+        Args:
+            encryption: Шифратор с уже выведенным ключом
+            max_workers: Количество исполнителей (по умолчанию - число ядер)
+            use_processes: Использовать процессы вместо потоков. Потоков обычно
+                достаточно: cryptography освобождает GIL во время шифрования
+            chunk_size: Количество записей в одной порции
+        """
+        self.encryption = encryption
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.use_processes = use_processes
+        self.chunk_size = chunk_size
+        self.last_stats: Dict = {}
+        
+        if use_processes:
+            # Процессам передаётся только готовый ключ, пароль и PBKDF2 не нужны
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers,
+                                                 initializer=_init_worker,
+                                                 initargs=(encryption.key, encryption.previous_keys))
+        else:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                thread_name_prefix="cipher")
+    
+    def _map(self, func, items: Iterable, operation: str) -> Iterator:
+        """
+        Упорядоченная обработка порций с ограниченным числом порций в работе
+        
+        Args:
+            func: Функция обработки порции
+            items: Исходные элементы
+            operation: Название операции для статистики
+        """
+        encryption = None if self.use_processes else self.encryption
+        iterator = iter(items)
+        pending = deque()
+        max_pending = self.max_workers * 2
+        processed = 0
+        started = time.perf_counter()
+        
+        def submit_next() -> bool:
+            chunk = list(islice(iterator, self.chunk_size))
+            if not chunk:
+                return False
+            pending.append(self._executor.submit(func, encryption, chunk))
+            return True
+        
+        while len(pending) < max_pending and submit_next():
+            pass
+        
+        while pending:
+            results = pending.popleft().result()
+            submit_next()
+            processed += len(results)
+            yield from results
+        
+        elapsed = time.perf_counter() - started
+        self.last_stats = {
+            "operation": operation,
+            "records": processed,
+            "seconds": elapsed,
+            "records_per_second": processed / elapsed if elapsed > 0 else 0.0,
+            "workers": self.max_workers
+        }
+    
+    def map_encrypt(self, records: Iterable[dict], binary: bool = False) -> Iterator[Union[str, bytes]]:
+        """
+        Параллельное шифрование записей
+        
+        Args:
+            records: Итерируемый набор словарей с персональными данными
+            binary: Возвращать записи в двоичном виде
+            
+        Yields:
+            Зашифрованные записи в исходном порядке
+        """
+        return self._map(partial(_encrypt_chunk, binary=binary), records, "encrypt")
+    
+    def map_decrypt(self, encrypted_records: Iterable[Union[str, bytes]],
+                    return_errors: bool = False) -> Iterator[Union[dict, ValueError]]:
+        """
+        Параллельное дешифрование записей
+        
+        Args:
+            encrypted_records: Итерируемый набор зашифрованных записей
+            return_errors: Возвращать ValueError вместо записи, которую не удалось
+                расшифровать (иначе исключение прерывает обработку)
+            
+        Yields:
+            Словари с персональными данными (или ошибки) в исходном порядке
+        """
+        return self._map(partial(_decrypt_chunk, return_errors=return_errors), encrypted_records, "decrypt")
+    
+    def map_reencrypt(self, records: Iterable[dict], target: PersonalDataEncryption,
+                      binary: bool = False) -> Iterator[dict]:
+        """
+        Параллельное перешифрование записей базы другим ключом
+        
+        Args:
+            records: Записи базы (словари с encrypted_data)
+            target: Шифратор с ключом получателя
+            binary: Возвращать encrypted_data в двоичном виде
+            
+        Yields:
+            Копии записей в исходном порядке с данными, зашифрованными ключом
+            получателя, и слепыми индексами на его ключе
+        """
+        return self._map(partial(_reencrypt_chunk, target_key=target.key, binary=binary),
+                         records, "reencrypt")
+    
+    def close(self):
+        """Остановка пула исполнителей"""
+        self._executor.shutdown(wait=True)
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -0,0 +1,149 @@
+"""
+Кэш расшифрованных записей
+
+Расшифрованные данные хранятся в памяти процесса ограниченное время и
+в ограниченном объеме. Запись в кэше привязана к версии записи базы
+(updated_at) и к ключу, которым она была расшифрована. При вытеснении,
+сбросе и смене ключа байты данных затираются нулями.
+"""
+
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+
+class DecryptedRecordCache:
+    """LRU-кэш расшифрованных записей с ограничением по объему и времени простоя"""
+    
+    def __init__(self, max_bytes: int = 4 * 1024 * 1024, idle_ttl: float = 5 * 60):
+        """
+        Args:
+            max_bytes: Максимальный суммарный размер данных в кэше
+            idle_ttl: Время в секундах, после которого неиспользуемая запись удаляется
+        """
+        self.max_bytes = max_bytes
+        self.idle_ttl = idle_ttl
+        self._lock = threading.Lock()
+        # {id записи: (updated_at, данные в JSON, время последнего обращения)}
+        # в порядке обращений: первой идет давно не использованная запись
+        self._entries: "OrderedDict[int, list]" = OrderedDict()
+        self._bytes = 0
+        # Отпечаток ключа, которым расшифрованы записи в кэше
+        self._owner: Optional[str] = None
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "expired": 0, "invalidations": 0}
+    
+    @staticmethod
+    def _erase(payload: bytearray):
+        payload[:] = bytes(len(payload))
+    
+    def _drop(self, record_id: int):
+        _, payload, _ = self._entries.pop(record_id)
+        self._bytes -= len(payload)
+        self._erase(payload)
+    
+    def _bind(self, owner: Optional[str]):
+        """Сброс кэша, если записи расшифрованы другим ключом"""
+        if owner != self._owner:
+            self._wipe()
+            self._owner = owner
+    
+    def _expire(self, now: float):
+        while self._entries:
+            record_id, (_, _, last_access) = next(iter(self._entries.items()))
+            if now - last_access < self.idle_ttl:
+                break
+            self._drop(record_id)
+            self._stats["expired"] += 1
+    
+    def get(self, record_id: int, updated_at: str, owner: Optional[str] = None) -> Optional[Dict]:
+        """
+        Получение расшифрованной записи
+        
+        Args:
+            record_id: ID записи
+            updated_at: Версия записи в базе; устаревшая версия в кэше не возвращается
+            owner: Отпечаток ключа шифрования
+            
+        Returns:
+            Новый словарь с данными или None при промахе
+        """
+        with self._lock:
+            self._bind(owner)
+            now = time.monotonic()
+            self._expire(now)
+            
+            entry = self._entries.get(record_id)
+            if entry is None or entry[0] != updated_at:
+                if entry is not None:
+                    self._drop(record_id)
+                self._stats["misses"] += 1
+                return None
+            
+            entry[2] = now
+            self._entries.move_to_end(record_id)
+            self._stats["hits"] += 1
+            return json.loads(entry[1].decode('utf-8'))
+    
+    def put(self, record_id: int, updated_at: str, data: Dict, owner: Optional[str] = None):
+        """
+        Сохранение расшифрованной записи
+        
+        Args:
+            record_id: ID записи
+            updated_at: Версия записи в базе
+            data: Расшифрованные данные
+            owner: Отпечаток ключа шифрования
+        """
+        payload = bytearray(json.dumps(data, ensure_ascii=False).encode('utf-8'))
+        if len(payload) > self.max_bytes:
+            self._erase(payload)
+            return
+        
+        with self._lock:
+            self._bind(owner)
+            if record_id in self._entries:
+                self._drop(record_id)
+            
+            now = time.monotonic()
+            self._expire(now)
+            while self._entries and self._bytes + len(payload) > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+                self._stats["evictions"] += 1
+            
+            self._entries[record_id] = [updated_at, payload, now]
+            self._bytes += len(payload)
+    
+    def invalidate(self, record_id: int):
+        """Удаление записи из кэша (при изменении или удалении записи)"""
+        with self._lock:
+            if record_id in self._entries:
+                self._drop(record_id)
+                self._stats["invalidations"] += 1
+    
+    def _wipe(self):
+        for record_id in list(self._entries):
+            self._drop(record_id)
+    
+    def wipe(self):
+        """Удаление и затирание всех записей (при смене пароля и выходе)"""
+        with self._lock:
+            self._wipe()
+            self._owner = None
+    
+    def stats(self) -> Dict:
+        """
+        Статистика кэша
+        
+        Returns:
+            Словарь: попадания, промахи, вытеснения, число записей и объем в байтах
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._entries)
+            stats["bytes"] = self._bytes
+            stats["max_bytes"] = self.max_bytes
+            total = stats["hits"] + stats["misses"]
+            stats["hit_ratio"] = stats["hits"] / total if total else 0.0
+            return stats
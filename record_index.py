@@ -0,0 +1,356 @@
+"""
+Вторичные индексы по открытым метаданным записей
+
+Индексируются тип записи, слова описания, даты создания и изменения
+и слепые индексы (HMAC) зашифрованных полей. Зашифрованные данные
+в индекс не попадают. Индекс и счетчики статистики обновляются
+инкрементально при добавлении, изменении и удалении записей.
+"""
+
+import re
+from bisect import bisect_left, insort
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Set, Tuple, Union
+
+from record_stats import RecordStatistics
+
+
+# Поля записи, которые хранит индекс
+INDEXED_FIELDS = ("id", "type", "description", "created_at", "updated_at")
+
+_TOKEN_RE = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Разбиение текста на слова в нижнем регистре
+    
+    Args:
+        text: Описание записи или поисковый запрос
+        
+    Returns:
+        Список слов ("7А класс" -> ["7а", "класс"])
+    """
+    return _TOKEN_RE.findall(text.lower()) if text else []
+
+
+def description_matches(description: str, query: str, substring: bool = False) -> bool:
+    """
+    Проверка описания без индекса (те же правила, что и у search_description)
+    
+    Args:
+        description: Описание записи
+        query: Поисковый запрос
+        substring: Искать слова запроса в любой части слов описания
+        
+    Returns:
+        True, если каждое слово запроса найдено в описании
+    """
+    fragments = tokenize(query)
+    if not fragments:
+        return False
+    tokens = tokenize(description)
+    if substring:
+        return all(any(fragment in token for token in tokens) for fragment in fragments)
+    return all(any(token.startswith(fragment) for token in tokens) for fragment in fragments)
+
+
+def record_metadata(record: Dict) -> Dict:
+    """
+    Метаданные записи в том виде, в каком их возвращают запросы к базе
+    
+    Args:
+        record: Запись базы данных (зашифрованные данные игнорируются)
+    """
+    meta = {field: record.get(field, "") for field in INDEXED_FIELDS}
+    # Записи, созданные до появления версий, считаются версией 1
+    meta["version"] = record.get("version", 1)
+    return meta
+
+
+def _trigrams(token: str) -> Set[str]:
+    return {token[i:i + 3] for i in range(len(token) - 2)}
+
+
+def _as_iso(value: Union[str, datetime, None]) -> Optional[str]:
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def _remove_sorted(items: list, item):
+    position = bisect_left(items, item)
+    if position < len(items) and items[position] == item:
+        del items[position]
+
+
+class MetadataIndex:
+    """Индексы по типу, словам описания и датам записей"""
+    
+    def __init__(self, records: Iterable[Dict] = ()):
+        """
+        Args:
+            records: Начальный набор записей (зашифрованные данные игнорируются)
+        """
+        # {id: метаданные записи} и отсортированный список ID
+        self._meta: Dict[int, Dict] = {}
+        self._ids: List[int] = []
+        # {тип: отсортированный список ID}
+        self._by_type: Dict[str, List[int]] = {}
+        # {слово: множество ID}, отсортированный список слов для поиска по префиксу
+        # и {триграмма: множество слов} для поиска по подстроке
+        self._postings: Dict[str, Set[int]] = {}
+        self._sorted_tokens: List[str] = []
+        self._trigram_tokens: Dict[str, Set[str]] = {}
+        # Отсортированные списки (дата, ID)
+        self._created: List[Tuple[str, int]] = []
+        self._updated: List[Tuple[str, int]] = []
+        # {(поле, слепой индекс): отсортированный список ID} и {id: слепые индексы записи}
+        self._blind: Dict[Tuple[str, str], List[int]] = {}
+        self._blind_by_id: Dict[int, Dict[str, str]] = {}
+        # Счетчики по типам, классам и дням создания
+        self.statistics = RecordStatistics()
+        
+        self.rebuild(records)
+    
+    def __len__(self) -> int:
+        return len(self._meta)
+    
+    def __contains__(self, record_id: int) -> bool:
+        return record_id in self._meta
+    
+    def rebuild(self, records: Iterable[Dict]):
+        """Построение индекса заново (сортировка один раз, а не на каждую запись)"""
+        self._meta.clear()
+        self._by_type.clear()
+        self._postings.clear()
+        self._trigram_tokens.clear()
+        self._blind.clear()
+        self._blind_by_id.clear()
+        
+        for record in records:
+            meta = record_metadata(record)
+            self._meta[meta["id"]] = meta
+            self._by_type.setdefault(meta["type"], []).append(meta["id"])
+            for token in set(tokenize(meta["description"])):
+                self._postings.setdefault(token, set()).add(meta["id"])
+            blind_index = record.get("blind_index")
+            if blind_index:
+                self._blind_by_id[meta["id"]] = dict(blind_index)
+                for key in blind_index.items():
+                    self._blind.setdefault(key, []).append(meta["id"])
+        
+        for ids in self._by_type.values():
+            ids.sort()
+        for ids in self._blind.values():
+            ids.sort()
+        self._sorted_tokens = sorted(self._postings)
+        for token in self._sorted_tokens:
+            for trigram in _trigrams(token):
+                self._trigram_tokens.setdefault(trigram, set()).add(token)
+        self._ids = sorted(self._meta)
+        self._created = sorted((meta["created_at"], record_id) for record_id, meta in self._meta.items())
+        self._updated = sorted((meta["updated_at"], record_id) for record_id, meta in self._meta.items())
+        self.rebuild_statistics()
+    
+    def rebuild_statistics(self):
+        """Пересчет счетчиков статистики по проиндексированным записям"""
+        self.statistics = RecordStatistics.from_records(self._stored(record_id) for record_id in self._ids)
+    
+    def _stored(self, record_id: int) -> Dict:
+        """Открытые поля записи, которые учитывают счетчики статистики"""
+        record = dict(self._meta[record_id])
+        record["blind_index"] = self._blind_by_id.get(record_id)
+        return record
+    
+    def add(self, record: Dict):
+        """
+        Добавление записи или замена ранее проиндексированной версии
+        
+        Args:
+            record: Запись базы данных
+        """
+        record_id = record["id"]
+        if record_id in self._meta:
+            self.remove(record_id)
+        
+        meta = record_metadata(record)
+        self._meta[record_id] = meta
+        if not self._ids or self._ids[-1] < record_id:
+            self._ids.append(record_id)
+        else:
+            insort(self._ids, record_id)
+        
+        ids = self._by_type.setdefault(meta["type"], [])
+        if not ids or ids[-1] < record_id:
+            ids.append(record_id)
+        else:
+            insort(ids, record_id)
+        
+        for token in set(tokenize(meta["description"])):
+            postings = self._postings.get(token)
+            if postings is None:
+                postings = self._postings[token] = set()
+                insort(self._sorted_tokens, token)
+                for trigram in _trigrams(token):
+                    self._trigram_tokens.setdefault(trigram, set()).add(token)
+            postings.add(record_id)
+        
+        insort(self._created, (meta["created_at"], record_id))
+        insort(self._updated, (meta["updated_at"], record_id))
+        
+        blind_index = record.get("blind_index")
+        if blind_index:
+            self._blind_by_id[record_id] = dict(blind_index)
+            for key in blind_index.items():
+                insort(self._blind.setdefault(key, []), record_id)
+        self.statistics.add(record)
+    
+    def remove(self, record_id: int) -> bool:
+        """
+        Удаление записи из индекса
+        
+        Args:
+            record_id: ID записи
+            
+        Returns:
+            True, если запись была в индексе
+        """
+        if record_id not in self._meta:
+            return False
+        self.statistics.remove(self._stored(record_id))
+        meta = self._meta.pop(record_id)
+        _remove_sorted(self._ids, record_id)
+        
+        ids = self._by_type.get(meta["type"])
+        if ids is not None:
+            _remove_sorted(ids, record_id)
+            if not ids:
+                del self._by_type[meta["type"]]
+        
+        for token in set(tokenize(meta["description"])):
+            postings = self._postings.get(token)
+            if postings is None:
+                continue
+            postings.discard(record_id)
+            if not postings:
+                del self._postings[token]
+                _remove_sorted(self._sorted_tokens, token)
+                for trigram in _trigrams(token):
+                    tokens = self._trigram_tokens.get(trigram)
+                    if tokens is not None:
+                        tokens.discard(token)
+                        if not tokens:
+                            del self._trigram_tokens[trigram]
+        
+        _remove_sorted(self._created, (meta["created_at"], record_id))
+        _remove_sorted(self._updated, (meta["updated_at"], record_id))
+        
+        for key in self._blind_by_id.pop(record_id, {}).items():
+            ids = self._blind.get(key)
+            if ids is not None:
+                _remove_sorted(ids, record_id)
+                if not ids:
+                    del self._blind[key]
+        return True
+    
+    def records(self, record_ids: Iterable[int]) -> List[Dict]:
+        """
+        Метаданные записей по списку ID
+        
+        Returns:
+            Копии метаданных (без зашифрованных данных)
+        """
+        return [dict(self._meta[record_id]) for record_id in record_ids]
+    
+    def lookup(self, record_id: int) -> List[int]:
+        """[record_id], если запись есть в индексе, иначе пустой список"""
+        return [record_id] if record_id in self._meta else []
+    
+    def page(self, offset: int = 0, limit: Optional[int] = None) -> List[int]:
+        """ID записей по возрастанию, начиная с offset-го, не более limit"""
+        return self._ids[offset:None if limit is None else offset + limit]
+    
+    def find_by_type(self, record_type: str) -> List[int]:
+        """ID записей указанного типа по возрастанию"""
+        return list(self._by_type.get(record_type, ()))
+    
+    def find_by_blind_index(self, field: str, token: str) -> List[int]:
+        """ID записей, у которых слепой индекс поля равен token, по возрастанию"""
+        return list(self._blind.get((field, token), ()))
+    
+    def _tokens_with_prefix(self, prefix: str) -> List[str]:
+        start = bisect_left(self._sorted_tokens, prefix)
+        end = start
+        while end < len(self._sorted_tokens) and self._sorted_tokens[end].startswith(prefix):
+            end += 1
+        return self._sorted_tokens[start:end]
+    
+    def _tokens_containing(self, fragment: str) -> Iterable[str]:
+        if len(fragment) < 3:
+            return [token for token in self._sorted_tokens if fragment in token]
+        
+        candidates = None
+        for trigram in sorted(_trigrams(fragment), key=lambda t: len(self._trigram_tokens.get(t, ()))):
+            tokens = self._trigram_tokens.get(trigram)
+            if not tokens:
+                return []
+            candidates = set(tokens) if candidates is None else candidates & tokens
+            if not candidates:
+                return []
+        return [token for token in candidates if fragment in token]
+    
+    def search_description(self, query: str, substring: bool = False) -> List[int]:
+        """
+        Поиск записей по словам описания
+        
+        Каждое слово запроса должно совпасть с началом (или, при substring=True,
+        с частью) какого-либо слова описания.
+        
+        Args:
+            query: Поисковый запрос ("Иванов 7а")
+            substring: Искать по подстроке (индекс триграмм) вместо префикса
+            
+        Returns:
+            ID найденных записей по возрастанию
+        """
+        # Для каждого слова запроса - множества ID подходящих слов описания
+        groups = []
+        for fragment in tokenize(query):
+            tokens = self._tokens_containing(fragment) if substring else self._tokens_with_prefix(fragment)
+            if not tokens:
+                return []
+            groups.append([self._postings[token] for token in tokens])
+        if not groups:
+            return []
+        
+        # Пересечение начинается с самой маленькой группы; единственное множество не копируется
+        groups.sort(key=lambda sets: sum(len(ids) for ids in sets))
+        result: Optional[Set[int]] = None
+        for sets in groups:
+            matched = sets[0] if len(sets) == 1 else set().union(*sets)
+            result = matched if result is None else result.intersection(matched)
+            if not result:
+                return []
+        return sorted(result)
+    
+    @staticmethod
+    def _range(items: List[Tuple[str, int]], start, end) -> List[int]:
+        start, end = _as_iso(start), _as_iso(end)
+        low = bisect_left(items, (start, 0)) if start else 0
+        high = bisect_left(items, (end, 0)) if end else len(items)
+        return [record_id for _, record_id in items[low:high]]
+    
+    def range_by_created_at(self, start: Union[str, datetime, None] = None,
+                            end: Union[str, datetime, None] = None) -> List[int]:
+        """
+        ID записей, созданных в интервале [start, end), по возрастанию даты
+        
+        Args:
+            start: Начало интервала (None - без ограничения)
+            end: Конец интервала, не включается (None - без ограничения)
+        """
+        return self._range(self._created, start, end)
+    
+    def range_by_updated_at(self, start: Union[str, datetime, None] = None,
+                            end: Union[str, datetime, None] = None) -> List[int]:
+        """ID записей, измененных в интервале [start, end), по возрастанию даты"""
+        return self._range(self._updated, start, end)
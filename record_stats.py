@@ -0,0 +1,84 @@
+"""
+Счетчики статистики базы данных
+
+Счетчики изменяются при каждом добавлении, изменении и удалении записи,
+поэтому для статистики не нужно просматривать записи. Считаются общее
+количество записей, количество по типам, по классам (по слепому индексу
+поля "класс") и по дням создания.
+"""
+
+from typing import Dict, Iterable, Optional
+
+
+# Поле, по слепому индексу которого записи считаются по классам
+CLASS_FIELD = "класс"
+
+
+class RecordStatistics:
+    """Счетчики записей по типам, классам и дням создания"""
+    
+    def __init__(self, data: Optional[Dict] = None):
+        """
+        Args:
+            data: Ранее сохраненные счетчики (результат as_dict)
+        """
+        data = data or {}
+        self.total = data.get("total_records", 0)
+        self.by_type: Dict[str, int] = dict(data.get("by_type", {}))
+        # {слепой индекс класса: количество}
+        self.by_class: Dict[str, int] = dict(data.get("by_class", {}))
+        # {ГГГГ-ММ-ДД: количество}
+        self.created_per_day: Dict[str, int] = dict(data.get("created_per_day", {}))
+    
+    @classmethod
+    def from_records(cls, records: Iterable[Dict]) -> 'RecordStatistics':
+        """Подсчет по всем записям (для восстановления счетчиков)"""
+        statistics = cls()
+        for record in records:
+            statistics.add(record)
+        return statistics
+    
+    @staticmethod
+    def _change(counter: Dict[str, int], key: str, delta: int):
+        value = counter.get(key, 0) + delta
+        if value > 0:
+            counter[key] = value
+        else:
+            counter.pop(key, None)
+    
+    def _apply(self, record: Dict, delta: int):
+        self.total += delta
+        self._change(self.by_type, record.get("type", ""), delta)
+        day = (record.get("created_at") or "")[:10]
+        if day:
+            self._change(self.created_per_day, day, delta)
+        token = (record.get("blind_index") or {}).get(CLASS_FIELD)
+        if token:
+            self._change(self.by_class, token, delta)
+    
+    def add(self, record: Dict):
+        """Учет добавленной записи"""
+        self._apply(record, 1)
+    
+    def remove(self, record: Dict):
+        """Учет удаленной записи"""
+        self._apply(record, -1)
+    
+    def replace(self, old: Dict, new: Dict):
+        """Учет изменения записи (например, нового слепого индекса класса)"""
+        self._apply(old, -1)
+        self._apply(new, 1)
+    
+    def as_dict(self) -> Dict:
+        """
+        Статистика в формате get_statistics
+        
+        Returns:
+            Словарь: total_records, by_type, by_class, created_per_day
+        """
+        return {
+            "total_records": self.total,
+            "by_type": dict(self.by_type),
+            "by_class": dict(self.by_class),
+            "created_per_day": dict(sorted(self.created_per_day.items()))
+        }
@@ -0,0 +1,333 @@
+"""
+Таблица записей базы данных с виртуальной прокруткой
+
+Модель хранит только метаданные записей (без зашифрованных данных) и
+загружает их из базы страницами по мере прокрутки. В Treeview создаются
+строки лишь для видимого окна, поэтому ни отрисовка, ни занимаемая память
+не зависят от количества записей в базе.
+"""
+
+import tkinter as tk
+from tkinter import ttk
+from collections import OrderedDict
+from datetime import datetime
+from functools import lru_cache
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+
+# Поля записи, которые нужны таблице
+VIEW_FIELDS = ("id", "type", "description", "created_at", "updated_at")
+
+
+@lru_cache(maxsize=4096)
+def format_timestamp(value: str) -> str:
+    """
+    Форматирование даты для таблицы (только для видимых строк, с кэшем)
+    
+    Args:
+        value: Дата в формате ISO
+        
+    Returns:
+        Дата в формате ДД.ММ.ГГГГ ЧЧ:ММ или исходная строка
+    """
+    if not value:
+        return ""
+    try:
+        return datetime.fromisoformat(value).strftime("%d.%m.%Y %H:%M")
+    except ValueError:
+        return value
+
+
+class RecordsTableModel:
+    """
+    Метаданные записей, упорядоченные по ID
+    
+    Модель работает в одном из двух режимов: постраничная загрузка всей
+    базы (в памяти держится не более max_pages страниц) или фиксированный
+    список записей, например результаты поиска.
+    """
+    
+    def __init__(self, page_size: int = 100, max_pages: int = 20):
+        """
+        Args:
+            page_size: Количество записей в странице
+            max_pages: Сколько последних использованных страниц держать в памяти
+        """
+        self.page_size = page_size
+        self.max_pages = max_pages
+        self.total = 0
+        # {номер страницы: записи} в порядке использования
+        self._pages: "OrderedDict[int, List[Dict]]" = OrderedDict()
+        self._pending: Set[int] = set()
+        # Номер поколения: ответы на запросы до reset() или изменения записей отбрасываются
+        self.generation = 0
+        # Фиксированный список записей (None - постраничная загрузка)
+        self._rows: Optional[List[Dict]] = None
+        # Запрос страницы: load_page(номер страницы, offset, limit, поколение)
+        self.load_page: Optional[Callable[[int, int, int, int], None]] = None
+    
+    def __len__(self) -> int:
+        return len(self._rows) if self._rows is not None else self.total
+    
+    @staticmethod
+    def _strip(record: Dict) -> Dict:
+        return {field: record.get(field, "") for field in VIEW_FIELDS}
+    
+    def reset(self, total: int):
+        """Переход к постраничной загрузке базы из total записей"""
+        self._rows = None
+        self.total = total
+        self._pages.clear()
+        self._pending.clear()
+        self.generation += 1
+    
+    def set_rows(self, records: Iterable[Dict]):
+        """Показ фиксированного списка записей"""
+        self._rows = [self._strip(record) for record in records]
+        self._pages.clear()
+        self._pending.clear()
+        self.generation += 1
+    
+    def page_loaded(self, page: int, records: List[Dict], generation: int) -> bool:
+        """
+        Сохранение загруженной страницы
+        
+        Returns:
+            False, если страница запрошена до последнего reset() и отброшена
+        """
+        if generation != self.generation:
+            return False
+        self._pending.discard(page)
+        self._pages[page] = [self._strip(record) for record in records]
+        while len(self._pages) > self.max_pages:
+            self._pages.popitem(last=False)
+        return True
+    
+    def _find(self, record_id: int) -> Optional[Tuple[List[Dict], int]]:
+        """Строка с record_id среди загруженных записей: (список, позиция)"""
+        pages = [self._rows] if self._rows is not None else self._pages.values()
+        for rows in pages:
+            for index, row in enumerate(rows):
+                if row["id"] == record_id:
+                    return rows, index
+        return None
+    
+    def _invalidate_pending(self):
+        # Запрошенные страницы могли быть прочитаны до изменения: ответы
+        # отбрасываются, страницы запрашиваются заново при отрисовке
+        self._pending.clear()
+        self.generation += 1
+    
+    def insert(self, record: Dict):
+        """
+        Добавление новой записи
+        
+        Новые записи получают наибольший ID и попадают в конец таблицы:
+        запись дописывается в загруженную последнюю страницу, остальные
+        страницы не меняются.
+        """
+        if self._find(record["id"]) is not None:
+            self.update(record)
+            return
+        if self._rows is not None:
+            self._rows.append(self._strip(record))
+            return
+        
+        page, index = divmod(self.total, self.page_size)
+        self.total += 1
+        records = self._pages.get(page)
+        if records is not None and len(records) == index:
+            records.append(self._strip(record))
+        self._invalidate_pending()
+    
+    def update(self, record: Dict):
+        """Обновление записи, если она загружена"""
+        found = self._find(record["id"])
+        if found is not None:
+            rows, index = found
+            rows[index] = self._strip(record)
+    
+    def remove(self, record_id: int):
+        """
+        Удаление одной записи
+        
+        Запись вырезается из загруженной страницы, а следующие строки
+        сдвигаются на одну позицию: первая строка каждой следующей страницы
+        переходит в конец предыдущей. Страница, которую нечем дополнить
+        (следующая не загружена), отбрасывается и будет загружена заново.
+        """
+        if self._rows is not None:
+            found = self._find(record_id)
+            if found is not None:
+                del self._rows[found[1]]
+            return
+        
+        last_page = (self.total - 1) // self.page_size
+        self.total = max(0, self.total - 1)
+        # Страницы, которых касается сдвиг: с удаляемой записью или после нее
+        for page in sorted(self._pages):
+            records = self._pages[page]
+            if not records or records[-1]["id"] < record_id:
+                continue
+            if records[0]["id"] > record_id:
+                del records[0]
+            else:
+                records[:] = [row for row in records if row["id"] != record_id]
+            
+            following = self._pages.get(page + 1)
+            if following:
+                records.append(following[0])
+            elif page < last_page:
+                del self._pages[page]
+        self._invalidate_pending()
+    
+    def window(self, start: int, count: int) -> List[Optional[Dict]]:
+        """
+        Записи видимого окна
+        
+        Для еще не загруженных записей возвращается None, а их страницы
+        запрашиваются через load_page.
+        """
+        if self._rows is not None:
+            return self._rows[start:start + count]
+        
+        rows = []
+        for position in range(start, min(start + count, self.total)):
+            page, index = divmod(position, self.page_size)
+            records = self._pages.get(page)
+            if records is None:
+                if page not in self._pending and self.load_page:
+                    self._pending.add(page)
+                    self.load_page(page, page * self.page_size, self.page_size, self.generation)
+                rows.append(None)
+                continue
+            self._pages.move_to_end(page)
+            # Страница короче ожидаемой, если база изменилась после подсчета записей
+            rows.append(records[index] if index < len(records) else None)
+        return rows
+
+
+class VirtualRecordsView:
+    """Treeview, в котором отрисовываются только видимые строки модели"""
+    
+    ROW_HEIGHT = 20
+    HEADER_HEIGHT = 25
+    
+    def __init__(self, parent, columns: Tuple[str, ...], height: int = 15):
+        """
+        Args:
+            parent: Родительский контейнер
+            columns: Заголовки столбцов (ID, Тип, Описание, Создано)
+            height: Начальное количество видимых строк
+        """
+        self.model = RecordsTableModel()
+        self.visible_rows = height
+        self.top = 0
+        # {iid: значения, с которыми строка отрисована}
+        self._rendered: Dict[str, Tuple] = {}
+        
+        self.tree = ttk.Treeview(parent, columns=columns, show="headings", height=height)
+        for col in columns:
+            self.tree.heading(col, text=col)
+            self.tree.column(col, width=150)
+        
+        self.scrollbar = ttk.Scrollbar(parent, orient=tk.VERTICAL, command=self._on_scrollbar)
+        
+        self.tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        
+        self.tree.bind("<Configure>", self._on_resize)
+        self.tree.bind("<MouseWheel>", lambda e: self.scroll(-1 if e.delta > 0 else 1, "units"))
+        self.tree.bind("<Button-4>", lambda e: self.scroll(-1, "units"))
+        self.tree.bind("<Button-5>", lambda e: self.scroll(1, "units"))
+    
+    def reset(self, total: int):
+        """Постраничный показ всей базы из total записей"""
+        self.model.reset(total)
+        self.render()
+    
+    def show_rows(self, records: Iterable[Dict]):
+        """Показ фиксированного списка записей (обновляются только изменившиеся строки)"""
+        self.model.set_rows(records)
+        self.render()
+    
+    def page_loaded(self, page: int, records: List[Dict], generation: int):
+        if self.model.page_loaded(page, records, generation):
+            self.render()
+    
+    def insert(self, record: Dict):
+        self.model.insert(record)
+        self.render()
+    
+    def update(self, record: Dict):
+        self.model.update(record)
+        self.render()
+    
+    def remove(self, record_id: int):
+        self.model.remove(record_id)
+        self.render()
+    
+    def selection(self):
+        return self.tree.selection()
+    
+    def item(self, iid):
+        return self.tree.item(iid)
+    
+    def scroll(self, amount: int, what: str):
+        """Прокрутка на amount строк или страниц"""
+        step = self.visible_rows if what == "pages" else 1
+        self.top += amount * step
+        self.render()
+        return "break"
+    
+    def _on_scrollbar(self, action, value, what=None):
+        if action == "moveto":
+            self.top = int(float(value) * len(self.model))
+            self.render()
+        elif action == "scroll":
+            self.scroll(int(value), what)
+    
+    def _on_resize(self, event):
+        rows = max(1, (event.height - self.HEADER_HEIGHT) // self.ROW_HEIGHT)
+        if rows != self.visible_rows:
+            self.visible_rows = rows
+            self.render()
+    
+    def render(self):
+        """Синхронизация строк Treeview с видимым окном модели"""
+        total = len(self.model)
+        self.top = max(0, min(self.top, total - self.visible_rows))
+        rows = self.model.window(self.top, self.visible_rows)
+        
+        wanted = {}
+        for position, record in enumerate(rows, self.top):
+            if record is None:
+                # Строка, страница которой еще загружается
+                wanted[f"pending-{position}"] = ("", "", "Загрузка...", "")
+                continue
+            iid = str(record["id"])
+            wanted[iid] = (
+                record["id"],
+                record["type"],
+                record["description"],
+                format_timestamp(record["created_at"])
+            )
+        
+        for iid in list(self._rendered):
+            if iid not in wanted:
+                self.tree.delete(iid)
+                del self._rendered[iid]
+        
+        for position, (iid, values) in enumerate(wanted.items()):
+            if iid not in self._rendered:
+                self.tree.insert("", position, iid=iid, values=values)
+            else:
+                if self._rendered[iid] != values:
+                    self.tree.item(iid, values=values)
+                self.tree.move(iid, "", position)
+            self._rendered[iid] = values
+        
+        if total:
+            self.scrollbar.set(self.top / total, min(1.0, (self.top + len(rows)) / total))
+        else:
+            self.scrollbar.set(0.0, 1.0)
@@ -0,0 +1,550 @@
+"""
+Хранилище зашифрованных персональных данных на основе SQLite
+
+База работает в режиме WAL, поиск по ID, типу и датам создания и
+изменения выполняется по индексам. Счетчики статистики хранятся в таблице
+statistics и обновляются триггерами при каждом изменении записей.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Iterable, List, Dict, Optional, Sequence, Union
+
+from database_manager import BaseDatabaseManager, renumber_duplicate_ids
+from metrics import metrics
+from record_index import description_matches
+from record_stats import CLASS_FIELD, RecordStatistics
+
+
+# Поиск по id идёт по первичному ключу (B-дерево rowid), отдельный индекс не нужен
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS records (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    type TEXT NOT NULL,
+    description TEXT NOT NULL DEFAULT '',
+    encrypted_data TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL,
+    version INTEGER NOT NULL DEFAULT 1
+);
+CREATE INDEX IF NOT EXISTS idx_records_type ON records(type);
+CREATE INDEX IF NOT EXISTS idx_records_created_at ON records(created_at);
+CREATE INDEX IF NOT EXISTS idx_records_updated_at ON records(updated_at);
+CREATE TABLE IF NOT EXISTS blind_index (
+    field TEXT NOT NULL,
+    token TEXT NOT NULL,
+    record_id INTEGER NOT NULL,
+    PRIMARY KEY (field, token, record_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_blind_index_record ON blind_index(record_id);
+"""
+
+# Счетчики: kind = 'total' (key = ''), 'type', 'class' (слепой индекс класса), 'day' (ГГГГ-ММ-ДД)
+STATISTICS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS statistics (
+    kind TEXT NOT NULL,
+    key TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (kind, key)
+) WITHOUT ROWID;
+CREATE TRIGGER IF NOT EXISTS statistics_record_insert AFTER INSERT ON records BEGIN
+    INSERT INTO statistics VALUES ('total', '', 1), ('type', NEW.type, 1), ('day', substr(NEW.created_at, 1, 10), 1)
+        ON CONFLICT (kind, key) DO UPDATE SET count = count + 1;
+END;
+CREATE TRIGGER IF NOT EXISTS statistics_record_delete AFTER DELETE ON records BEGIN
+    UPDATE statistics SET count = count - 1
+        WHERE (kind, key) IN (VALUES ('total', ''), ('type', OLD.type), ('day', substr(OLD.created_at, 1, 10)));
+    DELETE FROM statistics WHERE count <= 0;
+END;
+CREATE TRIGGER IF NOT EXISTS statistics_record_update AFTER UPDATE OF type, created_at ON records BEGIN
+    UPDATE statistics SET count = count - 1
+        WHERE (kind, key) IN (VALUES ('type', OLD.type), ('day', substr(OLD.created_at, 1, 10)));
+    INSERT INTO statistics VALUES ('type', NEW.type, 1), ('day', substr(NEW.created_at, 1, 10), 1)
+        ON CONFLICT (kind, key) DO UPDATE SET count = count + 1;
+    DELETE FROM statistics WHERE count <= 0;
+END;
+CREATE TRIGGER IF NOT EXISTS statistics_class_insert AFTER INSERT ON blind_index
+WHEN NEW.field = '{field}' BEGIN
+    INSERT INTO statistics VALUES ('class', NEW.token, 1)
+        ON CONFLICT (kind, key) DO UPDATE SET count = count + 1;
+END;
+CREATE TRIGGER IF NOT EXISTS statistics_class_delete AFTER DELETE ON blind_index
+WHEN OLD.field = '{field}' BEGIN
+    UPDATE statistics SET count = count - 1 WHERE kind = 'class' AND key = OLD.token;
+    DELETE FROM statistics WHERE count <= 0;
+END;
+""".format(field=CLASS_FIELD)
+
+STATISTICS_REBUILD = """
+DELETE FROM statistics;
+INSERT INTO statistics SELECT 'total', '', COUNT(*) FROM records HAVING COUNT(*) > 0;
+INSERT INTO statistics SELECT 'type', type, COUNT(*) FROM records GROUP BY type;
+INSERT INTO statistics SELECT 'day', substr(created_at, 1, 10), COUNT(*) FROM records GROUP BY 2;
+INSERT INTO statistics SELECT 'class', token, COUNT(*) FROM blind_index
+    WHERE field = '{field}' AND record_id IN (SELECT id FROM records) GROUP BY token;
+""".format(field=CLASS_FIELD)
+
+RECORD_COLUMNS = "id, type, description, encrypted_data, created_at, updated_at, version"
+META_COLUMNS = "id, type, description, created_at, updated_at, version"
+
+
+class SqliteDatabaseManager(BaseDatabaseManager):
+    """Класс для управления базой данных зашифрованных данных в SQLite"""
+    
+    # Двоичные записи сохраняются как BLOB (столбец без жесткой типизации)
+    supports_binary = True
+    
+    def __init__(self, db_file: str = "encrypted_database.db"):
+        """
+        Инициализация менеджера базы данных
+        
+        Args:
+            db_file: Путь к файлу базы данных SQLite
+        """
+        self.db_file = db_file
+        self._lock = threading.RLock()
+        # Параметризованные запросы компилируются один раз и берутся из кэша соединения
+        self._conn = sqlite3.connect(db_file, check_same_thread=False, cached_statements=64)
+        self._conn.row_factory = sqlite3.Row
+        # Поиск по словам описания с теми же правилами, что и у индекса в памяти
+        self._conn.create_function("description_matches", 3, description_matches, deterministic=True)
+        
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(SCHEMA)
+            columns = {row["name"] for row in self._conn.execute("PRAGMA table_info(records)")}
+            if "version" not in columns:
+                # База создана до появления версий записей
+                with self._conn:
+                    self._conn.execute("ALTER TABLE records ADD COLUMN version INTEGER NOT NULL DEFAULT 1")
+            has_statistics = self._conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'statistics'"
+            ).fetchone()
+            self._conn.executescript(STATISTICS_SCHEMA)
+            if not has_statistics:
+                # База создана до появления счетчиков: они считаются один раз
+                self.rebuild_statistics()
+    
+    def add_record(self, encrypted_data: Union[str, bytes], record_type: str, description: str = "",
+                   blind_index: Optional[Dict[str, str]] = None) -> int:
+        """
+        Добавление записи в базу данных
+        
+        Args:
+            encrypted_data: Зашифрованные данные
+            record_type: Тип записи (ученик, учитель, родитель)
+            description: Описание записи
+            blind_index: Слепые индексы полей {поле: индекс}
+        """
+        now = datetime.now().isoformat()
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "INSERT INTO records (type, description, encrypted_data, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (record_type, description, encrypted_data, now, now)
+            )
+            if blind_index:
+                self._insert_blind_index(cursor.lastrowid, blind_index)
+            return cursor.lastrowid
+    
+    def _insert_blind_index(self, record_id: int, blind_index: Dict[str, str]):
+        self._conn.executemany(
+            # REPLACE удалил бы строку без триггера удаления, и счетчик класса удвоился бы
+            "INSERT OR IGNORE INTO blind_index (field, token, record_id) VALUES (?, ?, ?)",
+            ((field, token, record_id) for field, token in blind_index.items())
+        )
+    
+    def _replace_blind_index(self, record_id: int, blind_index: Dict[str, str]):
+        self._conn.execute("DELETE FROM blind_index WHERE record_id = ?", (record_id,))
+        self._insert_blind_index(record_id, blind_index)
+    
+    def _attach_blind_index(self, records: List[Dict], where: str = "", params: Sequence = ()) -> List[Dict]:
+        """Добавление слепых индексов из отдельной таблицы к записям"""
+        by_id = {record["id"]: record for record in records}
+        rows = self._conn.execute(f"SELECT record_id, field, token FROM blind_index {where}", params)
+        for record_id, field, token in rows:
+            record = by_id.get(record_id)
+            if record is not None:
+                record.setdefault("blind_index", {})[field] = token
+        return records
+    
+    def add_records(self, records: Iterable[Sequence]) -> List[int]:
+        """
+        Пакетное добавление записей в одной транзакции
+        
+        Args:
+            records: Итерируемый набор кортежей
+                (encrypted_data, record_type[, description[, blind_index]]); читается потоково
+                
+        Returns:
+            Список ID добавленных записей
+        """
+        # {позиция в пакете: слепые индексы}, ID известны только после вставки
+        blind_indexes = {}
+        
+        def rows():
+            for position, (encrypted_data, record_type, *rest) in enumerate(records):
+                description, blind_index = self._optional_fields(rest)
+                if blind_index:
+                    blind_indexes[position] = blind_index
+                now = datetime.now().isoformat()
+                yield record_type, description, encrypted_data, now, now
+        
+        with self._lock, self._conn:
+            # BEGIN IMMEDIATE закрепляет блокировку записи, поэтому выданные
+            # AUTOINCREMENT идентификаторы пакета идут подряд
+            self._conn.execute("BEGIN IMMEDIATE")
+            first_id = self._last_sequence() + 1
+            self._conn.executemany(
+                "INSERT INTO records (type, description, encrypted_data, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                rows()
+            )
+            for position, blind_index in blind_indexes.items():
+                self._insert_blind_index(first_id + position, blind_index)
+            return list(range(first_id, self._last_sequence() + 1))
+    
+    def _last_sequence(self) -> int:
+        row = self._conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'records'").fetchone()
+        return row[0] if row else 0
+    
+    def peek_next_id(self) -> int:
+        """ID, который получит следующая добавленная запись (AUTOINCREMENT не выдает ID повторно)"""
+        with self._lock:
+            return self._last_sequence() + 1
+    
+    def get_all_records(self) -> List[Dict]:
+        """
+        Получение всех записей из базы данных
+        
+        Returns:
+            Список записей (без расшифровки)
+        """
+        with self._lock:
+            rows = self._conn.execute(f"SELECT {RECORD_COLUMNS} FROM records ORDER BY id").fetchall()
+            return self._attach_blind_index([dict(row) for row in rows])
+    
+    def get_record(self, record_id: int) -> Optional[Dict]:
+        """
+        Получение конкретной записи по ID
+        
+        Args:
+            record_id: ID записи
+            
+        Returns:
+            Запись или None, если не найдена
+        """
+        with self._lock, metrics.timer("db_get_record_seconds", backend="sqlite"):
+            row = self._conn.execute(f"SELECT {RECORD_COLUMNS} FROM records WHERE id = ?",
+                                     (record_id,)).fetchone()
+            if not row:
+                return None
+            return self._attach_blind_index([dict(row)], "WHERE record_id = ?", (record_id,))[0]
+    
+    def delete_record(self, record_id: int) -> bool:
+        """
+        Удаление записи из базы данных
+        
+        Args:
+            record_id: ID записи для удаления
+            
+        Returns:
+            True, если запись удалена, False если не найдена
+        """
+        with self._lock, self._conn:
+            cursor = self._conn.execute("DELETE FROM records WHERE id = ?", (record_id,))
+            self._conn.execute("DELETE FROM blind_index WHERE record_id = ?", (record_id,))
+            self._invalidate_cached(record_id)
+            return cursor.rowcount > 0
+    
+    def update_record(self, record_id: int, encrypted_data: Union[str, bytes], description: str = "",
+                      blind_index: Optional[Dict[str, str]] = None, expected_version: Optional[int] = None):
+        """
+        Обновление записи в базе данных
+        
+        Args:
+            record_id: ID записи
+            encrypted_data: Новые зашифрованные данные
+            description: Новое описание
+            blind_index: Новые слепые индексы (None - оставить прежние)
+            expected_version: Версия записи, на основе которой сделано изменение
+                (None - обновить без проверки)
+                
+        Raises:
+            ConcurrentModificationError: Запись изменена или удалена после чтения
+        """
+        with self._lock, self._conn:
+            if expected_version is None:
+                cursor = self._conn.execute(
+                    "UPDATE records SET encrypted_data = ?, description = ?, updated_at = ?, "
+                    "version = version + 1 WHERE id = ?",
+                    (encrypted_data, description, datetime.now().isoformat(), record_id)
+                )
+            else:
+                # Проверка и изменение одним запросом: другой процесс не вклинится между ними
+                cursor = self._conn.execute(
+                    "UPDATE records SET encrypted_data = ?, description = ?, updated_at = ?, "
+                    "version = version + 1 WHERE id = ? AND version = ?",
+                    (encrypted_data, description, datetime.now().isoformat(), record_id, expected_version)
+                )
+                if not cursor.rowcount:
+                    row = self._conn.execute("SELECT version FROM records WHERE id = ?", (record_id,)).fetchone()
+                    self._check_version(record_id, row["version"] if row else None, expected_version)
+            if cursor.rowcount and blind_index is not None:
+                self._replace_blind_index(record_id, blind_index)
+            self._invalidate_cached(record_id)
+    
+    def update_records(self, updates: Iterable[Sequence]) -> int:
+        """
+        Пакетное обновление записей в одной транзакции
+        
+        Args:
+            updates: Итерируемый набор кортежей
+                (record_id, encrypted_data, description[, blind_index[, expected_version]]).
+                Запись, версия которой не совпадает с expected_version, пропускается
+                
+        Returns:
+            Количество обновленных записей
+        """
+        count = 0
+        with self._lock, self._conn:
+            for record_id, encrypted_data, description, *rest in updates:
+                blind_index = rest[0] if rest else None
+                expected_version = rest[1] if len(rest) > 1 else None
+                cursor = self._conn.execute(
+                    "UPDATE records SET encrypted_data = ?, description = ?, updated_at = ?, "
+                    "version = version + 1 WHERE id = ? AND (? IS NULL OR version = ?)",
+                    (encrypted_data, description, datetime.now().isoformat(),
+                     record_id, expected_version, expected_version)
+                )
+                if not cursor.rowcount:
+                    continue
+                self._invalidate_cached(record_id)
+                if blind_index is not None:
+                    self._replace_blind_index(record_id, blind_index)
+                count += 1
+        return count
+    
+    def _select_meta(self, where: str, params: Sequence, order: str = "id") -> List[Dict]:
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {META_COLUMNS} FROM records WHERE {where} ORDER BY {order}", params
+            ).fetchall()
+        return [dict(row) for row in rows]
+    
+    def get_metadata(self, record_id: int) -> Optional[Dict]:
+        """
+        Метаданные записи без чтения зашифрованных данных
+        
+        Args:
+            record_id: ID записи
+            
+        Returns:
+            Метаданные записи или None, если запись не найдена
+        """
+        records = self._select_meta("id = ?", (record_id,))
+        return records[0] if records else None
+    
+    def count_records(self) -> int:
+        """Количество записей в базе"""
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM records").fetchone()[0]
+    
+    def get_records_metadata(self, offset: int = 0, limit: Optional[int] = None) -> List[Dict]:
+        """
+        Метаданные записей по возрастанию ID без зашифрованных данных
+        
+        Args:
+            offset: Сколько записей пропустить
+            limit: Максимальное количество записей (None - все)
+        """
+        # LIMIT -1 в SQLite означает "без ограничения"
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {META_COLUMNS} FROM records ORDER BY id LIMIT ? OFFSET ?",
+                (-1 if limit is None else limit, offset)
+            ).fetchall()
+        return [dict(row) for row in rows]
+    
+    def find_by_type(self, record_type: str) -> List[Dict]:
+        """
+        Поиск записей по типу (индекс idx_records_type)
+        
+        Args:
+            record_type: Тип записи (ученик, учитель, родитель)
+            
+        Returns:
+            Метаданные записей (без зашифрованных данных) по возрастанию ID
+        """
+        return self._select_meta("type = ?", (record_type,))
+    
+    def search_description(self, query: str, substring: bool = False) -> List[Dict]:
+        """
+        Поиск записей по словам описания
+        
+        Просматриваются только столбцы метаданных, зашифрованные данные не читаются.
+        
+        Args:
+            query: Поисковый запрос; каждое слово должно совпасть с началом слова описания
+            substring: Искать слова запроса в любой части слов описания
+            
+        Returns:
+            Метаданные записей (без зашифрованных данных) по возрастанию ID
+        """
+        return self._select_meta("description_matches(description, ?, ?)", (query, substring))
+    
+    def find_by_blind_index(self, field: str, token: str) -> List[Dict]:
+        """
+        Поиск записей по точному значению зашифрованного поля (таблица blind_index)
+        
+        Args:
+            field: Имя поля (например, "фамилия")
+            token: Слепой индекс значения (PersonalDataEncryption.blind_index)
+            
+        Returns:
+            Метаданные записей (без зашифрованных данных) по возрастанию ID
+        """
+        return self._select_meta(
+            "id IN (SELECT record_id FROM blind_index WHERE field = ? AND token = ?)", (field, token)
+        )
+    
+    def _select_range(self, column: str, start, end) -> List[Dict]:
+        conditions, params = ["1"], []
+        if start:
+            conditions.append(f"{column} >= ?")
+            params.append(start.isoformat() if isinstance(start, datetime) else start)
+        if end:
+            conditions.append(f"{column} < ?")
+            params.append(end.isoformat() if isinstance(end, datetime) else end)
+        return self._select_meta(" AND ".join(conditions), params, f"{column}, id")
+    
+    def range_by_created_at(self, start: Union[str, datetime, None] = None,
+                            end: Union[str, datetime, None] = None) -> List[Dict]:
+        """
+        Поиск записей по дате создания (индекс idx_records_created_at)
+        
+        Args:
+            start: Начало интервала, включительно (None - без ограничения)
+            end: Конец интервала, не включается (None - без ограничения)
+            
+        Returns:
+            Метаданные записей (без зашифрованных данных) по возрастанию даты
+        """
+        return self._select_range("created_at", start, end)
+    
+    def range_by_updated_at(self, start: Union[str, datetime, None] = None,
+                            end: Union[str, datetime, None] = None) -> List[Dict]:
+        """
+        Поиск записей по дате изменения (индекс idx_records_updated_at)
+        
+        Args:
+            start: Начало интервала, включительно (None - без ограничения)
+            end: Конец интервала, не включается (None - без ограничения)
+            
+        Returns:
+            Метаданные записей (без зашифрованных данных) по возрастанию даты
+        """
+        return self._select_range("updated_at", start, end)
+    
+    def get_statistics(self) -> Dict:
+        """
+        Получение статистики по базе данных (из таблицы счетчиков)
+        
+        Returns:
+            Словарь: total_records, by_type, by_class, created_per_day
+        """
+        with self._lock:
+            rows = self._conn.execute("SELECT kind, key, count FROM statistics").fetchall()
+        
+        counters = {"total": {}, "type": {}, "class": {}, "day": {}}
+        for kind, key, count in rows:
+            counters.setdefault(kind, {})[key] = count
+        return RecordStatistics({
+            "total_records": counters["total"].get("", 0),
+            "by_type": counters["type"],
+            "by_class": counters["class"],
+            "created_per_day": counters["day"]
+        }).as_dict()
+    
+    def rebuild_statistics(self) -> Dict:
+        """
+        Пересчет таблицы счетчиков по всем записям (восстановление)
+        
+        Returns:
+            Новая статистика
+        """
+        with self._lock:
+            with self._conn:
+                for statement in STATISTICS_REBUILD.strip().split(";\n"):
+                    self._conn.execute(statement)
+            return self.get_statistics()
+    
+    def close(self):
+        """Закрытие соединения с базой данных"""
+        with self._lock:
+            self._conn.close()
+    
+    @classmethod
+    def migrate_from_json(cls, json_file: str, db_file: str = "encrypted_database.db") -> 'SqliteDatabaseManager':
+        """
+        Перенос записей из JSON-базы в SQLite
+        
+        Идентификаторы и даты записей сохраняются. Записи с повторяющимся ID
+        (старые базы могли их содержать) получают новые ID, см.
+        renumber_duplicate_ids; пары (прежний ID, новый ID) сохраняются в
+        атрибуте renumbered_ids менеджера.
+        
+        Args:
+            json_file: Путь к файлу encrypted_database.json
+            db_file: Путь к новой базе SQLite
+            
+        Returns:
+            Открытый менеджер базы SQLite
+        """
+        if os.path.exists(db_file):
+            raise ValueError(f"Файл базы уже существует: {db_file}")
+        
+        with open(json_file, 'r', encoding='utf-8') as f:
+            db = json.load(f)
+        
+        # ID уникальны до вставки: REPLACE удалил бы запись, а строку - без
+        # триггера удаления, и запись учлась бы в статистике дважды
+        records, renumbered = renumber_duplicate_ids(db["records"], db.get("last_id", 0))
+        
+        manager = cls(db_file)
+        with manager._lock, manager._conn:
+            manager._conn.executemany(
+                f"INSERT INTO records ({RECORD_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                ((r["id"], r["type"], r.get("description", ""), r["encrypted_data"],
+                  r.get("created_at", ""), r.get("updated_at", ""), r.get("version", 1))
+                 for r in records)
+            )
+            for r in records:
+                if r.get("blind_index"):
+                    manager._insert_blind_index(r["id"], r["blind_index"])
+            # ID записей, удаленных из JSON-базы, не выдаются повторно
+            if db.get("last_id", 0) > manager._last_sequence():
+                manager._conn.execute("DELETE FROM sqlite_sequence WHERE name = 'records'")
+                manager._conn.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('records', ?)",
+                                      (db["last_id"],))
+        manager.renumbered_ids = renumbered
+        return manager
+
+
+if __name__ == "__main__":
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Перенос JSON-базы в SQLite")
+    parser.add_argument("json_file", help="Исходный файл encrypted_database.json")
+    parser.add_argument("db_file", nargs="?", default="encrypted_database.db",
+                        help="Файл базы SQLite")
+    args = parser.parse_args()
+    
+    with SqliteDatabaseManager.migrate_from_json(args.json_file, args.db_file) as manager:
+        print(f"Перенесено записей: {manager.get_statistics()['total_records']}")
+        for old_id, new_id in manager.renumbered_ids:
+            print(f"  запись с повторяющимся ID {old_id} получила ID {new_id}")
@@ -0,0 +1,189 @@
+"""
+Выполнение долгих операций в фоне для графического интерфейса
+
+Функции выполняются в пуле потоков concurrent.futures, а результаты,
+ошибки и прогресс передаются обратно в поток Tk через root.after.
+"""
+
+import queue
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+
+class TaskCancelled(Exception):
+    """Операция отменена пользователем"""
+
+
+class BackgroundTask:
+    """Фоновая операция: прогресс, отмена и обратные вызовы"""
+    
+    def __init__(self, description: str, on_success: Optional[Callable] = None,
+                 on_error: Optional[Callable[[Exception], None]] = None,
+                 on_cancel: Optional[Callable[[], None]] = None):
+        self.description = description
+        self.on_success = on_success
+        self.on_error = on_error
+        self.on_cancel = on_cancel
+        self.progress: Optional[float] = None
+        self.progress_text = ""
+        self.future: Optional[Future] = None
+        self._cancel_event = threading.Event()
+        self._updates: "queue.Queue" = None
+    
+    @property
+    def cancelled(self) -> bool:
+        return self._cancel_event.is_set()
+    
+    def cancel(self):
+        """Запрос отмены: не начатая задача снимается, у начатой игнорируется результат"""
+        self._cancel_event.set()
+        if self.future:
+            self.future.cancel()
+    
+    def check_cancelled(self):
+        """Вызывается из фоновой функции в удобных точках, чтобы прервать работу"""
+        if self.cancelled:
+            raise TaskCancelled()
+    
+    def report(self, fraction: Optional[float] = None, text: str = ""):
+        """
+        Сообщение о прогрессе из фоновой функции
+        
+        Args:
+            fraction: Доля выполнения от 0 до 1 или None, если она неизвестна
+            text: Пояснение для строки состояния
+        """
+        self._updates.put((self, fraction, text))
+
+
+class BackgroundTaskRunner:
+    """Пул фоновых операций, результаты которых возвращаются в поток Tk"""
+    
+    def __init__(self, root, max_workers: int = 4, poll_interval_ms: int = 50):
+        """
+        Args:
+            root: Корневое окно Tk (используется только root.after)
+            max_workers: Количество потоков общего пула
+            poll_interval_ms: Период проверки завершенных операций
+        """
+        self.root = root
+        self.poll_interval_ms = poll_interval_ms
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="gui-task")
+        # Последовательные очереди: операции одной очереди не выполняются одновременно
+        self._lanes: Dict[str, ThreadPoolExecutor] = {}
+        self._updates: "queue.Queue" = queue.Queue()
+        self._active: List[BackgroundTask] = []
+        self._polling = False
+        # Вызывается в потоке Tk при изменении списка операций или прогресса
+        self.on_state_change: Optional[Callable[[List[BackgroundTask]], None]] = None
+    
+    def submit(self, func: Callable, *args, description: str = "",
+               on_success: Optional[Callable] = None,
+               on_error: Optional[Callable[[Exception], None]] = None,
+               on_cancel: Optional[Callable[[], None]] = None,
+               lane: Optional[str] = None) -> BackgroundTask:
+        """
+        Запуск функции в фоне
+        
+        Функция получает объект BackgroundTask первым аргументом и может
+        сообщать прогресс через task.report() и проверять task.check_cancelled().
+        
+        Args:
+            func: Фоновая функция func(task, *args)
+            description: Описание операции для строки состояния
+            on_success: Вызывается в потоке Tk с результатом функции
+            on_error: Вызывается в потоке Tk с исключением
+            on_cancel: Вызывается в потоке Tk после отмены
+            lane: Имя последовательной очереди (например, "db")
+            
+        Returns:
+            Объект фоновой операции
+        """
+        task = BackgroundTask(description, on_success, on_error, on_cancel)
+        task._updates = self._updates
+        
+        if lane:
+            if lane not in self._lanes:
+                self._lanes[lane] = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"gui-{lane}")
+            executor = self._lanes[lane]
+        else:
+            executor = self._executor
+        
+        task.future = executor.submit(self._run, task, func, args)
+        self._active.append(task)
+        self._notify()
+        self._schedule_poll()
+        return task
+    
+    @staticmethod
+    def _run(task: BackgroundTask, func: Callable, args: tuple):
+        task.check_cancelled()
+        return func(task, *args)
+    
+    def cancel_all(self):
+        """Отмена всех активных операций"""
+        for task in list(self._active):
+            task.cancel()
+    
+    @property
+    def active_tasks(self) -> List[BackgroundTask]:
+        return list(self._active)
+    
+    def _schedule_poll(self):
+        if not self._polling:
+            self._polling = True
+            self.root.after(self.poll_interval_ms, self._poll)
+    
+    def _poll(self):
+        """Обработка прогресса и завершенных операций в потоке Tk"""
+        self._polling = False
+        changed = False
+        
+        while True:
+            try:
+                task, fraction, text = self._updates.get_nowait()
+            except queue.Empty:
+                break
+            task.progress, task.progress_text = fraction, text
+            changed = True
+        
+        # Отмененная задача, которая еще выполняется (например, сетевой запрос),
+        # снимается сразу: ее результат будет проигнорирован
+        for task in [t for t in self._active if t.future.done() or t.cancelled]:
+            self._active.remove(task)
+            changed = True
+            self._dispatch(task)
+        
+        if changed:
+            self._notify()
+        if self._active:
+            self._schedule_poll()
+    
+    @staticmethod
+    def _dispatch(task: BackgroundTask):
+        if task.cancelled or task.future.cancelled():
+            if task.on_cancel:
+                task.on_cancel()
+            return
+        
+        error = task.future.exception()
+        if isinstance(error, TaskCancelled):
+            if task.on_cancel:
+                task.on_cancel()
+        elif error is not None:
+            if task.on_error:
+                task.on_error(error)
+        elif task.on_success:
+            task.on_success(task.future.result())
+    
+    def _notify(self):
+        if self.on_state_change:
+            self.on_state_change(self.active_tasks)
+    
+    def shutdown(self):
+        """Остановка пулов без ожидания активных операций"""
+        self.cancel_all()
+        self._executor.shutdown(wait=False)
+        for executor in self._lanes.values():
+            executor.shutdown(wait=False)
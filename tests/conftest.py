@@ -0,0 +1,6 @@
+"""Модули проекта лежат в корне репозитория: корень добавляется в путь импорта"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
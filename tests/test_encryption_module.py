@@ -0,0 +1,117 @@
+"""Шифрование записей всех поддерживаемых форматов и файлов порциями"""
+
+import base64
+import json
+import os
+
+import pytest
+
+from encryption_module import (RECORD_FORMAT_V2, RECORD_NONCE_SIZE, PersonalDataEncryption,
+                               record_key_id, record_to_text)
+
+
+ITERATIONS = 1000
+DATA = {"фамилия": "Иванов", "имя": "Иван", "отчество": "Иванович", "класс": "7А"}
+
+
+@pytest.fixture
+def encryption():
+    return PersonalDataEncryption("пароль", iterations=ITERATIONS)
+
+
+def legacy_record(encryption, data):
+    """Запись первой версии программы: base64 от токена Fernet"""
+    token = encryption.cipher.encrypt(json.dumps(data, ensure_ascii=False).encode("utf-8"))
+    return base64.b64encode(token).decode("ascii")
+
+
+def v2_record(encryption, data):
+    """Компактная запись версии 2: без идентификатора ключа, AAD - байт версии"""
+    header = bytes([RECORD_FORMAT_V2])
+    nonce = os.urandom(RECORD_NONCE_SIZE)
+    payload = json.dumps(data, ensure_ascii=False).encode("utf-8")
+    return header + nonce + encryption.record_cipher.encrypt(nonce, payload, header)
+
+
+def test_v3_text_and_binary_round_trip(encryption):
+    text = encryption.encrypt_data(DATA)
+    blob = encryption.encrypt_record(DATA)
+    
+    assert text.startswith("v3:")
+    assert encryption.decrypt_data(text) == DATA
+    assert encryption.decrypt_data(blob) == DATA
+    assert record_key_id(text) == record_key_id(blob) == encryption.key_fingerprint
+
+
+@pytest.mark.parametrize("position", [0, 1, 8])
+def test_v3_header_is_authenticated(encryption, position):
+    blob = bytearray(encryption.encrypt_record(DATA))
+    # Версия и идентификатор ключа входят в AAD: подмена заголовка не проходит проверку
+    blob[position] ^= 0x01
+    
+    with pytest.raises(ValueError):
+        encryption.decrypt_data(bytes(blob))
+
+
+def test_v3_ciphertext_is_authenticated(encryption):
+    blob = bytearray(encryption.encrypt_record(DATA))
+    blob[-1] ^= 0x01
+    
+    with pytest.raises(ValueError):
+        encryption.decrypt_data(bytes(blob))
+
+
+def test_v2_record_is_readable(encryption):
+    blob = v2_record(encryption, DATA)
+    
+    assert encryption.decrypt_data(blob) == DATA
+    assert encryption.decrypt_data(record_to_text(blob)) == DATA
+    assert record_key_id(blob) is None
+
+
+def test_legacy_fernet_record_is_readable(encryption):
+    assert encryption.decrypt_data(legacy_record(encryption, DATA)) == DATA
+
+
+@pytest.mark.parametrize("make_record", [legacy_record, v2_record,
+                                         lambda encryption, data: encryption.encrypt_data(data)])
+def test_records_of_previous_key_are_readable(encryption, make_record):
+    record = make_record(encryption, DATA)
+    new = PersonalDataEncryption("новый пароль", iterations=ITERATIONS)
+    
+    with pytest.raises(ValueError):
+        new.decrypt_data(record)
+    new.add_decryption_key(encryption.key)
+    assert new.decrypt_data(record) == DATA
+
+
+def test_wrong_password_is_rejected(encryption):
+    record = encryption.encrypt_data(DATA)
+    
+    with pytest.raises(ValueError):
+        PersonalDataEncryption("другой пароль", iterations=ITERATIONS).decrypt_data(record)
+
+
+@pytest.mark.parametrize("size", [0, 1, 4096, 4097, 3 * 4096])
+def test_file_round_trip_in_chunks(encryption, tmp_path, size):
+    source = tmp_path / "source.bin"
+    source.write_bytes(os.urandom(size))
+    
+    encryption.encrypt_file(str(source), str(tmp_path / "data.enc"), chunk_size=4096)
+    encryption.decrypt_file(str(tmp_path / "data.enc"), str(tmp_path / "result.bin"))
+    
+    assert (tmp_path / "result.bin").read_bytes() == source.read_bytes()
+
+
+def test_truncated_file_is_rejected(encryption, tmp_path):
+    source = tmp_path / "source.bin"
+    source.write_bytes(os.urandom(3 * 4096))
+    encrypted = tmp_path / "data.enc"
+    encryption.encrypt_file(str(source), str(encrypted), chunk_size=4096)
+    # Последняя порция отмечена в AAD: файл без нее не расшифровывается
+    data = encrypted.read_bytes()
+    encrypted.write_bytes(data[:len(data) - (4096 + RECORD_NONCE_SIZE + 16)])
+    
+    with pytest.raises(ValueError):
+        encryption.decrypt_file(str(encrypted), str(tmp_path / "result.bin"))
+    assert not (tmp_path / "result.bin").exists()
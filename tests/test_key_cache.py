@@ -0,0 +1,53 @@
+"""Время жизни ключей в KeyDerivationCache"""
+
+import encryption_module
+from encryption_module import KeyDerivationCache
+
+
+ITERATIONS = 1000
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+    
+    def __call__(self):
+        return self.now
+
+
+def test_expired_keys_are_swept_on_any_lookup(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(encryption_module.time, "monotonic", clock)
+    cache = KeyDerivationCache(ttl_seconds=60)
+    
+    cache.derive(b"first", iterations=ITERATIONS)
+    buffer = next(iter(cache._entries.values()))[0]
+    clock.now += 61
+    # Запрос другого пароля стирает просроченный ключ первого
+    cache.derive(b"second", iterations=ITERATIONS)
+    
+    assert len(cache) == 1
+    assert buffer == bytearray(len(buffer))
+
+
+def test_purge_expired_keeps_live_keys(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(encryption_module.time, "monotonic", clock)
+    cache = KeyDerivationCache(ttl_seconds=60)
+    
+    cache.derive(b"old", iterations=ITERATIONS)
+    clock.now += 30
+    key = cache.derive(b"new", iterations=ITERATIONS)
+    clock.now += 31
+    
+    assert cache.purge_expired() == 1
+    assert len(cache) == 1
+    assert cache.derive(b"new", iterations=ITERATIONS) == key
+
+
+def test_cached_key_matches_fresh_derivation():
+    cache = KeyDerivationCache()
+    key = cache.derive(b"secret", iterations=ITERATIONS)
+    
+    assert cache.derive(b"secret", iterations=ITERATIONS) == key
+    assert KeyDerivationCache().derive(b"secret", iterations=ITERATIONS) == key
@@ -0,0 +1,60 @@
+"""Файл ключей базы: смена пароля и открытие базы по паролю"""
+
+import pytest
+
+from encryption_module import PersonalDataEncryption
+from key_rotation import Keyring
+
+
+ITERATIONS = 1000
+DATA = {"фамилия": "Петров", "имя": "Петр"}
+
+
+def test_database_without_keyring_uses_default_key(tmp_path):
+    keyring = Keyring.for_database(str(tmp_path / "db.json"))
+    
+    assert not keyring.rotating
+    assert keyring.unlock("старый").key == PersonalDataEncryption("старый").key
+
+
+def test_rotation_keeps_old_records_readable_until_finished(tmp_path):
+    db_path = str(tmp_path / "db.json")
+    keyring = Keyring.for_database(db_path)
+    old = keyring.unlock("старый")
+    old_record = old.encrypt_data(DATA)
+    
+    new = keyring.begin_rotation(old, "новый", iterations=ITERATIONS)
+    assert new.key != old.key
+    assert keyring.rotating
+    
+    # Файл ключей перечитывается: прежний ключ доступен по новому паролю
+    unlocked = Keyring.for_database(db_path).unlock("новый")
+    assert unlocked.key == new.key
+    assert unlocked.decrypt_data(old_record) == DATA
+    new_record = unlocked.encrypt_data(DATA)
+    
+    with pytest.raises(ValueError, match="Неверный пароль"):
+        Keyring.for_database(db_path).unlock("старый")
+    
+    keyring.finish_rotation()
+    finished = Keyring.for_database(db_path)
+    assert not finished.rotating
+    unlocked = finished.unlock("новый")
+    assert unlocked.decrypt_data(new_record) == DATA
+    with pytest.raises(ValueError):
+        unlocked.decrypt_data(old_record)
+
+
+def test_second_rotation_before_finish_keeps_all_keys(tmp_path):
+    db_path = str(tmp_path / "db.json")
+    keyring = Keyring.for_database(db_path)
+    first = keyring.unlock("первый")
+    first_record = first.encrypt_data(DATA)
+    
+    second = keyring.begin_rotation(first, "второй", iterations=ITERATIONS)
+    second_record = second.encrypt_data(DATA)
+    keyring.begin_rotation(second, "третий", iterations=ITERATIONS)
+    
+    third = Keyring.for_database(db_path).unlock("третий")
+    assert third.decrypt_data(first_record) == DATA
+    assert third.decrypt_data(second_record) == DATA
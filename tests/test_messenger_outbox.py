@@ -0,0 +1,53 @@
+"""Журнал очереди сообщений: доставка и перезапись во время работы"""
+
+import time
+
+from messenger_outbox import MessageOutbox
+
+
+def _lines(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return f.read().splitlines()
+
+
+def test_log_is_compacted_while_running(tmp_path):
+    path = str(tmp_path / "outbox.jsonl")
+    outbox = MessageOutbox(path, lambda entry: True, fsync_interval=0.01, compact_after=10)
+    for number in range(95):
+        outbox.enqueue(f"сообщение {number}")
+    assert outbox.wait_empty(10)
+    outbox.close()
+    
+    # Без перезаписи журнал содержал бы 95 put и 95 ack
+    assert len(_lines(path)) < 2 * 10
+    assert outbox.metrics()["delivered"] == 95
+
+
+def test_undelivered_messages_survive_compaction(tmp_path):
+    path = str(tmp_path / "outbox.jsonl")
+    sent = []
+    
+    def send(entry):
+        # Первые 12 сообщений доставляются, затем API недоступен
+        if len(sent) == 12:
+            raise ConnectionError("API недоступен")
+        sent.append(entry["message"])
+        return True
+    
+    outbox = MessageOutbox(path, send, fsync_interval=0.01, retry_base=0.01, retry_max=0.02,
+                           compact_after=5)
+    messages = [f"сообщение {number}" for number in range(20)]
+    for message in messages:
+        outbox.enqueue(message)
+    deadline = time.monotonic() + 5
+    while outbox.metrics()["delivered"] < 12 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    outbox.close()
+    assert sent == messages[:12]
+    
+    delivered = []
+    reopened = MessageOutbox(path, lambda entry: delivered.append(entry["message"]) or True,
+                             fsync_interval=0.01)
+    assert reopened.wait_empty(5)
+    reopened.close()
+    assert delivered == messages[12:]
@@ -0,0 +1,83 @@
+"""Перенос JSON-базы в журнальное хранилище и SQLite"""
+
+import json
+
+import pytest
+
+from database_manager import DatabaseManager, renumber_duplicate_ids
+from log_database import LogDatabaseManager
+from sqlite_database import SqliteDatabaseManager
+
+
+# Старые версии выдавали ID по количеству записей: после удаления
+# две записи разных людей получили ID 1
+RECORDS = [
+    {"id": 1, "type": "ученик", "description": "A", "encrypted_data": "a",
+     "created_at": "2024-01-01T10:00:00", "updated_at": "2024-01-01T10:00:00",
+     "blind_index": {"класс": "класс-a"}},
+    {"id": 2, "type": "учитель", "description": "C", "encrypted_data": "c",
+     "created_at": "2024-01-02T10:00:00", "updated_at": "2024-01-02T10:00:00"},
+    {"id": 1, "type": "ученик", "description": "B", "encrypted_data": "b",
+     "created_at": "2024-01-03T10:00:00", "updated_at": "2024-01-03T10:00:00",
+     "blind_index": {"класс": "класс-b"}},
+]
+
+
+@pytest.fixture
+def json_file(tmp_path):
+    path = tmp_path / "encrypted_database.json"
+    path.write_text(json.dumps({"records": RECORDS, "last_id": 4}, ensure_ascii=False), encoding="utf-8")
+    return str(path)
+
+
+def test_renumber_keeps_first_copy_and_skips_last_id():
+    records, renumbered = renumber_duplicate_ids(RECORDS, last_id=4)
+    
+    assert [(r["id"], r["description"]) for r in records] == [(1, "A"), (2, "C"), (5, "B")]
+    assert renumbered == [(1, 5)]
+    assert RECORDS[2]["id"] == 1
+
+
+@pytest.mark.parametrize("manager_class, target", [
+    (SqliteDatabaseManager, "encrypted_database.db"),
+    (LogDatabaseManager, "encrypted_database.log"),
+])
+def test_migration_keeps_duplicate_records(json_file, tmp_path, manager_class, target):
+    manager = manager_class.migrate_from_json(json_file, str(tmp_path / target))
+    try:
+        records = {r["id"]: r for r in manager.get_all_records()}
+        assert {record_id: r["description"] for record_id, r in records.items()} == {1: "A", 2: "C", 5: "B"}
+        assert records[5]["encrypted_data"] in ("b", b"b")
+        assert records[5]["created_at"] == "2024-01-03T10:00:00"
+        assert manager.renumbered_ids == [(1, 5)]
+        
+        # Первая копия совпадает с той, что возвращает JSON-база
+        assert manager.get_record(1)["description"] == DatabaseManager(json_file).get_record(1)["description"]
+        
+        statistics = manager.get_statistics()
+        assert statistics["total_records"] == 3
+        assert statistics["by_type"] == {"ученик": 2, "учитель": 1}
+        assert statistics == manager.rebuild_statistics()
+        
+        assert manager.find_by_blind_index("класс", "класс-b")[0]["id"] == 5
+        assert manager.add_record("d", "родитель") == 6
+    finally:
+        manager.close()
+
+
+@pytest.mark.parametrize("manager_class, target", [
+    (SqliteDatabaseManager, "encrypted_database.db"),
+    (LogDatabaseManager, "encrypted_database.log"),
+])
+def test_migration_without_duplicates_keeps_ids(tmp_path, manager_class, target):
+    path = tmp_path / "encrypted_database.json"
+    path.write_text(json.dumps({"records": RECORDS[:2], "last_id": 7}), encoding="utf-8")
+    
+    manager = manager_class.migrate_from_json(str(path), str(tmp_path / target))
+    try:
+        assert sorted(r["id"] for r in manager.get_all_records()) == [1, 2]
+        assert manager.renumbered_ids == []
+        # ID удаленных записей не выдаются повторно
+        assert manager.add_record("d", "родитель") == 8
+    finally:
+        manager.close()
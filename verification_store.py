@@ -0,0 +1,337 @@
+"""
+Хранилища кодов подтверждения
+
+Код подтверждения привязан к операции, ID записи и случайному nonce,
+поэтому одновременные операции не перезаписывают коды друг друга, а
+действующие коды одной операции не совпадают. Истекшие коды удаляются
+из начала очереди по времени истечения (куча в памяти, индекс по
+expires_at в SQLite) при каждом обращении, без просмотра всех кодов.
+
+Число неудачных проверок и выданных кодов ограничивается для каждого
+субъекта (пользователя или процесса) в скользящем окне.
+
+MemoryCodeStore работает в пределах одного процесса, SqliteCodeStore -
+общий файл для нескольких копий программы и фоновых процессов.
+"""
+
+import heapq
+import secrets
+import sqlite3
+import string
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, List, Optional, Tuple
+
+
+CODE_LENGTH = 6
+DEFAULT_TTL = 10 * 60
+DEFAULT_PRINCIPAL = "local"
+
+# Ограничения на субъекта: не более MAX_FAILURES неудачных проверок и
+# MAX_ISSUED выданных кодов за RATE_WINDOW секунд
+RATE_WINDOW = 5 * 60
+MAX_FAILURES = 5
+MAX_ISSUED = 20
+# Неудачных попыток на один код, после которых он аннулируется
+MAX_ATTEMPTS = 5
+
+
+def generate_code(length: int = CODE_LENGTH) -> str:
+    """Случайный цифровой код"""
+    return ''.join(secrets.choice(string.digits) for _ in range(length))
+
+
+class RateLimitError(Exception):
+    """Превышено число попыток или выданных кодов для субъекта"""
+
+
+class MemoryCodeStore:
+    """Коды подтверждения в памяти процесса"""
+    
+    def __init__(self, clock: Callable[[], float] = time.time):
+        """
+        Args:
+            clock: Источник текущего времени в секундах
+        """
+        self._clock = clock
+        self._lock = threading.Lock()
+        # {(операция, nonce): данные кода, включая ID записи}
+        self._entries: Dict[Tuple[str, str], Dict] = {}
+        # {(операция, код): (операция, nonce)} - поиск по введенному коду за O(1)
+        self._by_code: Dict[Tuple[str, str], Tuple[str, str]] = {}
+        # Куча (время истечения, ключ); проверенные коды удаляются из нее лениво
+        self._expiry: List[Tuple[float, Tuple]] = []
+        # {субъект: очереди времен неудачных проверок и выданных кодов}
+        self._failures: Dict[str, deque] = {}
+        self._issued: Dict[str, deque] = {}
+    
+    @staticmethod
+    def _within_limit(events: Dict[str, deque], principal: str, now: float, limit: int) -> bool:
+        window = events.setdefault(principal, deque())
+        while window and window[0] <= now - RATE_WINDOW:
+            window.popleft()
+        if not window:
+            # Пустые окна не копятся для каждого субъекта
+            del events[principal]
+            return True
+        return len(window) < limit
+    
+    def _remove(self, key: Tuple):
+        entry = self._entries.pop(key)
+        self._by_code.pop((key[0], entry["code"]), None)
+    
+    def _purge(self, now: float) -> int:
+        removed = 0
+        while self._expiry and self._expiry[0][0] <= now:
+            expires_at, key = heapq.heappop(self._expiry)
+            entry = self._entries.get(key)
+            if entry is not None and entry["expires_at"] == expires_at:
+                self._remove(key)
+                removed += 1
+        return removed
+    
+    def issue(self, operation: str, record_id: Optional[int], ttl: float,
+              principal: str = DEFAULT_PRINCIPAL) -> Dict:
+        """
+        Выдача нового кода
+        
+        Returns:
+            Словарь: code, nonce, expires_at
+            
+        Raises:
+            RateLimitError: Субъект запросил слишком много кодов
+        """
+        with self._lock:
+            now = self._clock()
+            self._purge(now)
+            if not self._within_limit(self._issued, principal, now, MAX_ISSUED):
+                raise RateLimitError("Слишком много запросов кода, повторите позже")
+            
+            code = generate_code()
+            # Код не должен совпасть с действующим кодом той же операции
+            while (operation, code) in self._by_code:
+                code = generate_code()
+            key = (operation, secrets.token_hex(8))
+            expires_at = now + ttl
+            self._entries[key] = {"code": code, "record_id": record_id, "principal": principal,
+                                  "expires_at": expires_at, "attempts": 0}
+            self._by_code[(operation, code)] = key
+            heapq.heappush(self._expiry, (expires_at, key))
+            self._issued.setdefault(principal, deque()).append(now)
+            return {"code": code, "nonce": key[1], "expires_at": expires_at}
+    
+    def verify(self, code: str, operation: str, record_id: Optional[int] = None,
+               nonce: Optional[str] = None, principal: str = DEFAULT_PRINCIPAL) -> Tuple[bool, str]:
+        """
+        Проверка и погашение кода
+        
+        Args:
+            code: Введенный код
+            operation: Ожидаемая операция
+            record_id: ID записи (проверяется, если указан)
+            nonce: Идентификатор выданного кода; без него код ищется среди
+                всех действующих кодов операции
+            principal: Субъект для ограничения числа попыток
+            
+        Returns:
+            Кортеж (валидность, сообщение)
+        """
+        with self._lock:
+            now = self._clock()
+            self._purge(now)
+            if not self._within_limit(self._failures, principal, now, MAX_FAILURES):
+                return False, "Слишком много неверных попыток, повторите позже"
+            
+            key = (operation, nonce) if nonce is not None else self._by_code.get((operation, code))
+            entry = self._entries.get(key) if key is not None else None
+            if entry is None:
+                self._failures.setdefault(principal, deque()).append(now)
+                return False, "Код не найден или истек"
+            
+            wrong_record = record_id is not None and entry["record_id"] != record_id
+            if wrong_record or not secrets.compare_digest(entry["code"], code):
+                self._failures.setdefault(principal, deque()).append(now)
+                entry["attempts"] += 1
+                if entry["attempts"] >= MAX_ATTEMPTS:
+                    self._remove(key)
+                    return False, "Превышено число попыток, запросите новый код"
+                return False, "Неверный код"
+            
+            self._remove(key)
+            return True, "Код подтвержден"
+    
+    def purge_expired(self) -> int:
+        """Удаление истекших кодов; возвращает их количество"""
+        with self._lock:
+            return self._purge(self._clock())
+    
+    def active(self) -> Dict[str, Dict]:
+        """Действующие коды: {код: {operation, record_id, nonce, expires_at}}"""
+        with self._lock:
+            self._purge(self._clock())
+            return {entry["code"]: {"operation": key[0], "record_id": entry["record_id"], "nonce": key[1],
+                                    "expires_at": entry["expires_at"]}
+                    for key, entry in self._entries.items()}
+    
+    def close(self):
+        pass
+
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS verification_codes (
+    operation TEXT NOT NULL,
+    nonce TEXT NOT NULL,
+    record_id INTEGER,
+    code TEXT NOT NULL,
+    principal TEXT NOT NULL,
+    expires_at REAL NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (operation, nonce)
+);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_verification_codes_code ON verification_codes(operation, code);
+CREATE INDEX IF NOT EXISTS idx_verification_codes_expires ON verification_codes(expires_at);
+CREATE TABLE IF NOT EXISTS verification_events (
+    principal TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_verification_events ON verification_events(principal, kind, at);
+"""
+
+
+class SqliteCodeStore:
+    """
+    Коды подтверждения в общем файле SQLite
+    
+    Код, выданный одним процессом, может проверить другой; погашение
+    выполняется в транзакции, поэтому код срабатывает только один раз.
+    """
+    
+    def __init__(self, path: str, clock: Callable[[], float] = time.time):
+        """
+        Args:
+            path: Путь к файлу SQLite
+            clock: Источник текущего времени в секундах (общий для процессов)
+        """
+        self.path = path
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=10, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(SQLITE_SCHEMA)
+    
+    def _transaction(self):
+        # BEGIN IMMEDIATE сразу берет блокировку записи: проверка и погашение кода атомарны
+        self._conn.execute("BEGIN IMMEDIATE")
+    
+    def _purge(self, now: float) -> int:
+        cursor = self._conn.execute("DELETE FROM verification_codes WHERE expires_at <= ?", (now,))
+        self._conn.execute("DELETE FROM verification_events WHERE at <= ?", (now - RATE_WINDOW,))
+        return cursor.rowcount
+    
+    def _within_limit(self, principal: str, kind: str, now: float, limit: int) -> bool:
+        row = self._conn.execute(
+            "SELECT COUNT(*) FROM verification_events WHERE principal = ? AND kind = ? AND at > ?",
+            (principal, kind, now - RATE_WINDOW)
+        ).fetchone()
+        return row[0] < limit
+    
+    def _event(self, principal: str, kind: str, now: float):
+        self._conn.execute("INSERT INTO verification_events VALUES (?, ?, ?)", (principal, kind, now))
+    
+    def _run(self, func):
+        with self._lock:
+            self._transaction()
+            try:
+                result = func(self._clock())
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+            return result
+    
+    def issue(self, operation: str, record_id: Optional[int], ttl: float,
+              principal: str = DEFAULT_PRINCIPAL) -> Dict:
+        """Выдача нового кода (см. MemoryCodeStore.issue)"""
+        def issue(now):
+            self._purge(now)
+            if not self._within_limit(principal, "issued", now, MAX_ISSUED):
+                raise RateLimitError("Слишком много запросов кода, повторите позже")
+            nonce = secrets.token_hex(8)
+            while True:
+                code = generate_code()
+                try:
+                    self._conn.execute(
+                        "INSERT INTO verification_codes (operation, nonce, record_id, code, principal, expires_at) "
+                        "VALUES (?, ?, ?, ?, ?, ?)",
+                        (operation, nonce, record_id, code, principal, now + ttl)
+                    )
+                    break
+                except sqlite3.IntegrityError:
+                    # Совпадение с действующим кодом той же операции
+                    continue
+            self._event(principal, "issued", now)
+            return {"code": code, "nonce": nonce, "expires_at": now + ttl}
+        
+        return self._run(issue)
+    
+    def verify(self, code: str, operation: str, record_id: Optional[int] = None,
+               nonce: Optional[str] = None, principal: str = DEFAULT_PRINCIPAL) -> Tuple[bool, str]:
+        """Проверка и погашение кода (см. MemoryCodeStore.verify)"""
+        def verify(now):
+            self._purge(now)
+            if not self._within_limit(principal, "failure", now, MAX_FAILURES):
+                return False, "Слишком много неверных попыток, повторите позже"
+            
+            if nonce is not None:
+                row = self._conn.execute(
+                    "SELECT * FROM verification_codes WHERE operation = ? AND nonce = ?", (operation, nonce)
+                ).fetchone()
+            else:
+                row = self._conn.execute(
+                    "SELECT * FROM verification_codes WHERE operation = ? AND code = ?", (operation, code)
+                ).fetchone()
+            
+            if row is None:
+                self._event(principal, "failure", now)
+                return False, "Код не найден или истек"
+            
+            wrong_record = record_id is not None and row["record_id"] != record_id
+            if wrong_record or not secrets.compare_digest(row["code"], code):
+                self._event(principal, "failure", now)
+                if row["attempts"] + 1 >= MAX_ATTEMPTS:
+                    self._conn.execute("DELETE FROM verification_codes WHERE operation = ? AND nonce = ?",
+                                       (operation, row["nonce"]))
+                    return False, "Превышено число попыток, запросите новый код"
+                self._conn.execute("UPDATE verification_codes SET attempts = attempts + 1 "
+                                   "WHERE operation = ? AND nonce = ?", (operation, row["nonce"]))
+                return False, "Неверный код"
+            
+            self._conn.execute("DELETE FROM verification_codes WHERE operation = ? AND nonce = ?",
+                               (operation, row["nonce"]))
+            return True, "Код подтвержден"
+        
+        return self._run(verify)
+    
+    def purge_expired(self) -> int:
+        """Удаление истекших кодов; возвращает их количество"""
+        return self._run(self._purge)
+    
+    def active(self) -> Dict[str, Dict]:
+        """Действующие коды: {код: {operation, record_id, nonce, expires_at}}"""
+        def active(now):
+            self._purge(now)
+            rows = self._conn.execute("SELECT * FROM verification_codes").fetchall()
+            return {row["code"]: {"operation": row["operation"], "record_id": row["record_id"],
+                                  "nonce": row["nonce"], "expires_at": row["expires_at"]}
+                    for row in rows}
+        
+        return self._run(active)
+    
+    def close(self):
+        """Закрытие соединения"""
+        with self._lock:
+            self._conn.close()